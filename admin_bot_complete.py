@@ -7,7 +7,6 @@ Full admin interface with all functionality moved from main bot
 import os
 import asyncio
 import logging
-import sqlite3
 import psutil
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
@@ -16,6 +15,10 @@ from telegram.ext import (
     Application, CommandHandler, MessageHandler, CallbackQueryHandler,
     ContextTypes, filters
 )
+from modules.database import DatabaseManager
+from modules.performance import PerformanceManager
+from modules.analytics import AnalyticsManager
+from modules.export import DataExporter, EXPORT_TABLES, EXPORT_FORMATS
 
 # Load environment variables
 load_dotenv()
@@ -37,12 +40,19 @@ class CompleteAdminBot:
         if not self.token:
             raise ValueError("ADMIN_BOT_TOKEN not found in environment variables")
         
+        # Shared database layer; queries run on its executor threads, off the event loop.
+        # Its schema migrations also create the admin_actions/admin_logs tables.
+        self.db_manager = DatabaseManager(self.db_path)
+        self.performance = PerformanceManager(self.db_manager)
+        # Decaying counters and recent-action rings; checkpointed to analytics_counters
+        self.analytics = AnalyticsManager(self.db_manager)
+        # The memory watchdog trims the analytics rings and counters near the dyno cap
+        self.performance.register_analytics(self.analytics)
+        self.exporter = DataExporter(self.db_manager)
+        
         self.application = Application.builder().token(self.token).build()
         self._setup_handlers()
         
-        # Initialize admin database
-        self._init_admin_database()
-        
         # Admin configuration (moved from main bot)
         self.admin_config = {
             'telegram_username': '@dapavl',
@@ -59,61 +69,16 @@ class CompleteAdminBot:
             }
         }
     
-    def _init_admin_database(self):
-        """Initialize admin database for tracking admin actions"""
-        try:
-            import sqlite3
-            conn = sqlite3.connect(self.db_path, timeout=30.0)
-            cursor = conn.cursor()
-            
-            # Create admin actions table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS admin_actions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    admin_user_id INTEGER NOT NULL,
-                    action_type TEXT NOT NULL,
-                    target_user_id INTEGER,
-                    action_data TEXT,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    status TEXT DEFAULT 'completed'
-                )
-            ''')
-            
-            # Create admin logs table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS admin_logs (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    admin_user_id INTEGER NOT NULL,
-                    log_level TEXT NOT NULL,
-                    message TEXT NOT NULL,
-                    context TEXT,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            conn.commit()
-            conn.close()
-            logger.info("Admin database initialized successfully")
-            
-        except Exception as e:
-            logger.error(f"Failed to initialize admin database: {e}")
-    
-    def _log_admin_action(self, admin_user_id: int, action_type: str, target_user_id: int = None, action_data: str = None):
+    async def _log_admin_action(self, admin_user_id: int, action_type: str, target_user_id: int = None, action_data: str = None):
         """Log admin action to database"""
         try:
-            import sqlite3
-            import json
-            
-            conn = sqlite3.connect(self.db_path, timeout=30.0)
-            cursor = conn.cursor()
+            def write(conn):
+                conn.execute('''
+                    INSERT INTO admin_actions (admin_user_id, action_type, target_user_id, action_data, timestamp)
+                    VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+                ''', (admin_user_id, action_type, target_user_id, action_data))
             
-            cursor.execute('''
-                INSERT INTO admin_actions (admin_user_id, action_type, target_user_id, action_data, timestamp)
-                VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
-            ''', (admin_user_id, action_type, target_user_id, action_data))
-            
-            conn.commit()
-            conn.close()
+            await self.db_manager.run_write(write)
             logger.info(f"Logged admin action: {action_type} for user {target_user_id}")
             
         except Exception as e:
@@ -122,28 +87,33 @@ class CompleteAdminBot:
     def _setup_handlers(self):
         """Setup command and message handlers"""
         # Basic commands
-        self.application.add_handler(CommandHandler("start", self.start_command))
-        self.application.add_handler(CommandHandler("help", self.help_command))
+        self.application.add_handler(self._command_handler("start", self.start_command))
+        self.application.add_handler(self._command_handler("help", self.help_command))
         
         # Admin monitoring commands (moved from main bot)
-        self.application.add_handler(CommandHandler("admin_stats", self.admin_stats_command))
-        self.application.add_handler(CommandHandler("admin_health", self.admin_health_command))
-        self.application.add_handler(CommandHandler("admin_security", self.admin_security_command))
-        self.application.add_handler(CommandHandler("admin_performance", self.admin_performance_command))
-        self.application.add_handler(CommandHandler("admin_analytics", self.admin_analytics_command))
+        self.application.add_handler(self._command_handler("admin_stats", self.admin_stats_command))
+        self.application.add_handler(self._command_handler("admin_health", self.admin_health_command))
+        self.application.add_handler(self._command_handler("admin_security", self.admin_security_command))
+        self.application.add_handler(self._command_handler("admin_performance", self.admin_performance_command))
+        self.application.add_handler(self._command_handler("admin_analytics", self.admin_analytics_command))
         
         # User management commands
-        self.application.add_handler(CommandHandler("users", self.users_command))
-        self.application.add_handler(CommandHandler("notify", self.notify_command))
-        self.application.add_handler(CommandHandler("broadcast", self.broadcast_command))
+        self.application.add_handler(self._command_handler("users", self.users_command))
+        self.application.add_handler(self._command_handler("notify", self.notify_command))
+        self.application.add_handler(self._command_handler("broadcast", self.broadcast_command))
         
         # Admin actions command
-        self.application.add_handler(CommandHandler("admin_actions", self.admin_actions_command))
+        self.application.add_handler(self._command_handler("admin_actions", self.admin_actions_command))
+        self.application.add_handler(self._command_handler("admin_counters", self.admin_counters_command))
+        self.application.add_handler(self._command_handler("admin_queries", self.admin_queries_command))
+        self.application.add_handler(self._command_handler("admin_storage", self.admin_storage_command))
+        self.application.add_handler(self._command_handler("admin_engagement", self.admin_engagement_command))
+        self.application.add_handler(self._command_handler("export", self.export_command))
         
         # System commands
-        self.application.add_handler(CommandHandler("system", self.system_command))
-        self.application.add_handler(CommandHandler("logs", self.logs_command))
-        self.application.add_handler(CommandHandler("restart", self.restart_command))
+        self.application.add_handler(self._command_handler("system", self.system_command))
+        self.application.add_handler(self._command_handler("logs", self.logs_command))
+        self.application.add_handler(self._command_handler("restart", self.restart_command))
         
         # Callback query handler
         self.application.add_handler(CallbackQueryHandler(self.handle_callback_query))
@@ -154,6 +124,10 @@ class CompleteAdminBot:
             self.handle_message
         ))
     
+    def _command_handler(self, command: str, callback) -> CommandHandler:
+        """CommandHandler whose callback latency is recorded as command.<name>"""
+        return CommandHandler(command, self.performance.measure_time(f"command.{command}")(callback))
+    
     def _check_admin_access(self, user_id: int) -> bool:
         """Check if user has admin access"""
         return str(user_id) == str(self.admin_user_id)
@@ -218,6 +192,11 @@ Welcome to the comprehensive admin interface! Here you can:
 • `/admin_security` - View security status and blocked users
 • `/admin_performance` - Performance metrics and cache stats
 • `/admin_analytics` - Comprehensive analytics report
+• `/admin_counters [rebuild]` - Check (or rebuild) per-user message counters
+• `/admin_queries [n] [total|max|avg|calls|rows|steps|reset]` - Slowest SQL statements
+• `/admin_storage [refresh|convert]` - Table and index sizes with row counts
+• `/admin_engagement [top|bottom|recompute] [n]` - Most or least engaged users
+• `/export <table> [ndjson|csv] [from YYYY-MM-DD] [to YYYY-MM-DD]` - Gzipped table export as a file
 
 **👥 User Management:**
 • `/users` - List all users, their states, and activity
@@ -279,6 +258,8 @@ Welcome to the comprehensive admin interface! Here you can:
 • Uptime: {stats['uptime']}
 • Last Activity: {stats['last_activity']}
             """
+            if stats.get('rollups_note'):
+                stats_text = f"{stats_text.rstrip()}\n\n{stats['rollups_note']}"
             
             await update.message.reply_text(stats_text, parse_mode='Markdown')
             
@@ -311,6 +292,7 @@ Welcome to the comprehensive admin interface! Here you can:
 • Main Bot: {health_status['main_bot']}
 • Database: {health_status['database']}
 • Logs: {health_status['logs']}
+• Cache Warm-up: {health_status['cache_warmup']}
 
 **📊 Performance:**
 • Response Time: {health_status['response_time']}
@@ -383,13 +365,21 @@ Welcome to the comprehensive admin interface! Here you can:
 **🗄️ Database Performance:**
 • Total Queries: {performance_metrics['db_queries']}
 • Slow Queries: {performance_metrics['slow_queries']}
+• Slow SQL Statements: {performance_metrics['slow_statements']}
 • Avg Response Time: {performance_metrics['avg_response_time']}s
 
 **📊 System Performance:**
 • Memory Usage: {performance_metrics['memory_usage']}
 • CPU Usage: {performance_metrics['cpu_usage']}
 • Active Connections: {performance_metrics['active_connections']}
-            """
+
+**🧠 Process Memory:**
+{performance_metrics['process_memory']}
+**🧹 Maintenance:**
+{performance_metrics['maintenance']}
+
+**⏱️ Latency (last {int(self.performance.latency.window_seconds // 60)} min):**
+{self._format_latency(performance_metrics['latency_window'])}"""
             
             await update.message.reply_text(perf_text, parse_mode='Markdown')
             
@@ -519,35 +509,40 @@ Welcome to the comprehensive admin interface! Here you can:
     async def _get_comprehensive_stats(self):
         """Get comprehensive statistics from database"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            # daily_stats is read as-is; the rollup task keeps it current and lag_note() flags any lag
+            def query(conn):
                 cursor = conn.cursor()
                 
                 # Get user statistics
-                cursor.execute("SELECT COUNT(*) FROM user_profiles")
+                cursor.execute("SELECT COUNT(*) FROM users")
                 total_users = cursor.fetchone()[0]
                 
-                cursor.execute("SELECT COUNT(*) FROM user_profiles WHERE created_at >= date('now', '-1 day')")
+                cursor.execute("SELECT COUNT(*) FROM users WHERE last_activity >= date('now', '-1 day')")
                 active_today = cursor.fetchone()[0]
                 
-                cursor.execute("SELECT COUNT(*) FROM user_profiles WHERE created_at >= date('now', '-7 days')")
+                cursor.execute("SELECT COALESCE(SUM(new_users), 0) FROM daily_stats WHERE day >= date('now', '-7 days')")
                 new_week = cursor.fetchone()[0]
                 
-                cursor.execute("SELECT COUNT(*) FROM user_states WHERE state = 'onboarding'")
+                cursor.execute("SELECT COUNT(*) FROM user_states WHERE current_state = 'onboarding'")
                 onboarding = cursor.fetchone()[0]
                 
-                # Get message statistics
-                cursor.execute("SELECT COUNT(*) FROM user_messages")
-                total_user_messages = cursor.fetchone()[0]
-                
-                cursor.execute("SELECT COUNT(*) FROM bot_messages")
-                total_bot_messages = cursor.fetchone()[0]
+                # Get message statistics (trigger-maintained global counters row)
+                cursor.execute(
+                    "SELECT user_messages_count, bot_messages_count FROM user_counters WHERE user_id = ?",
+                    (self.db_manager.GLOBAL_COUNTERS_ID,)
+                )
+                total_user_messages, total_bot_messages = cursor.fetchone() or (0, 0)
                 
-                cursor.execute("SELECT COUNT(*) FROM user_messages WHERE created_at >= date('now', '-1 day')")
+                cursor.execute("SELECT COALESCE(SUM(user_messages), 0) FROM daily_stats WHERE day >= date('now', '-1 day')")
                 messages_today = cursor.fetchone()[0]
                 
-                # Get subscription statistics
-                cursor.execute("SELECT COUNT(*) FROM subscriptions")
-                total_subscriptions = cursor.fetchone()[0]
+                # Get subscription statistics (totals per plan from daily_stats, status from subscriptions)
+                cursor.execute("""
+                    SELECT plan_type, SUM(new_subscriptions) FROM daily_stats
+                    WHERE new_subscriptions > 0 GROUP BY plan_type
+                """)
+                plans = dict(cursor.fetchall())
+                total_subscriptions = sum(plans.values())
                 
                 cursor.execute("SELECT COUNT(*) FROM subscriptions WHERE status = 'active'")
                 active_subscriptions = cursor.fetchone()[0]
@@ -555,43 +550,51 @@ Welcome to the comprehensive admin interface! Here you can:
                 cursor.execute("SELECT COUNT(*) FROM subscriptions WHERE status = 'completed'")
                 completed_plans = cursor.fetchone()[0]
                 
-                cursor.execute("SELECT COUNT(*) FROM subscriptions WHERE plan_type = 'extreme'")
-                extreme_plans = cursor.fetchone()[0]
+                extreme_plans = plans.get('extreme', 0)
+                week2_plans = plans.get('2week', 0)
                 
-                cursor.execute("SELECT COUNT(*) FROM subscriptions WHERE plan_type = '2week'")
-                week2_plans = cursor.fetchone()[0]
-                
-                cursor.execute("SELECT COUNT(*) FROM subscriptions WHERE plan_type = 'regular' AND status = 'requested'")
+                cursor.execute("SELECT COUNT(*) FROM subscriptions WHERE subscription_type = 'regular' AND status = 'requested'")
                 regular_requests = cursor.fetchone()[0]
                 
-                # Calculate averages
-                avg_messages_per_user = round(total_user_messages / total_users, 2) if total_users > 0 else 0
-                
-                # Get database size
-                db_size = os.path.getsize(self.db_path) / (1024 * 1024) if os.path.exists(self.db_path) else 0
-                db_size = round(db_size, 2)
-                
-                return {
-                    'total_users': total_users,
-                    'active_today': active_today,
-                    'new_week': new_week,
-                    'onboarding': onboarding,
-                    'active_subs': active_subscriptions,
-                    'total_user_messages': total_user_messages,
-                    'total_bot_messages': total_bot_messages,
-                    'messages_today': messages_today,
-                    'avg_messages_per_user': avg_messages_per_user,
-                    'total_subscriptions': total_subscriptions,
-                    'active_subscriptions': active_subscriptions,
-                    'completed_plans': completed_plans,
-                    'extreme_plans': extreme_plans,
-                    '2week_plans': week2_plans,
-                    'regular_requests': regular_requests,
-                    'db_size': db_size,
-                    'uptime': 'Unknown',  # Would need to track start time
-                    'last_activity': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                }
-                
+                return (total_users, active_today, new_week, onboarding,
+                        total_user_messages, total_bot_messages, messages_today,
+                        total_subscriptions, active_subscriptions, completed_plans,
+                        extreme_plans, week2_plans, regular_requests)
+            
+            (total_users, active_today, new_week, onboarding,
+             total_user_messages, total_bot_messages, messages_today,
+             total_subscriptions, active_subscriptions, completed_plans,
+             extreme_plans, week2_plans, regular_requests) = await self.db_manager.run_read(query)
+            
+            # Calculate averages
+            avg_messages_per_user = round(total_user_messages / total_users, 2) if total_users > 0 else 0
+            
+            # Get database size
+            db_size = os.path.getsize(self.db_path) / (1024 * 1024) if os.path.exists(self.db_path) else 0
+            db_size = round(db_size, 2)
+            
+            return {
+                'total_users': total_users,
+                'active_today': active_today,
+                'new_week': new_week,
+                'onboarding': onboarding,
+                'active_subs': active_subscriptions,
+                'total_user_messages': total_user_messages,
+                'total_bot_messages': total_bot_messages,
+                'messages_today': messages_today,
+                'avg_messages_per_user': avg_messages_per_user,
+                'total_subscriptions': total_subscriptions,
+                'active_subscriptions': active_subscriptions,
+                'completed_plans': completed_plans,
+                'extreme_plans': extreme_plans,
+                '2week_plans': week2_plans,
+                'regular_requests': regular_requests,
+                'db_size': db_size,
+                'uptime': 'Unknown',  # Would need to track start time
+                'last_activity': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+                'rollups_note': self.db_manager.rollups.lag_note()
+            }
+            
         except Exception as e:
             logger.error(f"Error getting comprehensive stats: {e}")
             return {}
@@ -618,6 +621,14 @@ Welcome to the comprehensive admin interface! Here you can:
                 overall = "critical"
                 issues.append("High disk usage")
             
+            # Cache warm-up runs before polling starts, so "not ready" means it is still loading
+            warmup = self.performance.get_warmup_status()
+            if not warmup['ready']:
+                issues.append("Cache still warming up")
+            cache_warmup = (f"{'✅' if warmup['state'] == 'ready' else '⚠️' if warmup['ready'] else '⏳'} "
+                            f"{warmup['state'].title()} ({warmup['loaded']}/{warmup['users']} users, "
+                            f"{warmup['elapsed']:.1f}s)")
+            
             # Check main bot status
             import subprocess
             result = subprocess.run(['pgrep', '-f', 'main.py'], capture_output=True, text=True)
@@ -631,6 +642,8 @@ Welcome to the comprehensive admin interface! Here you can:
                 'main_bot': main_bot,
                 'database': "✅ Connected" if os.path.exists(self.db_path) else "❌ Not Found",
                 'logs': "✅ Available" if os.path.exists('logs/main.log') else "❌ Not Found",
+                'cache_warmup': cache_warmup,
+                'ready': warmup['ready'],
                 'response_time': "Good",
                 'error_rate': "Low",
                 'active_users': "Unknown",
@@ -653,20 +666,70 @@ Welcome to the comprehensive admin interface! Here you can:
     
     async def _get_performance_metrics(self):
         """Get performance metrics"""
+        metrics = self.performance.get_performance_metrics()
+        pool_stats = self.db_manager.get_pool_stats()
         return {
-            'status': 'good',
-            'cache_hit_rate': 85,
-            'cache_size': 0,
-            'cache_hits': 0,
-            'cache_misses': 0,
-            'db_queries': 0,
-            'slow_queries': 0,
-            'avg_response_time': 0.1,
+            'status': 'good' if metrics.get('performance_status') == 'good' else 'needs optimization',
+            'cache_hit_rate': round(metrics.get('cache_hit_rate', 0.0), 1),
+            'cache_size': metrics.get('cache_size', 0),
+            'cache_hits': metrics.get('cache_hits', 0),
+            'cache_misses': metrics.get('cache_misses', 0),
+            'db_queries': metrics.get('db_queries', 0),
+            'slow_queries': metrics.get('slow_queries', 0),
+            'slow_statements': metrics.get('slow_statements', 0),
+            'avg_response_time': round(metrics.get('average_response_time', 0.0), 3),
             'memory_usage': f"{psutil.virtual_memory().percent}%",
             'cpu_usage': f"{psutil.cpu_percent()}%",
-            'active_connections': 0
+            'active_connections': f"{pool_stats['in_use']}/{pool_stats['max_connections']}",
+            'latency_window': metrics.get('latency_window', {}),
+            'maintenance': self._format_maintenance(pool_stats['maintenance']),
+            'process_memory': self._format_memory(metrics.get('memory', {}))
         }
     
+    def _format_memory(self, memory) -> str:
+        """RSS against the dyno limit, tracked consumers and recent shedding actions"""
+        sample = memory.get('last_sample') or self.performance.memory_watchdog.sample()
+        limit_mb = memory.get('limit_bytes', 0) / 1024 / 1024
+        text = (f"• RSS: {sample['rss'] / 1024 / 1024:.1f} MB of {limit_mb:.0f} MB ({sample['usage']:.0%}), "
+                f"peak {memory.get('peak_rss', sample['rss']) / 1024 / 1024:.1f} MB\n")
+        if sample['stage']:
+            text += f"• Shedding stage: `{sample['stage']}`\n"
+        for name, size in sample['consumers'].items():
+            text += f"• {name.title()}: ~{size / 1024:.0f} KB\n"
+        for action in memory.get('recent_actions', [])[-3:]:
+            details = ", ".join(f"{key}={value}" for key, value in action['result'].items())
+            text += (f"• {action['timestamp'][11:19]} `{action['stage']}/{action['consumer']}`: `{details}` "
+                     f"({action['rss_before'] / 1024 / 1024:.0f}→{action['rss_after'] / 1024 / 1024:.0f} MB)\n")
+        return text
+    
+    def _format_maintenance(self, maintenance) -> str:
+        """Incremental vacuum summary"""
+        text = (f"• Auto-vacuum: {maintenance['auto_vacuum'] or 'not checked yet'}\n"
+                f"• Reclaimed: {maintenance['pages_reclaimed']} pages "
+                f"({maintenance['bytes_reclaimed'] / 1024 / 1024:.1f} MB) in {maintenance['slices']} slices\n"
+                f"• Lock per slice: avg {maintenance['avg_lock_time'] * 1000:.1f}ms, "
+                f"max {maintenance['max_lock_time'] * 1000:.1f}ms\n")
+        if maintenance['last_optimize']:
+            text += f"• Last PRAGMA optimize: {maintenance['last_optimize']['timestamp'][:19]}\n"
+        if maintenance['auto_vacuum'] not in (None, 'incremental'):
+            text += "• Free pages are not reclaimed until `/admin_storage convert` is run\n"
+        return text
+    
+    def _format_latency(self, latency, limit: int = 8) -> str:
+        """One line per timed operation, busiest first"""
+        if not latency:
+            return "• No calls recorded yet\n"
+        lines = ""
+        busiest = sorted(latency.items(), key=lambda item: item[1]['count'], reverse=True)[:limit]
+        for name, summary in busiest:
+            lines += (f"• `{name}`: n={summary['count']} p50={summary['p50'] * 1000:.1f}ms "
+                      f"p90={summary['p90'] * 1000:.1f}ms p99={summary['p99'] * 1000:.1f}ms "
+                      f"max={summary['max'] * 1000:.1f}ms")
+            if summary['errors']:
+                lines += f" errors={summary['errors']}"
+            lines += "\n"
+        return lines
+    
     async def _generate_analytics_report(self):
         """Generate comprehensive analytics report"""
         stats = await self._get_comprehensive_stats()
@@ -704,35 +767,39 @@ Welcome to the comprehensive admin interface! Here you can:
 • Database Size: {stats.get('db_size', 0)} MB
 • Last Activity: {stats.get('last_activity', 'Unknown')}
         """
+        if stats.get('rollups_note'):
+            report = f"{report.rstrip()}\n\n{stats['rollups_note']}\n"
         
         return report
     
     async def _get_users_info(self):
         """Get users information"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            def query(conn):
                 cursor = conn.cursor()
                 
                 # Get recent users
                 cursor.execute("""
-                    SELECT user_id, first_name, last_name, created_at, state 
-                    FROM user_profiles 
-                    LEFT JOIN user_states ON user_profiles.user_id = user_states.user_id
+                    SELECT users.user_id, first_name, last_name, created_at, current_state
+                    FROM users 
+                    LEFT JOIN user_states ON users.user_id = user_states.user_id
                     ORDER BY created_at DESC 
                     LIMIT 10
                 """)
-                recent_users = cursor.fetchall()
-                
-                users_text = "👥 **Recent Users**\n\n"
-                for user in recent_users:
-                    user_id, first_name, last_name, created_at, state = user
-                    name = f"{first_name} {last_name}" if first_name and last_name else f"User {user_id}"
-                    users_text += f"• {name} (ID: {user_id})\n"
-                    users_text += f"  State: {state or 'Unknown'}\n"
-                    users_text += f"  Joined: {created_at}\n\n"
-                
-                return users_text
-                
+                return cursor.fetchall()
+            
+            recent_users = await self.db_manager.run_read(query)
+            
+            users_text = "👥 **Recent Users**\n\n"
+            for user in recent_users:
+                user_id, first_name, last_name, created_at, state = user
+                name = f"{first_name} {last_name}" if first_name and last_name else f"User {user_id}"
+                users_text += f"• {name} (ID: {user_id})\n"
+                users_text += f"  State: {state or 'Unknown'}\n"
+                users_text += f"  Joined: {created_at}\n\n"
+            
+            return users_text
+            
         except Exception as e:
             logger.error(f"Error getting users info: {e}")
             return f"❌ Error retrieving users info: {e}"
@@ -868,7 +935,7 @@ Welcome to the comprehensive admin interface! Here you can:
             admin_user_id = update.effective_user.id
             
             # Log admin action to database
-            self._log_admin_action(
+            await self._log_admin_action(
                 admin_user_id=admin_user_id,
                 action_type="donation_confirmed",
                 target_user_id=int(user_id),
@@ -905,7 +972,7 @@ Welcome to the comprehensive admin interface! Here you can:
             admin_user_id = update.effective_user.id
             
             # Log admin action to database
-            self._log_admin_action(
+            await self._log_admin_action(
                 admin_user_id=admin_user_id,
                 action_type="donation_rejected",
                 target_user_id=int(user_id),
@@ -963,21 +1030,18 @@ Welcome to the comprehensive admin interface! Here you can:
             return
         
         try:
-            import sqlite3
-            
-            conn = sqlite3.connect(self.db_path, timeout=30.0)
-            cursor = conn.cursor()
-            
-            # Get recent admin actions
-            cursor.execute('''
-                SELECT action_type, target_user_id, action_data, timestamp, status
-                FROM admin_actions 
-                ORDER BY timestamp DESC 
-                LIMIT 10
-            ''')
+            def query(conn):
+                # Get recent admin actions
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT action_type, target_user_id, action_data, timestamp, status
+                    FROM admin_actions 
+                    ORDER BY timestamp DESC 
+                    LIMIT 10
+                ''')
+                return cursor.fetchall()
             
-            actions = cursor.fetchall()
-            conn.close()
+            actions = await self.db_manager.run_read(query)
             
             if not actions:
                 await update.message.reply_text("📋 **Admin Actions**\n\nNo admin actions recorded yet.")
@@ -1011,6 +1075,246 @@ Welcome to the comprehensive admin interface! Here you can:
             logger.error(f"Error in admin_actions_command: {e}")
             await update.message.reply_text(f"❌ Error retrieving admin actions: {e}")
     
+    async def admin_counters_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /admin_counters command - check or rebuild the per-user counters"""
+        if not self._check_admin_access(update.effective_user.id):
+            await update.message.reply_text("❌ Access denied. Admin only.")
+            return
+        
+        try:
+            if context.args and context.args[0].lower() == "rebuild":
+                rows = await self.db_manager.rebuild_user_counters()
+                await self._log_admin_action(update.effective_user.id, "counters_rebuilt", action_data=str(rows))
+                await update.message.reply_text(f"✅ **User Counters Rebuilt**\n\n{rows} rows recomputed.", parse_mode='Markdown')
+                return
+            
+            mismatches = await self.db_manager.check_user_counters()
+            totals = await self.db_manager.get_global_counters()
+            
+            counters_text = "🔢 **User Counters**\n\n"
+            for name, value in totals.items():
+                counters_text += f"• {name.replace('_', ' ').title()}: {value}\n"
+            
+            if not mismatches:
+                counters_text += "\n✅ All counters match the source tables."
+            else:
+                counters_text += f"\n⚠️ {len(mismatches)} rows out of sync:\n"
+                for mismatch in mismatches[:10]:
+                    differences = ", ".join(f"{name} {diff:+d}" for name, diff in mismatch['differences'].items())
+                    counters_text += f"• User {mismatch['user_id']}: {differences}\n"
+                counters_text += "\nUse `/admin_counters rebuild` to recompute them."
+            
+            await update.message.reply_text(counters_text, parse_mode='Markdown')
+            
+        except Exception as e:
+            logger.error(f"Error in admin_counters_command: {e}")
+            await update.message.reply_text(f"❌ Error checking counters: {e}")
+    
+    async def admin_queries_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /admin_queries command - top SQL statements from the profiler"""
+        if not self._check_admin_access(update.effective_user.id):
+            await update.message.reply_text("❌ Access denied. Admin only.")
+            return
+        
+        try:
+            limit, order_by = 10, "total_time"
+            orders = {"total": "total_time", "max": "max_time", "avg": "avg_time",
+                      "calls": "calls", "rows": "rows", "steps": "vm_steps"}
+            for arg in context.args or []:
+                arg = arg.lower()
+                if arg == "reset":
+                    self.db_manager.profiler.reset()
+                    await self._log_admin_action(update.effective_user.id, "query_profile_reset")
+                    await update.message.reply_text("✅ SQL profile reset.")
+                    return
+                if arg.isdigit():
+                    limit = max(1, min(int(arg), 25))
+                elif arg in orders:
+                    order_by = orders[arg]
+            
+            profile_stats = self.db_manager.profiler.get_stats()
+            top_queries = self.db_manager.get_query_profile(limit, order_by)
+            since = datetime.fromtimestamp(profile_stats['since']).strftime('%Y-%m-%d %H:%M')
+            
+            queries_text = f"""🐢 **Top SQL by {order_by.replace('_', ' ')}**
+
+Since {since}: {profile_stats['statements']} statements, {profile_stats['total_time']:.2f}s total, {profile_stats['slow']} slow (≥{profile_stats['slow_threshold']}s), {profile_stats['errors']} errors
+
+"""
+            if not top_queries:
+                queries_text += "No statements recorded yet."
+            for rank, query in enumerate(top_queries, 1):
+                sql = query['sql'] if len(query['sql']) <= 150 else query['sql'][:147] + "..."
+                queries_text += (f"{rank}. `{sql}`\n"
+                                 f"   calls={query['calls']} total={query['total_time'] * 1000:.0f}ms "
+                                 f"avg={query['avg_time'] * 1000:.2f}ms max={query['max_time'] * 1000:.1f}ms "
+                                 f"rows={query['rows']} steps={query['vm_steps']}")
+                if query['errors']:
+                    queries_text += f" errors={query['errors']}"
+                queries_text += "\n\n"
+            
+            await update.message.reply_text(queries_text, parse_mode='Markdown')
+            
+        except Exception as e:
+            logger.error(f"Error in admin_queries_command: {e}")
+            await update.message.reply_text(f"❌ Error getting query profile: {e}")
+    
+    async def admin_storage_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /admin_storage command - per-table sizes and row counts"""
+        if not self._check_admin_access(update.effective_user.id):
+            await update.message.reply_text("❌ Access denied. Admin only.")
+            return
+        
+        try:
+            introspector = self.db_manager.introspector
+            if context.args and context.args[0].lower() == "convert":
+                await self._convert_storage(update, confirmed=len(context.args) > 1 and context.args[1].lower() == "confirm")
+                return
+            if context.args and context.args[0].lower() == "refresh":
+                await introspector.refresh_sizes(force=True)
+            
+            db_stats = await self.performance.get_database_stats()
+            if "error" in db_stats:
+                raise RuntimeError(db_stats["error"])
+            
+            storage_text = f"""💽 **Database Storage**
+
+Total: {db_stats['database_size_mb']:.2f} MB in {db_stats['table_count']} tables
+"""
+            if not introspector.has_dbstat:
+                storage_text += "_dbstat unavailable: sizes unknown, rows are estimates until counted_\n"
+            storage_text += "\n"
+            
+            for table in db_stats['tables'][:15]:
+                size = f"{table['bytes'] / 1024:.0f} KB" if table['bytes'] is not None else "?"
+                rows = f"{table['rows']:,}" if table['rows'] is not None else "?"
+                approx = "~" if table['rows_source'] == "sqlite_stat1" else ""
+                storage_text += f"• `{table['name']}`: {approx}{rows} rows, {size}"
+                if table['indexes'] and table['bytes'] is not None:
+                    index_bytes = sum(index['bytes'] or 0 for index in table['indexes'])
+                    storage_text += f" (+{index_bytes / 1024:.0f} KB in {len(table['indexes'])} indexes)"
+                elif table['indexes']:
+                    storage_text += f" ({len(table['indexes'])} indexes)"
+                storage_text += "\n"
+            
+            await update.message.reply_text(storage_text, parse_mode='Markdown')
+            
+        except Exception as e:
+            logger.error(f"Error in admin_storage_command: {e}")
+            await update.message.reply_text(f"❌ Error getting storage stats: {e}")
+    
+    async def _convert_storage(self, update: Update, confirmed: bool):
+        """One-off switch to auto_vacuum=INCREMENTAL (full VACUUM), only after explicit confirmation"""
+        maintenance = self.db_manager.maintenance
+        mode = await maintenance.get_auto_vacuum_mode()
+        if mode == "incremental":
+            await update.message.reply_text("✅ Database already uses incremental auto-vacuum")
+            return
+        
+        size_mb = os.path.getsize(self.db_path) / 1024 / 1024 if os.path.exists(self.db_path) else 0
+        if not confirmed:
+            await update.message.reply_text(
+                f"⚠️ **Convert to incremental auto-vacuum**\n\n"
+                f"This runs a full VACUUM of the {size_mb:.1f} MB database. It holds an exclusive lock "
+                f"until it finishes, so the main bot cannot write meanwhile, and needs about "
+                f"{2 * size_mb:.1f} MB of free disk.\n\n"
+                f"Send `/admin_storage convert confirm` during a quiet period to proceed.",
+                parse_mode='Markdown'
+            )
+            return
+        
+        await update.message.reply_text(f"⏳ Rewriting {size_mb:.1f} MB database...")
+        mode = await maintenance.convert_to_incremental()
+        await self._log_admin_action(
+            admin_user_id=update.effective_user.id,
+            action_type="storage_convert",
+            action_data=f"auto_vacuum={mode} ({size_mb:.1f} MB)"
+        )
+        await update.message.reply_text(f"{'✅' if mode == 'incremental' else '❌'} Auto-vacuum is now {mode}")
+    
+    async def admin_engagement_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /admin_engagement command - users ranked by decayed engagement score"""
+        if not self._check_admin_access(update.effective_user.id):
+            await update.message.reply_text("❌ Access denied. Admin only.")
+            return
+        
+        try:
+            mode, limit = "top", 10
+            for arg in context.args or []:
+                if arg.isdigit():
+                    limit = max(1, min(int(arg), 50))
+                elif arg.lower() in ("top", "bottom", "recompute"):
+                    mode = arg.lower()
+            
+            engagement_text = ""
+            if mode == "recompute":
+                updated = await self.db_manager.recompute_engagement_scores()
+                engagement_text += f"♻️ Recomputed scores for {updated} users\n\n"
+                mode = "top"
+            
+            ranking = await self.db_manager.get_engagement_ranking(limit, least_engaged=(mode == "bottom"))
+            title = "Least Engaged Users" if mode == "bottom" else "Most Engaged Users"
+            engagement_text += f"🎯 **{title}**\n\n"
+            if not ranking:
+                engagement_text += "No users yet"
+            for position, user in enumerate(ranking, 1):
+                name = user['username'] or user['first_name'] or "unknown"
+                engagement_text += (f"{position}. `{name}` ({user['user_id']}): {user['engagement_score']:.2f}"
+                                    f" - last active {user['last_activity'] or 'never'}\n")
+            
+            await update.message.reply_text(engagement_text, parse_mode='Markdown')
+            
+        except Exception as e:
+            logger.error(f"Error in admin_engagement_command: {e}")
+            await update.message.reply_text(f"❌ Error getting engagement ranking: {e}")
+    
+    async def export_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle /export command - send a table (or a date range of it) as a gzipped file"""
+        if not self._check_admin_access(update.effective_user.id):
+            await update.message.reply_text("❌ Access denied. Admin only.")
+            return
+        
+        args = list(context.args or [])
+        if not args or args[0] not in EXPORT_TABLES:
+            tables = ", ".join(f"`{table}`" for table in EXPORT_TABLES)
+            await update.message.reply_text(
+                f"📦 **Export**\n\nUsage: `/export <table> [ndjson|csv] [from] [to]`\n"
+                f"Dates are YYYY-MM-DD, `to` is inclusive.\n\nTables: {tables}",
+                parse_mode='Markdown'
+            )
+            return
+        
+        result = None
+        try:
+            table = args.pop(0)
+            fmt = args.pop(0).lower() if args and args[0].lower() in EXPORT_FORMATS else "ndjson"
+            since = args[0] if len(args) > 0 else None
+            until = args[1] if len(args) > 1 else None
+            
+            await update.message.reply_text(f"⏳ Exporting {table}...")
+            result = await self.exporter.export(table, fmt, since=since, until=until)
+            
+            caption = f"📦 {table}: {result['rows']:,} rows ({result['bytes'] / 1024:.0f} KB gzipped {fmt})"
+            if result['truncated']:
+                caption += "\n⚠️ Size limit reached; narrow the date range for the rest"
+            with open(result['path'], 'rb') as document:
+                await update.message.reply_document(document=document, filename=result['filename'], caption=caption)
+            
+            await self._log_admin_action(
+                admin_user_id=update.effective_user.id,
+                action_type="export",
+                action_data=f"{table} {fmt} {since or '-'}..{until or '-'}: {result['rows']} rows"
+            )
+            
+        except ValueError as e:
+            await update.message.reply_text(f"❌ {e}")
+        except Exception as e:
+            logger.error(f"Error in export_command: {e}")
+            await update.message.reply_text(f"❌ Error exporting data: {e}")
+        finally:
+            if result is not None and os.path.exists(result['path']):
+                os.remove(result['path'])
+    
     async def _notify_user_donation_confirmed(self, user_id: str):
         """Notify user that their donation has been confirmed"""
         try:
@@ -1119,10 +1423,55 @@ Welcome to the comprehensive admin interface! Here you can:
             import traceback
             logger.error(f"Traceback: {traceback.format_exc()}")
     
+    async def start_background_tasks(self):
+        """Start the database background tasks and the memory watchdog, then warm the cache"""
+        # Pick up cache invalidations for rows the main bot writes; started before the
+        # warm-up so nothing committed while the cache is being filled is missed
+        await self.db_manager.start_change_watcher()
+        
+        # Incremental vacuum and PRAGMA optimize in quiet periods
+        await self.db_manager.start_maintenance()
+        await self.db_manager.start_introspection()
+        await self.db_manager.start_rollups()
+        self.performance.memory_watchdog.start()
+        # Restores the last counter checkpoint, then checkpoints periodically
+        self.analytics.start()
+        
+        # Fill the cache for recently active users before the first updates arrive
+        await self.performance.preload_frequent_data()
+    
+    async def stop_background_tasks(self):
+        """Stop everything start_background_tasks started"""
+        # Writes a final counter checkpoint, so it runs while the database is still open
+        await self.analytics.stop()
+        await self.db_manager.stop_change_watcher()
+        await self.db_manager.stop_maintenance()
+        await self.db_manager.stop_introspection()
+        await self.db_manager.stop_rollups()
+        await self.performance.memory_watchdog.stop()
+    
     async def run(self):
-        """Run the admin bot"""
+        """Run the admin bot until cancelled, then stop its tasks and flush and close the database"""
         logger.info("Starting Complete Admin Bot...")
-        await self.application.run_polling()
+        app = self.application
+        try:
+            await self.start_background_tasks()
+            await app.initialize()
+            await app.start()
+            await app.updater.start_polling()
+            logger.info("Admin bot is running and polling...")
+            
+            # Polling runs in the background until this task is cancelled (e.g. Ctrl+C)
+            await asyncio.Event().wait()
+        finally:
+            await self.stop_background_tasks()
+            if app.updater.running:
+                await app.updater.stop()
+            if app.running:
+                await app.stop()
+            await app.shutdown()
+            # Writes the write-behind queue's remaining rows before closing
+            self.db_manager.close()
 
 def main():
     """Main function"""
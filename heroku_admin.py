@@ -33,6 +33,9 @@ async def start_admin_bot():
         # Get the application directly
         app = admin_bot.application
         
+        # Change watcher, maintenance, rollups, memory watchdog and cache warm-up
+        await admin_bot.start_background_tasks()
+        
         # Start polling
         logger.info("Starting admin bot polling...")
         await app.initialize()
@@ -49,9 +52,11 @@ async def start_admin_bot():
         except KeyboardInterrupt:
             logger.info("Admin bot stopped by user")
         finally:
+            await admin_bot.stop_background_tasks()
             await app.updater.stop()
             await app.stop()
             await app.shutdown()
+            admin_bot.db_manager.close()
             
     except Exception as e:
         logger.error(f"Failed to start admin bot: {e}")
@@ -3,74 +3,94 @@ Analytics Module
 Provides comprehensive analytics and tracking for the Telegram bot.
 """
 
+import sys
+import time
+import asyncio
 import logging
 import json
 from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
-from collections import defaultdict, Counter
-import sqlite3
+from collections import defaultdict
+from modules.counters import ActionRing, DecayingCounter
+from modules.cache import LRUTTLCache, CachedLoader
+from modules.engagement import current_score
 
 logger = logging.getLogger(__name__)
 
+# Counter sets checkpointed to analytics_counters
+CHECKPOINTED_COUNTERS = ("conversion_funnels", "feature_usage", "error_patterns")
+
+# Quantiles reported by the engagement analysis
+ENGAGEMENT_PERCENTILES = (25, 50, 75, 90, 99)
+
 class AnalyticsManager:
     """Centralized analytics and tracking management"""
     
-    def __init__(self, db_manager):
+    # Recent actions kept in memory per user; the full history is in analytics_events
+    MAX_RECENT_ACTIONS = 50
+    
+    def __init__(self, db_manager, half_life: float = 7 * 24 * 3600, checkpoint_interval: float = 300.0,
+                 analysis_ttl: float = 300.0):
         self.db_manager = db_manager
+        self.checkpoint_interval = checkpoint_interval
+        # Engagement analysis is recomputed at most once per analysis_ttl; older results are
+        # served for another analysis_ttl while a single background query refreshes them
+        self._engagement_analysis = CachedLoader(LRUTTLCache(max_entries=8), "engagement_analysis",
+                                                 self._load_engagement_analysis,
+                                                 ttl=analysis_ttl, stale_ttl=analysis_ttl)
+        # Action names are stored in the rings as indexes into this vocabulary
+        self._action_codes: Dict[str, int] = {}
+        self._action_names: List[str] = []
+        self._task: Optional[asyncio.Task] = None
+        self._restored = False
         self.analytics_data = {
-            "user_engagement": defaultdict(list),
-            "conversion_funnels": defaultdict(int),
-            "feature_usage": defaultdict(int),
-            "error_patterns": defaultdict(int),
+            "user_engagement": {},
+            # Conversions are running totals; feature and error counts fade with half_life
+            "conversion_funnels": DecayingCounter(half_life=None),
+            "feature_usage": DecayingCounter(half_life=half_life),
+            "error_patterns": DecayingCounter(half_life=half_life),
             "performance_metrics": defaultdict(list)
         }
     
+    def _action_code(self, action: str) -> int:
+        code = self._action_codes.get(action)
+        if code is None:
+            code = self._action_codes[action] = len(self._action_names)
+            self._action_names.append(action)
+        return code
+    
     async def track_user_action(self, user_id: int, action: str, details: Dict[str, Any] = None):
         """Track user actions for analytics"""
         try:
-            action_data = {
-                "user_id": user_id,
-                "action": action,
-                "timestamp": datetime.now().isoformat(),
-                "details": details or {}
-            }
-            
             # Store in database
-            await self.db_manager.store_user_message(
-                user_id=user_id,
-                message_text=json.dumps(action_data),
-                message_type="analytics_track",
-                module_context="analytics",
-                state_context=action
-            )
+            await self.db_manager.store_analytics_event(user_id, "action", action, details=details)
             
-            # Update in-memory analytics
-            self.analytics_data["user_engagement"][user_id].append(action_data)
+            # Update in-memory analytics (action and time only; details stay in analytics_events)
+            engagement = self.analytics_data["user_engagement"]
+            ring = engagement.get(user_id)
+            if ring is None:
+                ring = engagement[user_id] = ActionRing(self.MAX_RECENT_ACTIONS)
+            ring.append(self._action_code(action), time.time())
             
         except Exception as e:
             logger.error(f"Error tracking user action: {e}")
     
+    def get_recent_actions(self, user_id: int, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """A user's most recent in-memory actions, oldest first"""
+        ring = self.analytics_data["user_engagement"].get(user_id)
+        if ring is None:
+            return []
+        return [{"action": self._action_names[code], "timestamp": datetime.fromtimestamp(ts).isoformat()}
+                for code, ts in ring.items(limit)]
+    
     async def track_conversion(self, user_id: int, conversion_type: str, value: Any = None):
         """Track conversion events"""
         try:
-            conversion_data = {
-                "user_id": user_id,
-                "conversion_type": conversion_type,
-                "value": value,
-                "timestamp": datetime.now().isoformat()
-            }
-            
             # Store in database
-            await self.db_manager.store_user_message(
-                user_id=user_id,
-                message_text=json.dumps(conversion_data),
-                message_type="conversion_track",
-                module_context="analytics",
-                state_context=conversion_type
-            )
+            await self.db_manager.store_analytics_event(user_id, "conversion", conversion_type, value=value)
             
             # Update conversion funnel
-            self.analytics_data["conversion_funnels"][conversion_type] += 1
+            self.analytics_data["conversion_funnels"].add(conversion_type)
             
         except Exception as e:
             logger.error(f"Error tracking conversion: {e}")
@@ -78,24 +98,11 @@ class AnalyticsManager:
     async def track_feature_usage(self, user_id: int, feature: str, usage_details: Dict[str, Any] = None):
         """Track feature usage"""
         try:
-            usage_data = {
-                "user_id": user_id,
-                "feature": feature,
-                "timestamp": datetime.now().isoformat(),
-                "details": usage_details or {}
-            }
-            
             # Store in database
-            await self.db_manager.store_user_message(
-                user_id=user_id,
-                message_text=json.dumps(usage_data),
-                message_type="feature_usage",
-                module_context="analytics",
-                state_context=feature
-            )
+            await self.db_manager.store_analytics_event(user_id, "feature", feature, details=usage_details)
             
             # Update feature usage counter
-            self.analytics_data["feature_usage"][feature] += 1
+            self.analytics_data["feature_usage"].add(feature)
             
         except Exception as e:
             logger.error(f"Error tracking feature usage: {e}")
@@ -103,14 +110,8 @@ class AnalyticsManager:
     async def track_error(self, error_type: str, error_details: Dict[str, Any] = None):
         """Track errors for analytics"""
         try:
-            error_data = {
-                "error_type": error_type,
-                "timestamp": datetime.now().isoformat(),
-                "details": error_details or {}
-            }
-            
             # Update error patterns
-            self.analytics_data["error_patterns"][error_type] += 1
+            self.analytics_data["error_patterns"].add(error_type)
             
             # Log error for monitoring
             logger.error(f"Analytics tracked error: {error_type} - {error_details}")
@@ -118,58 +119,105 @@ class AnalyticsManager:
         except Exception as e:
             logger.error(f"Error tracking error: {e}")
     
+    def get_memory_usage(self) -> int:
+        """Approximate bytes held by in-memory analytics"""
+        engagement = self.analytics_data["user_engagement"]
+        size = sys.getsizeof(engagement) + sum(ring.nbytes() for ring in engagement.values())
+        for key in CHECKPOINTED_COUNTERS:
+            size += self.analytics_data[key].nbytes()
+        return size
+    
+    def trim_memory(self, keep_per_user: int = 5, max_users: int = 1000) -> Dict[str, Any]:
+        """Keep only the newest actions of the most recently active users and drop faded counters"""
+        engagement = self.analytics_data["user_engagement"]
+        before = sum(len(ring) for ring in engagement.values())
+        users_before = len(engagement)
+        
+        recent_users = sorted(engagement, key=lambda user_id: engagement[user_id].last_time(),
+                              reverse=True)[:max_users]
+        trimmed = {}
+        for user_id in recent_users:
+            # Rebuilt rings hold only what is kept and grow back to MAX_RECENT_ACTIONS as needed
+            ring = trimmed[user_id] = ActionRing(self.MAX_RECENT_ACTIONS)
+            for code, ts in engagement[user_id].items(keep_per_user):
+                ring.append(code, ts)
+        self.analytics_data["user_engagement"] = trimmed
+        
+        after = sum(len(ring) for ring in trimmed.values())
+        counters_dropped = sum(self.analytics_data[key].prune() for key in CHECKPOINTED_COUNTERS)
+        return {"actions_dropped": before - after, "users_dropped": users_before - len(trimmed),
+                "counters_dropped": counters_dropped}
+    
+    async def checkpoint(self):
+        """Save the conversion, feature and error counters to analytics_counters"""
+        await self.db_manager.save_analytics_counters(
+            {key: self.analytics_data[key].entries() for key in CHECKPOINTED_COUNTERS})
+    
+    async def restore(self) -> int:
+        """Merge the last checkpoint into the counters; returns the entries loaded"""
+        entries = await self.db_manager.load_analytics_counters()
+        loaded = 0
+        for key, rows in entries.items():
+            if key in CHECKPOINTED_COUNTERS:
+                for name, value, updated_at in rows:
+                    self.analytics_data[key].merge(name, value, updated_at)
+                    loaded += 1
+        self._restored = True
+        return loaded
+    
+    async def _run(self):
+        """Restore the counters once, then checkpoint them until cancelled"""
+        while True:
+            try:
+                if not self._restored:
+                    loaded = await self.restore()
+                    logger.info(f"Restored {loaded} analytics counters from checkpoint")
+                else:
+                    await self.checkpoint()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error checkpointing analytics counters: {e}")
+            await asyncio.sleep(self.checkpoint_interval)
+    
+    def start(self):
+        """Restore checkpointed counters and start periodic checkpoints on the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+    
+    async def stop(self):
+        """Stop periodic checkpoints and write a final one"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._restored:
+            await self.checkpoint()
+    
     async def get_user_analytics(self, user_id: int) -> Dict[str, Any]:
         """Get analytics for a specific user"""
         try:
-            # Get user messages for analytics
-            messages = await self.db_manager.get_user_messages(user_id, limit=1000)
-            
-            # Filter analytics messages
-            analytics_messages = [msg for msg in messages if msg['message_type'] in [
-                'analytics_track', 'conversion_track', 'feature_usage'
-            ]]
+            # Aggregated per event name by an index scan of analytics_events
+            summary = await self.db_manager.get_user_event_summary(user_id)
             
-            # Parse analytics data
-            user_actions = []
-            conversions = []
-            feature_usage = []
-            
-            for msg in analytics_messages:
-                try:
-                    data = json.loads(msg['message_text'])
-                    if msg['message_type'] == 'analytics_track':
-                        user_actions.append(data)
-                    elif msg['message_type'] == 'conversion_track':
-                        conversions.append(data)
-                    elif msg['message_type'] == 'feature_usage':
-                        feature_usage.append(data)
-                except json.JSONDecodeError:
-                    continue
-            
-            # Calculate metrics
-            total_actions = len(user_actions)
-            total_conversions = len(conversions)
-            total_feature_usage = len(feature_usage)
-            
-            # Get action frequency
-            action_frequency = Counter([action['action'] for action in user_actions])
-            
-            # Get conversion types
-            conversion_types = Counter([conv['conversion_type'] for conv in conversions])
-            
-            # Get feature usage
-            features_used = Counter([usage['feature'] for usage in feature_usage])
+            by_kind = defaultdict(dict)
+            for row in summary:
+                by_kind[row['event_kind']][row['name']] = row['count']
+            actions = [row for row in summary if row['event_kind'] == 'action']
             
             analytics = {
                 "user_id": user_id,
-                "total_actions": total_actions,
-                "total_conversions": total_conversions,
-                "total_feature_usage": total_feature_usage,
-                "action_frequency": dict(action_frequency),
-                "conversion_types": dict(conversion_types),
-                "features_used": dict(features_used),
-                "engagement_score": self._calculate_engagement_score(user_actions),
-                "last_activity": user_actions[-1]['timestamp'] if user_actions else None
+                "total_actions": sum(by_kind['action'].values()),
+                "total_conversions": sum(by_kind['conversion'].values()),
+                "total_feature_usage": sum(by_kind['feature'].values()),
+                "action_frequency": by_kind['action'],
+                "conversion_types": by_kind['conversion'],
+                "features_used": by_kind['feature'],
+                "engagement_score": round(await self.db_manager.get_engagement_score(user_id), 2),
+                "last_activity": max((row['last_ts'] for row in actions), default=None)
             }
             
             return analytics
@@ -178,49 +226,12 @@ class AnalyticsManager:
             logger.error(f"Error getting user analytics: {e}")
             return {}
     
-    def _calculate_engagement_score(self, user_actions: List[Dict[str, Any]]) -> float:
-        """Calculate user engagement score"""
-        try:
-            if not user_actions:
-                return 0.0
-            
-            # Calculate score based on action frequency and recency
-            now = datetime.now()
-            recent_actions = 0
-            total_score = 0
-            
-            for action in user_actions:
-                action_time = datetime.fromisoformat(action['timestamp'])
-                days_ago = (now - action_time).days
-                
-                # Weight recent actions more heavily
-                if days_ago <= 1:
-                    recent_actions += 1
-                    total_score += 10
-                elif days_ago <= 7:
-                    total_score += 5
-                elif days_ago <= 30:
-                    total_score += 2
-                else:
-                    total_score += 1
-            
-            # Normalize score (0-100)
-            max_possible_score = len(user_actions) * 10
-            if max_possible_score == 0:
-                return 0.0
-            
-            normalized_score = (total_score / max_possible_score) * 100
-            return min(normalized_score, 100.0)
-            
-        except Exception as e:
-            logger.error(f"Error calculating engagement score: {e}")
-            return 0.0
-    
     async def get_system_analytics(self) -> Dict[str, Any]:
         """Get system-wide analytics"""
         try:
-            # Get database statistics
-            with sqlite3.connect(self.db_manager.db_path) as conn:
+            # Get database statistics (message and subscription counts from daily_stats rollups,
+            # read as-is: the rollup task keeps them current and lag_note() flags any lag)
+            def query(conn):
                 cursor = conn.cursor()
                 
                 # Get total users
@@ -229,38 +240,37 @@ class AnalyticsManager:
                 
                 # Get active users (last 30 days)
                 cursor.execute("""
-                    SELECT COUNT(DISTINCT user_id) FROM user_messages 
-                    WHERE timestamp > datetime('now', '-30 days')
+                    SELECT COUNT(DISTINCT user_id) FROM daily_active_users 
+                    WHERE day >= date('now', '-30 days')
                 """)
                 active_users = cursor.fetchone()[0]
                 
-                # Get total messages
-                cursor.execute("SELECT COUNT(*) FROM user_messages")
-                total_messages = cursor.fetchone()[0]
-                
                 # Get messages by type
                 cursor.execute("""
-                    SELECT message_type, COUNT(*) 
-                    FROM user_messages 
+                    SELECT message_type, SUM(user_messages) 
+                    FROM daily_stats 
+                    WHERE user_messages > 0
                     GROUP BY message_type
                 """)
                 messages_by_type = dict(cursor.fetchall())
+                total_messages = sum(messages_by_type.values())
                 
                 # Get user registrations by day (last 30 days)
                 cursor.execute("""
-                    SELECT DATE(created_at) as date, COUNT(*) 
-                    FROM users 
-                    WHERE created_at > datetime('now', '-30 days')
-                    GROUP BY DATE(created_at)
-                    ORDER BY date
+                    SELECT day, SUM(new_users) 
+                    FROM daily_stats 
+                    WHERE day > date('now', '-30 days') AND new_users > 0
+                    GROUP BY day
+                    ORDER BY day
                 """)
                 daily_registrations = dict(cursor.fetchall())
                 
                 # Get subscription statistics
                 cursor.execute("""
-                    SELECT subscription_type, COUNT(*) 
-                    FROM subscriptions 
-                    GROUP BY subscription_type
+                    SELECT NULLIF(plan_type, ''), SUM(new_subscriptions) 
+                    FROM daily_stats 
+                    WHERE new_subscriptions > 0
+                    GROUP BY plan_type
                 """)
                 subscription_stats = dict(cursor.fetchall())
                 
@@ -273,9 +283,16 @@ class AnalyticsManager:
                 """)
                 completion_data = cursor.fetchone()
                 completion_rate = (completion_data[1] / completion_data[0] * 100) if completion_data[0] > 0 else 0
+                
+                return (total_users, active_users, total_messages, messages_by_type,
+                        daily_registrations, subscription_stats, completion_rate)
+            
+            (total_users, active_users, total_messages, messages_by_type,
+             daily_registrations, subscription_stats, completion_rate) = await self.db_manager.run_read(query)
             
             analytics = {
                 "timestamp": datetime.now().isoformat(),
+                "rollups_note": self.db_manager.rollups.lag_note(),
                 "user_metrics": {
                     "total_users": total_users,
                     "active_users_30d": active_users,
@@ -294,9 +311,9 @@ class AnalyticsManager:
                     "daily_registrations": daily_registrations,
                     "total_registrations_30d": sum(daily_registrations.values())
                 },
-                "conversion_funnels": dict(self.analytics_data["conversion_funnels"]),
-                "feature_usage": dict(self.analytics_data["feature_usage"]),
-                "error_patterns": dict(self.analytics_data["error_patterns"])
+                "conversion_funnels": self.analytics_data["conversion_funnels"].snapshot(),
+                "feature_usage": self.analytics_data["feature_usage"].snapshot(),
+                "error_patterns": self.analytics_data["error_patterns"].snapshot()
             }
             
             return analytics
@@ -308,7 +325,7 @@ class AnalyticsManager:
     async def get_conversion_funnel_analysis(self) -> Dict[str, Any]:
         """Analyze conversion funnels"""
         try:
-            with sqlite3.connect(self.db_manager.db_path) as conn:
+            def query(conn):
                 cursor = conn.cursor()
                 
                 # Get funnel data
@@ -321,94 +338,138 @@ class AnalyticsManager:
                     FROM users u
                     LEFT JOIN subscriptions s ON u.user_id = s.user_id
                 """)
-                funnel_data = cursor.fetchone()
-                
-                total_users, users_with_subscription, active_subscriptions, completed_subscriptions = funnel_data
-                
-                # Calculate conversion rates
-                subscription_rate = (users_with_subscription / total_users * 100) if total_users > 0 else 0
-                activation_rate = (active_subscriptions / users_with_subscription * 100) if users_with_subscription > 0 else 0
-                completion_rate = (completed_subscriptions / active_subscriptions * 100) if active_subscriptions > 0 else 0
-                
-                funnel_analysis = {
-                    "total_users": total_users,
-                    "users_with_subscription": users_with_subscription,
-                    "active_subscriptions": active_subscriptions,
-                    "completed_subscriptions": completed_subscriptions,
-                    "conversion_rates": {
-                        "subscription_rate": subscription_rate,
-                        "activation_rate": activation_rate,
-                        "completion_rate": completion_rate,
-                        "overall_conversion_rate": (completed_subscriptions / total_users * 100) if total_users > 0 else 0
-                    },
-                    "funnel_stages": [
-                        {"stage": "Users", "count": total_users, "rate": 100.0},
-                        {"stage": "Subscribed", "count": users_with_subscription, "rate": subscription_rate},
-                        {"stage": "Active", "count": active_subscriptions, "rate": activation_rate},
-                        {"stage": "Completed", "count": completed_subscriptions, "rate": completion_rate}
-                    ]
-                }
-                
-                return funnel_analysis
-                
+                return cursor.fetchone()
+            
+            funnel_data = await self.db_manager.run_read(query)
+            
+            total_users, users_with_subscription, active_subscriptions, completed_subscriptions = funnel_data
+            
+            # Calculate conversion rates
+            subscription_rate = (users_with_subscription / total_users * 100) if total_users > 0 else 0
+            activation_rate = (active_subscriptions / users_with_subscription * 100) if users_with_subscription > 0 else 0
+            completion_rate = (completed_subscriptions / active_subscriptions * 100) if active_subscriptions > 0 else 0
+            
+            funnel_analysis = {
+                "total_users": total_users,
+                "users_with_subscription": users_with_subscription,
+                "active_subscriptions": active_subscriptions,
+                "completed_subscriptions": completed_subscriptions,
+                "conversion_rates": {
+                    "subscription_rate": subscription_rate,
+                    "activation_rate": activation_rate,
+                    "completion_rate": completion_rate,
+                    "overall_conversion_rate": (completed_subscriptions / total_users * 100) if total_users > 0 else 0
+                },
+                "funnel_stages": [
+                    {"stage": "Users", "count": total_users, "rate": 100.0},
+                    {"stage": "Subscribed", "count": users_with_subscription, "rate": subscription_rate},
+                    {"stage": "Active", "count": active_subscriptions, "rate": activation_rate},
+                    {"stage": "Completed", "count": completed_subscriptions, "rate": completion_rate}
+                ]
+            }
+            
+            return funnel_analysis
+            
         except Exception as e:
             logger.error(f"Error analyzing conversion funnel: {e}")
             return {"error": str(e)}
     
-    async def get_user_engagement_analysis(self) -> Dict[str, Any]:
-        """Analyze user engagement patterns"""
+    async def get_user_engagement_analysis(self, active_days_window: int = 30) -> Dict[str, Any]:
+        """Analyze user engagement patterns (cached for analysis_ttl)"""
         try:
-            with sqlite3.connect(self.db_manager.db_path) as conn:
-                cursor = conn.cursor()
-                
-                # Get engagement metrics
-                cursor.execute("""
-                    SELECT 
-                        user_id,
-                        COUNT(*) as message_count,
-                        MIN(timestamp) as first_message,
-                        MAX(timestamp) as last_message,
-                        COUNT(DISTINCT DATE(timestamp)) as active_days
-                    FROM user_messages 
-                    WHERE message_type = 'user_message'
-                    GROUP BY user_id
-                """)
-                engagement_data = cursor.fetchall()
-                
-                if not engagement_data:
-                    return {"error": "No engagement data available"}
-                
-                # Calculate engagement metrics
-                message_counts = [row[1] for row in engagement_data]
-                active_days = [row[4] for row in engagement_data]
-                
-                engagement_analysis = {
-                    "total_active_users": len(engagement_data),
-                    "message_metrics": {
-                        "avg_messages_per_user": sum(message_counts) / len(message_counts),
-                        "median_messages_per_user": sorted(message_counts)[len(message_counts) // 2],
-                        "max_messages_per_user": max(message_counts),
-                        "min_messages_per_user": min(message_counts)
-                    },
-                    "activity_metrics": {
-                        "avg_active_days": sum(active_days) / len(active_days),
-                        "median_active_days": sorted(active_days)[len(active_days) // 2],
-                        "max_active_days": max(active_days),
-                        "min_active_days": min(active_days)
-                    },
-                    "engagement_segments": {
-                        "high_engagement": len([count for count in message_counts if count >= 50]),
-                        "medium_engagement": len([count for count in message_counts if 10 <= count < 50]),
-                        "low_engagement": len([count for count in message_counts if count < 10])
-                    }
-                }
-                
-                return engagement_analysis
-                
+            return await self._engagement_analysis.get(active_days_window)
         except Exception as e:
             logger.error(f"Error analyzing user engagement: {e}")
             return {"error": str(e)}
     
+    async def _load_engagement_analysis(self, active_days_window: int) -> Dict[str, Any]:
+        """Quantiles and segments of per-user engagement in one SQL pass.
+        
+        Reads one pre-aggregated row per user (user_counters, daily_active_users,
+        users.engagement_log) rather than the message tables; CUME_DIST gives
+        nearest-rank percentiles without sorting in Python.
+        """
+        percentile_columns = []
+        for metric, rank in (("messages", "messages_rank"), ("active_days", "days_rank"),
+                             ("engagement", "engagement_rank")):
+            for p in ENGAGEMENT_PERCENTILES:
+                percentile_columns.append(f"MIN(CASE WHEN {rank} >= {p / 100} THEN {metric} END)")
+        
+        def query(conn):
+            cursor = conn.cursor()
+            cursor.execute(f"""
+                WITH active AS (
+                    SELECT user_id, COUNT(*) AS active_days FROM daily_active_users
+                    WHERE day >= date('now', ?)
+                    GROUP BY user_id
+                ),
+                per_user AS (
+                    SELECT c.user_messages_count AS messages,
+                           COALESCE(a.active_days, 0) AS active_days,
+                           u.engagement_log AS engagement
+                    FROM user_counters c
+                    LEFT JOIN active a ON a.user_id = c.user_id
+                    LEFT JOIN users u ON u.user_id = c.user_id
+                    WHERE c.user_id != ? AND c.user_messages_count > 0
+                ),
+                ranked AS (
+                    SELECT messages, active_days, engagement,
+                           CUME_DIST() OVER (ORDER BY messages) AS messages_rank,
+                           CUME_DIST() OVER (ORDER BY active_days) AS days_rank,
+                           -- Users with no tracked events are left out of the score quantiles
+                           CUME_DIST() OVER (PARTITION BY engagement IS NULL ORDER BY engagement) AS engagement_rank
+                    FROM per_user
+                )
+                SELECT
+                    COUNT(*), AVG(messages), MIN(messages), MAX(messages),
+                    AVG(active_days), MIN(active_days), MAX(active_days),
+                    SUM(messages >= 50), SUM(messages >= 10 AND messages < 50), SUM(messages < 10),
+                    {', '.join(percentile_columns)}
+                FROM ranked
+            """, (f"-{int(active_days_window)} days", self.db_manager.GLOBAL_COUNTERS_ID))
+            return cursor.fetchone()
+        
+        row = await self.db_manager.run_read(query)
+        total_users = row[0]
+        if not total_users:
+            return {"error": "No engagement data available"}
+        
+        (avg_messages, min_messages, max_messages, avg_days, min_days, max_days,
+         high, medium, low) = row[1:10]
+        count = len(ENGAGEMENT_PERCENTILES)
+        message_percentiles = row[10:10 + count]
+        day_percentiles = row[10 + count:10 + 2 * count]
+        engagement_logs = row[10 + 2 * count:]
+        now = time.time()
+        
+        return {
+            "total_active_users": total_users,
+            "computed_at": datetime.now().isoformat(),
+            "message_metrics": {
+                "avg_messages_per_user": avg_messages,
+                "median_messages_per_user": message_percentiles[ENGAGEMENT_PERCENTILES.index(50)],
+                "max_messages_per_user": max_messages,
+                "min_messages_per_user": min_messages,
+                "percentiles": {f"p{p}": value for p, value in zip(ENGAGEMENT_PERCENTILES, message_percentiles)}
+            },
+            "activity_metrics": {
+                "window_days": active_days_window,
+                "avg_active_days": avg_days,
+                "median_active_days": day_percentiles[ENGAGEMENT_PERCENTILES.index(50)],
+                "max_active_days": max_days,
+                "min_active_days": min_days,
+                "percentiles": {f"p{p}": value for p, value in zip(ENGAGEMENT_PERCENTILES, day_percentiles)}
+            },
+            "engagement_score_percentiles": {
+                f"p{p}": round(current_score(value, now), 2) for p, value in zip(ENGAGEMENT_PERCENTILES, engagement_logs)
+            },
+            "engagement_segments": {
+                "high_engagement": high,
+                "medium_engagement": medium,
+                "low_engagement": low
+            }
+        }
+    
     async def generate_analytics_report(self) -> str:
         """Generate comprehensive analytics report"""
         try:
@@ -446,6 +507,8 @@ class AnalyticsManager:
 {self._format_feature_usage(system_analytics.get('feature_usage', {}))}
             """
             
+            if system_analytics.get('rollups_note'):
+                report = f"{report.rstrip()}\n\n{system_analytics['rollups_note']}"
             return report.strip()
             
         except Exception as e:
@@ -0,0 +1,427 @@
+"""
+Cache Module
+Bounded LRU cache with per-namespace TTLs and heap-driven expiry for the Telegram bot.
+"""
+
+import sys
+import time
+import heapq
+import asyncio
+import threading
+import logging
+from collections import OrderedDict, defaultdict
+from functools import wraps
+from typing import Awaitable, Callable, Dict, Any, Hashable, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+def estimate_size(value: Any, _depth: int = 0) -> int:
+    """Approximate memory footprint of a cached value in bytes"""
+    size = sys.getsizeof(value)
+    # Loader entries are (value, fresh_until) tuples around rows with JSON state, so walk
+    # a few levels; anything deeper is rare and counted by its container only
+    if _depth >= 4:
+        return size
+    if isinstance(value, dict):
+        size += sum(estimate_size(k, _depth + 1) + estimate_size(v, _depth + 1) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        size += sum(estimate_size(item, _depth + 1) for item in value)
+    return size
+
+class LRUTTLCache:
+    """Thread-safe LRU cache bounded by entry count and an approximate memory budget.
+
+    Every entry has an absolute expiry taken from its namespace TTL. Expired
+    entries are popped from a min-heap in expiry order, so cleanup costs
+    amortized O(log n) per entry instead of a full scan.
+    """
+
+    def __init__(self, max_entries: int = 10000, max_bytes: int = 32 * 1024 * 1024,
+                 default_ttl: float = 300.0, namespace_ttls: Optional[Dict[str, float]] = None):
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.namespace_ttls = dict(namespace_ttls or {})
+
+        self._lock = threading.RLock()
+        # (namespace, key) -> [value, expires_at, size]; ordered from least to most recently used
+        self._entries: "OrderedDict[Tuple[str, Hashable], list]" = OrderedDict()
+        # (expires_at, sequence, full_key); superseded items are skipped lazily
+        self._expiry_heap = []
+        self._sequence = 0
+        self._bytes = 0
+        self._namespace_stats = defaultdict(self._new_namespace_stats)
+
+    @staticmethod
+    def _new_namespace_stats() -> Dict[str, int]:
+        return {
+            "hits": 0,
+            "misses": 0,
+            "sets": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+            "entries": 0,
+            "bytes": 0
+        }
+
+    def ttl_for(self, namespace: str) -> float:
+        """TTL in seconds used for entries of a namespace"""
+        return self.namespace_ttls.get(namespace, self.default_ttl)
+
+    def get(self, namespace: str, key: Hashable, default: Any = None) -> Any:
+        """Return a live cached value and mark it most recently used"""
+        full_key = (namespace, key)
+        with self._lock:
+            stats = self._namespace_stats[namespace]
+            entry = self._entries.get(full_key)
+            if entry is None:
+                stats["misses"] += 1
+                return default
+            if entry[1] <= time.monotonic():
+                self._remove(full_key, "expirations")
+                stats["misses"] += 1
+                return default
+            self._entries.move_to_end(full_key)
+            stats["hits"] += 1
+            return entry[0]
+
+    def contains(self, namespace: str, key: Hashable) -> bool:
+        """Whether a live entry exists, without touching LRU order or counters"""
+        with self._lock:
+            entry = self._entries.get((namespace, key))
+            return entry is not None and entry[1] > time.monotonic()
+
+    def set(self, namespace: str, key: Hashable, value: Any, ttl: Optional[float] = None):
+        """Insert or replace an entry, evicting least recently used entries to stay in budget"""
+        full_key = (namespace, key)
+        ttl = self.ttl_for(namespace) if ttl is None else ttl
+        size = estimate_size(value)
+        if self.max_bytes and size > self.max_bytes:
+            logger.debug(f"Not caching {namespace}:{key}, {size} bytes exceeds the cache budget")
+            self.delete(namespace, key)
+            return
+
+        with self._lock:
+            if full_key in self._entries:
+                self._remove(full_key, None)
+
+            expires_at = time.monotonic() + ttl
+            self._entries[full_key] = [value, expires_at, size]
+            self._bytes += size
+            stats = self._namespace_stats[namespace]
+            stats["sets"] += 1
+            stats["entries"] += 1
+            stats["bytes"] += size
+
+            self._sequence += 1
+            heapq.heappush(self._expiry_heap, (expires_at, self._sequence, full_key))
+            if len(self._expiry_heap) > 2 * len(self._entries) + 64:
+                self._compact_heap()
+
+            self._expire_locked(time.monotonic())
+            while self._entries and (len(self._entries) > self.max_entries or
+                                     (self.max_bytes and self._bytes > self.max_bytes)):
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key, "evictions")
+
+    def delete(self, namespace: str, key: Hashable) -> bool:
+        """Invalidate a single entry"""
+        with self._lock:
+            if (namespace, key) not in self._entries:
+                return False
+            self._remove((namespace, key), "invalidations")
+            return True
+
+    def invalidate_namespace(self, namespace: str) -> int:
+        """Invalidate every entry of a namespace"""
+        with self._lock:
+            keys = [full_key for full_key in self._entries if full_key[0] == namespace]
+            for full_key in keys:
+                self._remove(full_key, "invalidations")
+            return len(keys)
+
+    def clear(self):
+        """Drop every entry (statistics are kept)"""
+        with self._lock:
+            self._entries.clear()
+            self._expiry_heap = []
+            self._bytes = 0
+            for stats in self._namespace_stats.values():
+                stats["entries"] = 0
+                stats["bytes"] = 0
+
+    def shrink(self, target_bytes: int) -> Tuple[int, int]:
+        """Evict least recently used entries until at most ``target_bytes`` remain.
+
+        Returns the number of entries and bytes evicted.
+        """
+        with self._lock:
+            self._expire_locked(time.monotonic())
+            entries, freed = 0, 0
+            while self._entries and self._bytes > target_bytes:
+                oldest_key = next(iter(self._entries))
+                freed += self._entries[oldest_key][2]
+                self._remove(oldest_key, "evictions")
+                entries += 1
+            return entries, freed
+
+    def expire(self) -> int:
+        """Remove all entries whose TTL has passed; returns how many were removed"""
+        with self._lock:
+            return self._expire_locked(time.monotonic())
+
+    def _expire_locked(self, now: float) -> int:
+        """Pop expired heap items, skipping ones superseded by a newer set or a removal"""
+        removed = 0
+        heap = self._expiry_heap
+        while heap and heap[0][0] <= now:
+            expires_at, _, full_key = heapq.heappop(heap)
+            entry = self._entries.get(full_key)
+            if entry is not None and entry[1] == expires_at:
+                self._remove(full_key, "expirations")
+                removed += 1
+        return removed
+
+    def _compact_heap(self):
+        """Rebuild the heap from live entries once stale items outnumber them"""
+        self._expiry_heap = []
+        for full_key, entry in self._entries.items():
+            self._sequence += 1
+            self._expiry_heap.append((entry[1], self._sequence, full_key))
+        heapq.heapify(self._expiry_heap)
+
+    def _remove(self, full_key: Tuple[str, Hashable], reason: Optional[str]):
+        """Drop an entry and update accounting (lock held)"""
+        entry = self._entries.pop(full_key)
+        self._bytes -= entry[2]
+        stats = self._namespace_stats[full_key[0]]
+        stats["entries"] -= 1
+        stats["bytes"] -= entry[2]
+        if reason:
+            stats[reason] += 1
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size_bytes(self) -> int:
+        """Approximate bytes held by cached values"""
+        return self._bytes
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get overall and per-namespace cache statistics"""
+        with self._lock:
+            namespaces = {name: dict(stats) for name, stats in self._namespace_stats.items()}
+            entries, size_bytes = len(self._entries), self._bytes
+
+        totals = {counter: sum(stats[counter] for stats in namespaces.values())
+                  for counter in ("hits", "misses", "sets", "evictions", "expirations", "invalidations")}
+        lookups = totals["hits"] + totals["misses"]
+        for name, stats in namespaces.items():
+            ns_lookups = stats["hits"] + stats["misses"]
+            stats["hit_rate"] = (stats["hits"] / ns_lookups * 100) if ns_lookups else 0.0
+            stats["ttl"] = self.ttl_for(name)
+
+        return {
+            "entries": entries,
+            "bytes": size_bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hit_rate": (totals["hits"] / lookups * 100) if lookups else 0.0,
+            **totals,
+            "namespaces": namespaces
+        }
+
+# Distinguishes "not cached" from a cached None
+_MISSING = object()
+
+class CachedLoader:
+    """Single-flight loader for one cache namespace.
+
+    Concurrent misses for the same key share one in-flight load. With
+    ``stale_ttl`` set, an entry past its TTL is still served for that many
+    extra seconds while a single background load refreshes it.
+    """
+
+    def __init__(self, cache: LRUTTLCache, namespace: str, loader: Callable[..., Awaitable[Any]],
+                 ttl: Optional[float] = None, stale_ttl: float = 0.0):
+        self.cache = cache
+        self.namespace = namespace
+        self.loader = loader
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        self.stats = {
+            "loads": 0,
+            "coalesced": 0,
+            "stale_served": 0,
+            "background_refreshes": 0,
+            "bulk_loads": 0,
+            "bulk_keys": 0,
+            "load_errors": 0
+        }
+
+    @property
+    def fresh_ttl(self) -> float:
+        """Seconds an entry is served without triggering a reload"""
+        return self.cache.ttl_for(self.namespace) if self.ttl is None else self.ttl
+
+    async def get(self, key: Hashable) -> Any:
+        """Return the cached value for ``key``, loading it at most once concurrently"""
+        entry = self.cache.get(self.namespace, key, _MISSING)
+        if entry is not _MISSING:
+            value, fresh_until = entry
+            if time.monotonic() < fresh_until:
+                return value
+            # Stale but within the grace window: serve it and refresh in the background
+            self.stats["stale_served"] += 1
+            if key not in self._in_flight:
+                self.stats["background_refreshes"] += 1
+                self._start_load(key)
+            return value
+
+        task = self._in_flight.get(key)
+        if task is None:
+            task = self._start_load(key)
+        else:
+            self.stats["coalesced"] += 1
+        # Shield so one caller being cancelled does not abort the load for the others
+        return await asyncio.shield(task)
+
+    async def get_many(self, keys: Iterable[Hashable],
+                       bulk_loader: Callable[[List[Hashable]], Awaitable[Dict[Hashable, Any]]]) -> Dict[Hashable, Any]:
+        """Return values for many keys, loading every missing one with a single ``bulk_loader`` call.
+
+        Keys already being loaded are awaited rather than loaded again, and
+        the bulk load registers per-key futures so concurrent ``get`` calls
+        for those keys coalesce onto it.
+        """
+        results, waiting, missing = {}, {}, []
+        now = time.monotonic()
+        for key in dict.fromkeys(keys):
+            entry = self.cache.get(self.namespace, key, _MISSING)
+            if entry is not _MISSING:
+                value, fresh_until = entry
+                results[key] = value
+                if now >= fresh_until:
+                    self.stats["stale_served"] += 1
+                    if key not in self._in_flight:
+                        self.stats["background_refreshes"] += 1
+                        self._start_load(key)
+            elif key in self._in_flight:
+                self.stats["coalesced"] += 1
+                waiting[key] = self._in_flight[key]
+            else:
+                missing.append(key)
+
+        if missing:
+            loop = asyncio.get_running_loop()
+            futures = {key: loop.create_future() for key in missing}
+            self._in_flight.update(futures)
+            self.stats["bulk_loads"] += 1
+            self.stats["bulk_keys"] += len(missing)
+            task = loop.create_task(self._load_many(futures, bulk_loader))
+            task.add_done_callback(self._load_done)
+            # Shield so one caller being cancelled does not abort the load for the others
+            results.update(await asyncio.shield(task))
+
+        if waiting:
+            values = await asyncio.gather(*(asyncio.shield(task) for task in waiting.values()))
+            results.update(zip(waiting, values))
+        return results
+
+    async def _load_many(self, futures: Dict[Hashable, asyncio.Future], bulk_loader) -> Dict[Hashable, Any]:
+        """Run a bulk load, cache each value and resolve the per-key futures"""
+        try:
+            values = await bulk_loader(list(futures))
+        except BaseException as e:
+            self.stats["load_errors"] += 1
+            for key, future in futures.items():
+                if self._in_flight.get(key) is future:
+                    del self._in_flight[key]
+                if isinstance(e, Exception):
+                    future.set_exception(e)
+                    # Mark as retrieved; the error is reported through the bulk task
+                    future.exception()
+                else:
+                    future.cancel()
+            raise
+
+        fresh_ttl = self.fresh_ttl
+        for key, future in futures.items():
+            value = values.get(key)
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+                self.cache.set(self.namespace, key, (value, time.monotonic() + fresh_ttl),
+                               fresh_ttl + self.stale_ttl)
+            future.set_result(value)
+        return {key: values.get(key) for key in futures}
+
+    def _start_load(self, key: Hashable) -> asyncio.Task:
+        """Create the shared load task for a key"""
+        self.stats["loads"] += 1
+        task = asyncio.get_running_loop().create_task(self._load(key))
+        self._in_flight[key] = task
+        task.add_done_callback(self._load_done)
+        return task
+
+    async def _load(self, key: Hashable) -> Any:
+        """Run the loader and cache its result unless the key was invalidated meanwhile"""
+        task = asyncio.current_task()
+        try:
+            value = await self.loader(key)
+        except Exception:
+            self.stats["load_errors"] += 1
+            raise
+        finally:
+            is_current = self._in_flight.get(key) is task
+            if is_current:
+                del self._in_flight[key]
+
+        if is_current:
+            fresh_ttl = self.fresh_ttl
+            self.cache.set(self.namespace, key, (value, time.monotonic() + fresh_ttl),
+                           fresh_ttl + self.stale_ttl)
+        return value
+
+    @staticmethod
+    def _load_done(task: asyncio.Task):
+        """Retrieve background failures so they are logged once instead of warned about"""
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning(f"Cached load failed: {task.exception()}")
+
+    def invalidate(self, key: Hashable):
+        """Drop the cached value and detach any in-flight load so its result is discarded"""
+        self._in_flight.pop(key, None)
+        self.cache.delete(self.namespace, key)
+
+    def invalidate_all(self):
+        """Drop every cached value of this namespace and detach all in-flight loads"""
+        self._in_flight.clear()
+        self.cache.invalidate_namespace(self.namespace)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get loader statistics"""
+        stats = dict(self.stats)
+        stats["in_flight"] = len(self._in_flight)
+        stats["ttl"] = self.fresh_ttl
+        stats["stale_ttl"] = self.stale_ttl
+        return stats
+
+def cached(cache: LRUTTLCache, namespace: str, ttl: Optional[float] = None, stale_ttl: float = 0.0):
+    """Decorator turning ``async def load(key)`` into a single-flight cached loader.
+
+    The wrapped function gains ``invalidate(key)`` and ``loader`` attributes.
+    """
+    def decorator(func):
+        loader = CachedLoader(cache, namespace, func, ttl=ttl, stale_ttl=stale_ttl)
+
+        @wraps(func)
+        async def wrapper(key):
+            return await loader.get(key)
+
+        wrapper.invalidate = loader.invalidate
+        wrapper.loader = loader
+        return wrapper
+    return decorator
@@ -0,0 +1,186 @@
+"""
+Change Feed Module
+Follows the trigger-maintained change_log so caches stay coherent across processes.
+"""
+
+import sqlite3
+import secrets
+import asyncio
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Stamped into change_log.origin by this process's connections
+PROCESS_ORIGIN = secrets.randbits(62)
+
+def install_origin_trigger(conn: sqlite3.Connection) -> bool:
+    """Make change_log rows written on this connection carry PROCESS_ORIGIN; False before migration 10"""
+    columns = [row[1] for row in conn.execute("PRAGMA main.table_info(change_log)")]
+    if "origin" not in columns:
+        return False
+    # A TEMP trigger exists only on this connection, so writers that do not run it
+    # (other tools, older code) still succeed and leave origin NULL
+    conn.execute(f'''
+        CREATE TEMP TRIGGER IF NOT EXISTS trg_change_log_origin
+        AFTER INSERT ON main.change_log
+        WHEN NEW.origin IS NULL
+        BEGIN
+            UPDATE change_log SET origin = {PROCESS_ORIGIN} WHERE seq = NEW.seq;
+        END
+    ''')
+    return True
+
+class ChangeLogWatcher:
+    """Polls ``PRAGMA data_version`` and replays other processes' change_log rows as change events.
+
+    ``data_version`` only moves when another connection commits, so an idle
+    database costs one header check per poll. The pool's connections count as
+    "another", so this process's own writes move it too; their rows carry
+    ``PROCESS_ORIGIN`` and are skipped, since ``_publish_changes`` already ran
+    for them on commit. Remaining rows after the last seen sequence number are
+    published through ``DatabaseManager._publish_changes``. If rows were
+    pruned before being seen, listeners get a ``("*", None)`` reset event instead.
+    """
+
+    def __init__(self, db_manager, poll_interval: float = 1.0, batch_size: int = 5000,
+                 retention: str = "-1 hour", prune_every: int = 300):
+        self.db_manager = db_manager
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.retention = retention
+        self.prune_every = prune_every
+
+        # Dedicated connection: data_version is only meaningful on a single connection
+        self._conn = db_manager.profiler.connect(db_manager.db_path, check_same_thread=False,
+                                                 isolation_level=None)
+        self._conn.execute(f"PRAGMA busy_timeout={int(db_manager.pool.busy_timeout_ms)}")
+        self._data_version = self._read_data_version()
+        self.last_seq = self._read_max_seq()
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {
+            "polls": 0,
+            "version_changes": 0,
+            "events": 0,
+            "own_changes_skipped": 0,
+            "resets": 0,
+            "pruned": 0,
+            "errors": 0
+        }
+
+    def _read_data_version(self) -> int:
+        return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def _read_max_seq(self) -> int:
+        row = self._conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+        return row[0] if row else 0
+
+    def _poll(self) -> Tuple[List[Tuple[str, int]], bool]:
+        """Read unseen change_log rows (runs in a worker thread); returns (changes, reset)"""
+        data_version = self._read_data_version()
+        if data_version == self._data_version:
+            return [], False
+        self._data_version = data_version
+        self.stats["version_changes"] += 1
+
+        changes, reset = [], False
+        start_seq = self.last_seq
+        expected = start_seq + 1
+        while True:
+            rows = self._conn.execute('''
+                SELECT seq, table_name, key, origin FROM change_log
+                WHERE seq > ? ORDER BY seq LIMIT ?
+            ''', (self.last_seq, self.batch_size)).fetchall()
+            if rows and rows[0][0] != expected:
+                # Sequence numbers are contiguous, so a hole means unseen rows were pruned
+                reset = True
+            foreign = [(table, key) for _, table, key, origin in rows if origin != PROCESS_ORIGIN]
+            self.stats["own_changes_skipped"] += len(rows) - len(foreign)
+            changes.extend(foreign)
+            if rows:
+                self.last_seq = rows[-1][0]
+                expected = self.last_seq + 1
+            if len(rows) < self.batch_size:
+                break
+
+        # No rows after last_seq although the sequence moved: they were all pruned
+        if self.last_seq == start_seq and self._read_max_seq() > self.last_seq:
+            reset = True
+            self.last_seq = self._read_max_seq()
+        return changes, reset
+
+    async def poll_once(self) -> int:
+        """Publish change_log rows written by other processes since the last poll; returns the number of events"""
+        loop = asyncio.get_running_loop()
+        changes, reset = await loop.run_in_executor(None, self._poll)
+        self.stats["polls"] += 1
+
+        if reset:
+            self.stats["resets"] += 1
+            logger.warning("change_log rows were pruned before being seen; invalidating all cached data")
+            self.db_manager._publish_reset()
+            return 0
+
+        # Many rows often name the same key (e.g. repeated state updates)
+        unique_changes = list(dict.fromkeys(changes))
+        for table, key in unique_changes:
+            self.db_manager._publish_changes(table, [key])
+        self.stats["events"] += len(unique_changes)
+        return len(unique_changes)
+
+    async def prune(self) -> int:
+        """Delete change_log rows older than the retention window"""
+        def write(conn):
+            cursor = conn.execute("DELETE FROM change_log WHERE changed_at < datetime('now', ?)",
+                                  (self.retention,))
+            return cursor.rowcount
+
+        pruned = await self.db_manager.run_write(write)
+        self.stats["pruned"] += pruned
+        return pruned
+
+    async def _run(self):
+        """Poll until cancelled"""
+        while True:
+            try:
+                await self.poll_once()
+                if self.prune_every and self.stats["polls"] % self.prune_every == 0:
+                    await self.prune()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"Error polling change_log: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    def start(self):
+        """Start polling on the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+            logger.info(f"Change log watcher started (every {self.poll_interval}s from seq {self.last_seq})")
+
+    async def stop(self):
+        """Stop polling and wait for the task to finish"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get watcher statistics"""
+        stats = dict(self.stats)
+        stats["last_seq"] = self.last_seq
+        stats["running"] = self._task is not None and not self._task.done()
+        return stats
+
+    def close(self):
+        """Close the dedicated connection"""
+        if self._task is not None:
+            self._task.cancel()
+        try:
+            self._conn.close()
+        except sqlite3.Error:
+            pass
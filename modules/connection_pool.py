@@ -0,0 +1,183 @@
+"""
+Connection Pool Module
+Provides a bounded pool of long-lived SQLite connections for the Telegram bot.
+"""
+
+import sqlite3
+import queue
+import threading
+import time
+import logging
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, Callable
+
+logger = logging.getLogger(__name__)
+
+class PoolTimeoutError(sqlite3.OperationalError):
+    """Raised when no pooled connection becomes available in time"""
+
+class ConnectionPool:
+    """Bounded pool of pre-configured SQLite connections with checkout/return semantics"""
+
+    def __init__(self, db_path: str, max_connections: int = 5, checkout_timeout: float = 30.0,
+                 busy_timeout_ms: int = 5000, cache_size_kib: int = 8192,
+                 mmap_size_bytes: int = 64 * 1024 * 1024, profiler=None,
+                 on_connect: Optional[Callable[[sqlite3.Connection], None]] = None):
+        self.db_path = db_path
+        self.max_connections = max(1, max_connections)
+        self.checkout_timeout = checkout_timeout
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cache_size_kib = cache_size_kib
+        self.mmap_size_bytes = mmap_size_bytes
+        # Optional SQLProfiler; when set, every connection reports its statements to it
+        self.profiler = profiler
+        # Optional hook run on every new connection after the PRAGMAs (e.g. to register SQL functions)
+        self.on_connect = on_connect
+
+        # LIFO so the most recently used (warmest page cache) connection is reused first
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._all_connections = set()
+        self._closed = False
+        self.stats = {
+            "connections_created": 0,
+            "checkouts": 0,
+            "checkout_waits": 0,
+            "checkout_timeouts": 0,
+            "total_wait_time": 0.0,
+            "max_wait_time": 0.0,
+            "in_use": 0,
+            "peak_in_use": 0
+        }
+
+    def _create_connection(self) -> sqlite3.Connection:
+        """Open and configure a new connection"""
+        connect = self.profiler.connect if self.profiler is not None else sqlite3.connect
+        conn = connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000.0,
+            check_same_thread=False
+        )
+        cursor = conn.cursor()
+        # Only takes effect on a new, empty file and must precede the WAL switch, which
+        # initializes it; existing files need an explicit /admin_storage convert
+        cursor.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        # Negative cache_size is expressed in KiB rather than pages
+        cursor.execute(f"PRAGMA cache_size=-{int(self.cache_size_kib)}")
+        cursor.execute(f"PRAGMA mmap_size={int(self.mmap_size_bytes)}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.close()
+        if self.on_connect is not None:
+            self.on_connect(conn)
+
+        self.stats["connections_created"] += 1
+        logger.debug(f"Opened pooled connection #{self.stats['connections_created']} to {self.db_path}")
+        return conn
+
+    def acquire(self, timeout: Optional[float] = None) -> sqlite3.Connection:
+        """Check a connection out of the pool, opening one if below the limit"""
+        if self._closed:
+            raise sqlite3.ProgrammingError("Connection pool is closed")
+
+        timeout = self.checkout_timeout if timeout is None else timeout
+
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                if len(self._all_connections) < self.max_connections:
+                    conn = self._create_connection()
+                    self._all_connections.add(conn)
+
+            if conn is None:
+                # Pool exhausted, wait for a connection to be returned
+                with self._lock:
+                    self.stats["checkout_waits"] += 1
+                wait_start = time.monotonic()
+                try:
+                    conn = self._idle.get(timeout=timeout)
+                except queue.Empty:
+                    with self._lock:
+                        self.stats["checkout_timeouts"] += 1
+                    raise PoolTimeoutError(
+                        f"No database connection available after {timeout:.1f}s "
+                        f"({self.max_connections} in use)"
+                    )
+                waited = time.monotonic() - wait_start
+                with self._lock:
+                    self.stats["total_wait_time"] += waited
+                    self.stats["max_wait_time"] = max(self.stats["max_wait_time"], waited)
+
+        with self._lock:
+            self.stats["checkouts"] += 1
+            self.stats["in_use"] += 1
+            self.stats["peak_in_use"] = max(self.stats["peak_in_use"], self.stats["in_use"])
+        return conn
+
+    def release(self, conn: sqlite3.Connection):
+        """Return a connection to the pool"""
+        with self._lock:
+            self.stats["in_use"] -= 1
+
+        try:
+            if conn.in_transaction:
+                # Never hand out a connection with a dangling transaction
+                conn.rollback()
+        except sqlite3.Error as e:
+            logger.warning(f"Discarding broken pooled connection: {e}")
+            self._discard(conn)
+            return
+
+        if self._closed:
+            self._discard(conn)
+        else:
+            self._idle.put(conn)
+
+    def _discard(self, conn: sqlite3.Connection):
+        """Close a connection and forget about it"""
+        with self._lock:
+            self._all_connections.discard(conn)
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        """Check out a connection for the duration of a transaction block.
+
+        Commits on success and rolls back on error, like ``with sqlite3.connect(...)``.
+        """
+        conn = self.acquire(timeout)
+        try:
+            with conn:
+                yield conn
+        finally:
+            self.release(conn)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get pool usage statistics"""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["open_connections"] = len(self._all_connections)
+        stats["idle"] = self._idle.qsize()
+        stats["max_connections"] = self.max_connections
+        stats["avg_wait_time"] = (
+            stats["total_wait_time"] / stats["checkout_waits"] if stats["checkout_waits"] else 0.0
+        )
+        return stats
+
+    def close(self):
+        """Close all idle connections; connections in use are closed when returned"""
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+        logger.info("Connection pool closed")
@@ -0,0 +1,136 @@
+"""
+Counters Module
+Compact in-memory structures for analytics: per-user action rings and decaying counters.
+"""
+
+import sys
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+class ActionRing:
+    """The last ``capacity`` (action code, timestamp) pairs of one user.
+
+    Codes and timestamps live in two flat arrays that grow up to ``capacity``
+    and are then overwritten in place, oldest first.
+    """
+
+    __slots__ = ("codes", "times", "head", "capacity")
+
+    def __init__(self, capacity: int):
+        self.codes = array("I")
+        self.times = array("d")
+        # Index of the oldest entry once the ring is full
+        self.head = 0
+        self.capacity = max(1, capacity)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def append(self, code: int, timestamp: float):
+        """Record an action, overwriting the oldest one when full"""
+        if len(self.codes) < self.capacity:
+            self.codes.append(code)
+            self.times.append(timestamp)
+        else:
+            self.codes[self.head] = code
+            self.times[self.head] = timestamp
+            self.head = (self.head + 1) % self.capacity
+
+    def items(self, limit: Optional[int] = None) -> List[Tuple[int, float]]:
+        """(code, timestamp) pairs oldest first, only the newest ``limit`` when given"""
+        size = len(self.codes)
+        start = 0 if limit is None else max(0, size - limit)
+        return [(self.codes[(self.head + i) % size], self.times[(self.head + i) % size])
+                for i in range(start, size)]
+
+    def last_time(self) -> float:
+        """Timestamp of the newest action (0.0 when empty)"""
+        if not self.codes:
+            return 0.0
+        return self.times[(self.head - 1) % len(self.codes)]
+
+    def nbytes(self) -> int:
+        """Bytes held by this ring and its arrays"""
+        return sys.getsizeof(self) + sys.getsizeof(self.codes) + sys.getsizeof(self.times)
+
+class DecayingCounter:
+    """Named counters that lose half their value every ``half_life`` seconds.
+
+    Each name keeps (value, last update) and is decayed lazily when touched
+    or read. With ``half_life=None`` the counters are plain running totals.
+    Names that decay below ``floor`` are dropped, and at most ``max_keys``
+    names are kept (the smallest are evicted first).
+    """
+
+    def __init__(self, half_life: Optional[float] = None, max_keys: int = 500, floor: float = 0.01):
+        self.half_life = half_life
+        self.max_keys = max_keys
+        self.floor = floor
+        self._values: Dict[str, Tuple[float, float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def _decay(self, value: float, since: float, now: float) -> float:
+        if self.half_life is None or now <= since:
+            return value
+        return value * 0.5 ** ((now - since) / self.half_life)
+
+    def add(self, name: str, amount: float = 1.0, now: Optional[float] = None):
+        """Decay a counter to ``now`` and add ``amount`` to it"""
+        now = time.time() if now is None else now
+        value, since = self._values.get(name, (0.0, now))
+        self._values[name] = (self._decay(value, since, now) + amount, now)
+        if len(self._values) > self.max_keys:
+            self._evict(now)
+
+    def merge(self, name: str, value: float, since: float, now: Optional[float] = None):
+        """Add a value recorded at ``since`` (e.g. from a checkpoint), decayed to ``now``"""
+        now = time.time() if now is None else now
+        self.add(name, self._decay(value, since, now), now)
+
+    def get(self, name: str, now: Optional[float] = None) -> float:
+        """Current value of one counter"""
+        if name not in self._values:
+            return 0.0
+        value, since = self._values[name]
+        return self._decay(value, since, time.time() if now is None else now)
+
+    def snapshot(self, now: Optional[float] = None, digits: int = 2) -> Dict[str, float]:
+        """Current values of every counter, largest first"""
+        now = time.time() if now is None else now
+        values = {name: round(self._decay(value, since, now), digits)
+                  for name, (value, since) in self._values.items()}
+        return dict(sorted(values.items(), key=lambda item: item[1], reverse=True))
+
+    def entries(self) -> List[Tuple[str, float, float]]:
+        """Raw (name, value, last update) triples for checkpointing"""
+        return [(name, value, since) for name, (value, since) in self._values.items()]
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """Drop counters that have decayed below ``floor``; returns how many were dropped"""
+        now = time.time() if now is None else now
+        stale = [name for name, (value, since) in self._values.items()
+                 if self._decay(value, since, now) < self.floor]
+        for name in stale:
+            del self._values[name]
+        return len(stale)
+
+    def _evict(self, now: float):
+        """Prune, then drop the smallest counters down to 90% of ``max_keys``"""
+        self.prune(now)
+        if len(self._values) <= self.max_keys:
+            return
+        # Evicting a tenth at once keeps the sort off the per-event path
+        excess = len(self._values) - int(self.max_keys * 0.9)
+        if excess > 0:
+            smallest = sorted(self._values, key=lambda name: self.get(name, now))[:excess]
+            for name in smallest:
+                del self._values[name]
+
+    def nbytes(self) -> int:
+        """Approximate bytes held by the counters"""
+        # Each entry is a name and a tuple of two floats
+        entry = sys.getsizeof((0.0, 0.0)) + 2 * sys.getsizeof(0.0)
+        return sys.getsizeof(self._values) + sum(sys.getsizeof(name) + entry for name in self._values)
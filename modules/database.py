@@ -4,187 +4,182 @@ Handles all database operations for the Telegram bot.
 """
 
 import sqlite3
+import time
 import json
 import logging
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Callable, Iterable
 from datetime import datetime, timedelta
+from modules.connection_pool import ConnectionPool
+from modules.db_executor import DatabaseExecutor
+from modules.write_behind import WriteBehindQueue
+from modules.migrations import SchemaMigrator
+from modules.change_feed import ChangeLogWatcher, install_origin_trigger
+from modules.latency import LatencyTracker
+from modules.sql_profiler import SQLProfiler
+from modules.maintenance import MaintenanceScheduler
+from modules.introspection import DatabaseIntrospector
+from modules.rollups import RollupManager
+from modules.engagement import event_exponent, event_exponent_sql, current_score, register_sql_functions
 
 logger = logging.getLogger(__name__)
 
 class DatabaseManager:
-    def __init__(self, db_path: str = "bot_database.db"):
+    def __init__(self, db_path: str = "bot_database.db", reader_threads: int = 4,
+                 query_timeout: Optional[float] = 30.0, write_flush_interval: float = 0.5,
+                 write_batch_size: int = 200):
         self.db_path = db_path
+        # Per-statement timing, rows and VM steps, grouped by normalized SQL
+        self.profiler = SQLProfiler()
+        # One connection per reader thread plus one for the writer thread
+        self.pool = ConnectionPool(db_path, max_connections=reader_threads + 1,
+                                   profiler=self.profiler, on_connect=self._configure_connection)
+        # Latency of every database call (and of anything else timed against this tracker)
+        self.latency = LatencyTracker()
+        self.executor = DatabaseExecutor(self.pool, reader_threads=reader_threads,
+                                         default_timeout=query_timeout, latency=self.latency)
+        # Message logging is group-committed instead of one transaction per message
+        self.write_queue = WriteBehindQueue(self.executor, flush_interval=write_flush_interval,
+                                            max_batch_size=write_batch_size)
+        self.migrator = SchemaMigrator()
+        # Callbacks notified with (table, key) after writes commit
+        self._change_listeners: List[Callable[[str, Any], None]] = []
+        self.change_watcher: Optional[ChangeLogWatcher] = None
+        self.maintenance = MaintenanceScheduler(self)
+        self.introspector = DatabaseIntrospector(self)
+        self.rollups = RollupManager(self)
         self.init_database()
+
+    def _configure_connection(self, conn: sqlite3.Connection):
+        """Per-connection setup run by the pool on every new connection"""
+        register_sql_functions(conn)
+        install_origin_trigger(conn)
+
+    def _connection(self):
+        """Check out a pooled connection (commits on success, rolls back on error)"""
+        return self.pool.connection()
+
+    async def run_read(self, fn, *args, timeout: Optional[float] = None, **kwargs):
+        """Run ``fn(conn, *args, **kwargs)`` on a reader thread and await the result"""
+        return await self.executor.run_read(fn, *args, timeout=timeout, **kwargs)
+
+    async def run_write(self, fn, *args, timeout: Optional[float] = None, **kwargs):
+        """Run ``fn(conn, *args, **kwargs)`` in a transaction on the writer thread"""
+        return await self.executor.run_write(fn, *args, timeout=timeout, **kwargs)
+
+    def add_change_listener(self, listener: Callable[[str, Any], None]):
+        """Subscribe to (table, user_id) change events published after each committed write"""
+        if listener not in self._change_listeners:
+            self._change_listeners.append(listener)
+    
+    def remove_change_listener(self, listener: Callable[[str, Any], None]):
+        """Unsubscribe a change listener"""
+        if listener in self._change_listeners:
+            self._change_listeners.remove(listener)
+    
+    def _publish_changes(self, table: str, keys: Iterable[Any]):
+        """Notify listeners that rows for the given keys changed in a table"""
+        for key in keys:
+            if key is None:
+                continue
+            for listener in list(self._change_listeners):
+                try:
+                    listener(table, key)
+                except Exception as e:
+                    logger.error(f"Change listener failed for {table}:{key}: {e}")
+    
+    def _publish_reset(self):
+        """Tell listeners that any cached data may be stale (key None, table "*")"""
+        for listener in list(self._change_listeners):
+            try:
+                listener("*", None)
+            except Exception as e:
+                logger.error(f"Change listener failed on reset: {e}")
+    
+    async def start_change_watcher(self, poll_interval: float = 1.0) -> ChangeLogWatcher:
+        """Follow change_log so writes from other processes reach the change listeners"""
+        if self.change_watcher is None:
+            self.change_watcher = ChangeLogWatcher(self, poll_interval=poll_interval)
+        self.change_watcher.start()
+        return self.change_watcher
     
+    async def stop_change_watcher(self):
+        """Stop following change_log"""
+        if self.change_watcher is not None:
+            await self.change_watcher.stop()
+    
+    async def start_maintenance(self, interval: float = 60.0) -> MaintenanceScheduler:
+        """Run incremental vacuum and PRAGMA optimize in the background during quiet periods"""
+        self.maintenance.interval = interval
+        self.maintenance.start()
+        return self.maintenance
+    
+    async def stop_maintenance(self):
+        """Stop background maintenance"""
+        await self.maintenance.stop()
+    
+    async def start_introspection(self) -> DatabaseIntrospector:
+        """Keep table sizes and exact row counts fresh in the background"""
+        self.introspector.start()
+        return self.introspector
+    
+    async def stop_introspection(self):
+        """Stop refreshing table statistics"""
+        await self.introspector.stop()
+    
+    async def start_rollups(self, interval: float = 60.0) -> RollupManager:
+        """Keep daily_stats rolled up from new rows in the background"""
+        self.rollups.interval = interval
+        self.rollups.start()
+        return self.rollups
+    
+    async def stop_rollups(self):
+        """Stop rolling up daily_stats"""
+        await self.rollups.stop()
+    
+    async def flush_writes(self) -> int:
+        """Write all buffered (write-behind) rows and wait for the commit"""
+        return await self.write_queue.flush()
+
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """Get connection pool, executor and write-behind statistics"""
+        stats = self.pool.get_stats()
+        stats["executor"] = self.executor.get_stats()
+        stats["write_behind"] = self.write_queue.get_stats()
+        if self.change_watcher is not None:
+            stats["change_watcher"] = self.change_watcher.get_stats()
+        stats["profiler"] = self.profiler.get_stats()
+        stats["maintenance"] = self.maintenance.get_stats()
+        stats["introspection"] = self.introspector.get_stats()
+        stats["rollups"] = self.rollups.get_stats()
+        return stats
+
+    def get_query_profile(self, limit: int = 10, order_by: str = "total_time") -> List[Dict[str, Any]]:
+        """Top SQL fingerprints by total_time, max_time, avg_time, calls, rows or vm_steps"""
+        return self.profiler.top(limit, order_by)
+
+    def close(self):
+        """Flush buffered writes, wait for queued database work, then close all pooled connections"""
+        if self.change_watcher is not None:
+            self.change_watcher.close()
+        self.maintenance.close()
+        self.introspector.close()
+        self.rollups.close()
+        self.write_queue.close()
+        self.executor.shutdown(wait=True)
+        self.pool.close()
+
     def init_database(self):
-        """Initialize database tables"""
+        """Bring the database schema up to date (no DDL when it is already current)"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-            
-            # Users table - Main user information
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS users (
-                    user_id INTEGER PRIMARY KEY,
-                    username TEXT,
-                    first_name TEXT,
-                    last_name TEXT,
-                    language TEXT DEFAULT 'ru',
-                    city TEXT,
-                    timezone TEXT,
-                    timezone_offset TEXT,
-                    timezone_name TEXT,
-                    messaging_enabled BOOLEAN DEFAULT TRUE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # User states table - Current state and temporary data
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS user_states (
-                    user_id INTEGER PRIMARY KEY,
-                    current_state TEXT,
-                    state_data TEXT,
-                    onboarding_step INTEGER DEFAULT 0,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (user_id)
-                )
-            ''')
+            with self._connection() as conn:
+                applied = self.migrator.migrate(conn)
+                # This connection was opened before change_log.origin may have existed
+                install_origin_trigger(conn)
             
-            # User messages table - All messages from users
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS user_messages (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    message_text TEXT,
-                    message_type TEXT DEFAULT 'text',
-                    module_context TEXT,
-                    state_context TEXT,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (user_id)
-                )
-            ''')
-            
-            # Bot messages table - All messages sent by bot
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS bot_messages (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    message_text TEXT,
-                    message_type TEXT DEFAULT 'text',
-                    module_context TEXT,
-                    state_context TEXT,
-                    sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (user_id)
-                )
-            ''')
-            
-            # User preferences table - Detailed user preferences
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS user_preferences (
-                    user_id INTEGER PRIMARY KEY,
-                    key_texts TEXT,
-                    content_preferences TEXT,
-                    delivery_preferences TEXT,
-                    communication_preferences TEXT,
-                    goals TEXT,
-                    challenges TEXT,
-                    setup_completed BOOLEAN DEFAULT FALSE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (user_id)
-                )
-            ''')
-            
-            # Subscriptions table - Subscription management (goal-oriented)
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS subscriptions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    order_id TEXT UNIQUE,
-                    user_goal TEXT,
-                    subscription_type TEXT,
-                    plan_name TEXT,
-                    plan_price TEXT,
-                    plan_duration TEXT,
-                    plan_approach TEXT,
-                    plan_result_time TEXT,
-                    status TEXT DEFAULT 'pending_payment',
-                    start_date TIMESTAMP,
-                    end_date TIMESTAMP,
-                    payment_id TEXT,
-                    payment_method TEXT,
-                    auto_renewal BOOLEAN DEFAULT FALSE,
-                    goal_achieved BOOLEAN DEFAULT FALSE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (user_id)
-                )
-            ''')
-            
-            # Content delivery table - All content sent to users
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS content_delivery (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    order_id TEXT,
-                    content_type TEXT,
-                    content_text TEXT,
-                    delivery_method TEXT DEFAULT 'telegram',
-                    delivery_status TEXT DEFAULT 'sent',
-                    iteration_number INTEGER,
-                    feedback TEXT,
-                    feedback_rating INTEGER,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    delivered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (user_id),
-                    FOREIGN KEY (order_id) REFERENCES subscriptions (order_id)
-                )
-            ''')
-            
-            # User sessions table - Track user interaction sessions
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS user_sessions (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    session_start TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    session_end TIMESTAMP,
-                    messages_count INTEGER DEFAULT 0,
-                    modules_used TEXT,
-                    session_data TEXT,
-                    FOREIGN KEY (user_id) REFERENCES users (user_id)
-                )
-            ''')
-            
-            # User feedback table - Store all user feedback
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS user_feedback (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER,
-                    feedback_type TEXT,
-                    feedback_text TEXT,
-                    rating INTEGER,
-                    content_id INTEGER,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (user_id) REFERENCES users (user_id),
-                    FOREIGN KEY (content_id) REFERENCES content_delivery (id)
-                )
-            ''')
-            
-            # Create indexes for better performance
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_messages_user_id ON user_messages(user_id)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_messages_created_at ON user_messages(created_at)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_bot_messages_user_id ON bot_messages(user_id)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_bot_messages_sent_at ON bot_messages(sent_at)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_content_delivery_user_id ON content_delivery(user_id)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_content_delivery_delivered_at ON content_delivery(delivered_at)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_sessions_user_id ON user_sessions(user_id)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_feedback_user_id ON user_feedback(user_id)')
-            
-            conn.commit()
-            logger.info("Database initialized successfully with enhanced structure")
+            if applied:
+                logger.info(f"Database migrated to schema version {applied[-1]} (applied {applied})")
+            else:
+                logger.debug(f"Database schema is current (version {self.migrator.latest_version})")
             
         except sqlite3.Error as e:
             logger.error(f"Database initialization error: {e}")
@@ -195,14 +190,20 @@ class DatabaseManager:
     
     async def initialize_user(self, user_id: int, username: str, first_name: str = None, last_name: str = None):
         """Initialize a new user in the database"""
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
+        def write(conn):
+            cursor = conn.cursor()
             
-            # Insert or update user
+            # Insert or update user; an upsert keeps created_at (and the rest of the row), so
+            # returning users are not counted as new again by the rollups
             cursor.execute('''
-                INSERT OR REPLACE INTO users (user_id, username, first_name, last_name, updated_at, last_activity)
+                INSERT INTO users (user_id, username, first_name, last_name, updated_at, last_activity)
                 VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+                ON CONFLICT (user_id) DO UPDATE SET
+                    username = excluded.username,
+                    first_name = excluded.first_name,
+                    last_name = excluded.last_name,
+                    updated_at = CURRENT_TIMESTAMP,
+                    last_activity = CURRENT_TIMESTAMP
             ''', (user_id, username, first_name, last_name))
             
             # Initialize user state
@@ -216,8 +217,11 @@ class DatabaseManager:
                 INSERT OR IGNORE INTO user_preferences (user_id, setup_completed)
                 VALUES (?, FALSE)
             ''', (user_id,))
-            
-            conn.commit()
+        
+        try:
+            await self.run_write(write)
+            for table in ('users', 'user_states', 'user_preferences'):
+                self._publish_changes(table, [user_id])
             logger.info(f"User {user_id} initialized with enhanced structure")
             
         except sqlite3.Error as e:
@@ -229,66 +233,228 @@ class DatabaseManager:
     
     async def get_user_state(self, user_id: int) -> Optional[str]:
         """Get user's current state"""
-        with sqlite3.connect(self.db_path) as conn:
+        def query(conn):
             cursor = conn.cursor()
             cursor.execute('SELECT current_state FROM user_states WHERE user_id = ?', (user_id,))
             result = cursor.fetchone()
             return result[0] if result else None
+        return await self.run_read(query)
     
     async def set_user_state(self, user_id: int, state: str, state_data: Dict[str, Any] = None):
         """Set user's current state"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            data_json = json.dumps(state_data or {})
-            cursor.execute('''
+        data_json = json.dumps(state_data or {})
+        def write(conn):
+            conn.execute('''
                 INSERT OR REPLACE INTO user_states (user_id, current_state, state_data, updated_at)
                 VALUES (?, ?, ?, CURRENT_TIMESTAMP)
             ''', (user_id, state, data_json))
-            conn.commit()
+        await self.run_write(write)
+        self._publish_changes('user_states', [user_id])
     
     async def get_user_state_data(self, user_id: int) -> Dict[str, Any]:
         """Get user's state data"""
-        with sqlite3.connect(self.db_path) as conn:
+        def query(conn):
             cursor = conn.cursor()
             cursor.execute('SELECT state_data FROM user_states WHERE user_id = ?', (user_id,))
             result = cursor.fetchone()
             if result and result[0]:
                 return json.loads(result[0])
             return {}
+        return await self.run_read(query)
+    
+    async def get_user_state_data_many(self, user_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        """Get state data for many users in one query ({} for users without a state)"""
+        requested = {str(user_id): user_id for user_id in user_ids}
+        if not requested:
+            return {}
+        
+        def query(conn):
+            cursor = conn.cursor()
+            # json_each keeps the statement (and its plan) the same for any number of ids
+            cursor.execute('''
+                SELECT user_id, state_data FROM user_states
+                WHERE user_id IN (SELECT value FROM json_each(?))
+            ''', (json.dumps(list(requested)),))
+            return cursor.fetchall()
+        
+        states = {user_id: {} for user_id in requested.values()}
+        for user_id, state_data in await self.run_read(query):
+            if state_data and str(user_id) in requested:
+                states[requested[str(user_id)]] = json.loads(state_data)
+        return states
+    
+    async def get_recently_active_user_ids(self, hours: float = 24, limit: int = 5000) -> List[int]:
+        """Users active within the last ``hours``, most recent first"""
+        def query(conn):
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT user_id FROM users
+                WHERE last_activity >= datetime('now', ?)
+                ORDER BY last_activity DESC LIMIT ?
+            ''', (f"-{hours} hours", limit))
+            return [row[0] for row in cursor.fetchall()]
+        return await self.run_read(query)
+    
+    async def get_user_profiles_many(self, user_ids: Iterable[int]) -> Dict[int, Optional[Dict[str, Any]]]:
+        """Get profiles for many users in one query (None for unknown users)"""
+        requested = {str(user_id): user_id for user_id in user_ids}
+        if not requested:
+            return {}
+        
+        def query(conn):
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT * FROM users WHERE user_id IN (SELECT value FROM json_each(?))
+            ''', (json.dumps(list(requested)),))
+            columns = [description[0] for description in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        
+        profiles = {user_id: None for user_id in requested.values()}
+        for profile in await self.run_read(query):
+            if str(profile["user_id"]) in requested:
+                profiles[requested[str(profile["user_id"])]] = profile
+        return profiles
+    
+    async def get_active_subscriptions_many(self, user_ids: Iterable[int]) -> Dict[int, Optional[Dict[str, Any]]]:
+        """Get the active subscription of many users in one query (None when there is none)"""
+        requested = {str(user_id): user_id for user_id in user_ids}
+        if not requested:
+            return {}
+        
+        def query(conn):
+            cursor = conn.cursor()
+            # Same pick as get_active_subscription: the newest active, unexpired subscription
+            cursor.execute('''
+                SELECT s.* FROM json_each(?) AS ids
+                JOIN subscriptions s ON s.id = (
+                    SELECT id FROM subscriptions
+                    WHERE user_id = ids.value AND status = 'active' AND end_date > CURRENT_TIMESTAMP
+                    ORDER BY created_at DESC LIMIT 1
+                )
+            ''', (json.dumps(list(requested)),))
+            columns = [description[0] for description in cursor.description]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        
+        subscriptions = {user_id: None for user_id in requested.values()}
+        for subscription in await self.run_read(query):
+            if str(subscription["user_id"]) in requested:
+                subscriptions[requested[str(subscription["user_id"])]] = subscription
+        return subscriptions
     
     async def update_user_state_data(self, user_id: int, data: Dict[str, Any]):
         """Update user's state data"""
-        current_data = await self.get_user_state_data(user_id)
-        current_data.update(data)
-        await self.set_user_state(user_id, await self.get_user_state(user_id), current_data)
-    
+        await self.patch_user_state_data(user_id, data, return_document=False)
+
+    @staticmethod
+    def _state_patch_sql(keys: List[str], deep: bool) -> str:
+        """Build the upsert that merges a patch into user_states.state_data.
+
+        Shallow patches replace top-level keys like ``dict.update`` (via ``json_set``);
+        deep patches follow RFC 7396 merge-patch semantics (via ``json_patch``).
+        """
+        current = "CASE WHEN json_valid(state_data) THEN state_data ELSE '{}' END"
+        if deep:
+            merged = f"json_patch({current}, json(?))"
+        else:
+            for key in keys:
+                if '"' in key:
+                    raise ValueError(f"Unsupported state data key: {key!r}")
+            paths = ", ".join(f"'$.\"{key}\"', json(?)" for key in keys)
+            merged = f"json_set({current}, {paths})"
+        return f'''
+            INSERT INTO user_states (user_id, state_data, updated_at)
+            VALUES (?, json(?), CURRENT_TIMESTAMP)
+            ON CONFLICT(user_id) DO UPDATE SET
+                state_data = {merged},
+                updated_at = CURRENT_TIMESTAMP
+        '''
+
+    @staticmethod
+    def _state_patch_params(user_id: int, patch: Dict[str, Any], deep: bool) -> tuple:
+        """Parameters matching _state_patch_sql for one user"""
+        if deep:
+            return (user_id, json.dumps(patch), json.dumps(patch))
+        return (user_id, json.dumps(patch)) + tuple(json.dumps(value) for value in patch.values())
+
+    async def patch_user_state_data(self, user_id: int, patch: Dict[str, Any], deep: bool = False,
+                                    return_document: bool = True) -> Optional[Dict[str, Any]]:
+        """Atomically merge a partial dict into the user's state data in one UPDATE.
+
+        Creates the state row if missing. Returns the resulting document when requested.
+        """
+        if not patch:
+            return await self.get_user_state_data(user_id) if return_document else None
+
+        sql = self._state_patch_sql(list(patch.keys()), deep)
+        params = self._state_patch_params(user_id, patch, deep)
+
+        def write(conn):
+            cursor = conn.cursor()
+            cursor.execute(sql, params)
+            if return_document:
+                # Same transaction on the single writer thread, so no other update can interleave
+                cursor.execute('SELECT state_data FROM user_states WHERE user_id = ?', (user_id,))
+                result = cursor.fetchone()
+                return json.loads(result[0]) if result and result[0] else {}
+            return None
+
+        document = await self.run_write(write)
+        self._publish_changes('user_states', [user_id])
+        return document
+
+    async def patch_user_state_data_many(self, patches: Dict[int, Dict[str, Any]], deep: bool = False) -> int:
+        """Apply state data patches for many users in a single transaction"""
+        # Group users whose patches touch the same keys so each group is one executemany
+        groups: Dict[tuple, List[tuple]] = {}
+        for user_id, patch in patches.items():
+            if not patch:
+                continue
+            keys = tuple(patch.keys())
+            groups.setdefault(keys, []).append(self._state_patch_params(user_id, patch, deep))
+
+        if not groups:
+            return 0
+
+        statements = [(self._state_patch_sql(list(keys), deep), rows) for keys, rows in groups.items()]
+
+        def write(conn):
+            cursor = conn.cursor()
+            for sql, rows in statements:
+                cursor.executemany(sql, rows)
+            return sum(len(rows) for _, rows in statements)
+
+        updated = await self.run_write(write)
+        self._publish_changes('user_states', [user_id for user_id, patch in patches.items() if patch])
+        logger.info(f"Patched state data for {updated} users")
+        return updated
+
     async def create_subscription(self, user_id: int, subscription_type: str, payment_id: str = None) -> int:
         """Create a new subscription"""
-        with sqlite3.connect(self.db_path) as conn:
+        # Calculate end date based on subscription type
+        start_date = datetime.now()
+        if subscription_type == "extreme":
+            end_date = start_date + timedelta(days=30)
+        elif subscription_type == "2week":
+            end_date = start_date + timedelta(days=14)
+        else:  # regular
+            end_date = start_date + timedelta(days=7)
+        
+        def write(conn):
             cursor = conn.cursor()
-            
-            # Calculate end date based on subscription type
-            start_date = datetime.now()
-            if subscription_type == "extreme":
-                end_date = start_date + timedelta(days=30)
-            elif subscription_type == "2week":
-                end_date = start_date + timedelta(days=14)
-            else:  # regular
-                end_date = start_date + timedelta(days=7)
-            
             cursor.execute('''
                 INSERT INTO subscriptions (user_id, subscription_type, status, start_date, end_date, payment_id)
                 VALUES (?, ?, 'active', ?, ?, ?)
             ''', (user_id, subscription_type, start_date, end_date, payment_id))
-            
-            subscription_id = cursor.lastrowid
-            conn.commit()
-            logger.info(f"Subscription created for user {user_id}: {subscription_type}")
-            return subscription_id
+            return cursor.lastrowid
+        
+        subscription_id = await self.run_write(write)
+        self._publish_changes('subscriptions', [user_id])
+        logger.info(f"Subscription created for user {user_id}: {subscription_type}")
+        return subscription_id
     
     async def get_active_subscription(self, user_id: int) -> Optional[Dict[str, Any]]:
         """Get user's active subscription"""
-        with sqlite3.connect(self.db_path) as conn:
+        def query(conn):
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT * FROM subscriptions 
@@ -301,26 +467,26 @@ class DatabaseManager:
                 columns = [description[0] for description in cursor.description]
                 return dict(zip(columns, result))
             return None
+        return await self.run_read(query)
     
     async def update_user_settings(self, user_id: int, key_texts: List[str], preferences: Dict[str, Any] = None):
         """Update user's settings and key texts"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            
-            key_texts_json = json.dumps(key_texts)
-            preferences_json = json.dumps(preferences or {})
-            
-            cursor.execute('''
+        key_texts_json = json.dumps(key_texts)
+        preferences_json = json.dumps(preferences or {})
+        
+        def write(conn):
+            conn.execute('''
                 INSERT OR REPLACE INTO user_settings (user_id, key_texts, preferences, setup_completed, updated_at)
                 VALUES (?, ?, ?, TRUE, CURRENT_TIMESTAMP)
             ''', (user_id, key_texts_json, preferences_json))
-            
-            conn.commit()
-            logger.info(f"User settings updated for user {user_id}")
+        
+        await self.run_write(write)
+        self._publish_changes('user_settings', [user_id])
+        logger.info(f"User settings updated for user {user_id}")
     
     async def get_user_settings(self, user_id: int) -> Optional[Dict[str, Any]]:
         """Get user's settings"""
-        with sqlite3.connect(self.db_path) as conn:
+        def query(conn):
             cursor = conn.cursor()
             cursor.execute('SELECT * FROM user_settings WHERE user_id = ?', (user_id,))
             result = cursor.fetchone()
@@ -335,20 +501,20 @@ class DatabaseManager:
                     data['preferences'] = json.loads(data['preferences'])
                 return data
             return None
+        return await self.run_read(query)
     
     async def log_iteration(self, user_id: int, iteration_number: int, content: str, status: str = "sent"):
         """Log an iteration sent to user"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
+        def write(conn):
+            conn.execute('''
                 INSERT INTO iterations (user_id, iteration_number, content, sent_at, status)
                 VALUES (?, ?, ?, CURRENT_TIMESTAMP, ?)
             ''', (user_id, iteration_number, content, status))
-            conn.commit()
+        await self.run_write(write)
     
     async def get_user_iterations(self, user_id: int) -> List[Dict[str, Any]]:
         """Get user's iteration history"""
-        with sqlite3.connect(self.db_path) as conn:
+        def query(conn):
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT * FROM content_delivery WHERE user_id = ? ORDER BY delivered_at DESC
@@ -357,82 +523,311 @@ class DatabaseManager:
             results = cursor.fetchall()
             columns = [description[0] for description in cursor.description]
             return [dict(zip(columns, row)) for row in results]
+        return await self.run_read(query)
     
     # New methods for enhanced user data management
     
+    @staticmethod
+    def _db_timestamp() -> str:
+        """Current UTC time in the same format as SQLite's CURRENT_TIMESTAMP"""
+        return datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+    
     async def store_user_message(self, user_id: int, message_text: str, message_type: str = "text", 
                                 module_context: str = None, state_context: str = None):
-        """Store a message from user"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO user_messages (user_id, message_text, message_type, module_context, state_context)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (user_id, message_text, message_type, module_context, state_context))
-            
-            # Update user's last activity
-            cursor.execute('''
-                UPDATE users SET last_activity = CURRENT_TIMESTAMP WHERE user_id = ?
-            ''', (user_id,))
-            
-            conn.commit()
-            logger.info(f"Stored user message from {user_id}")
+        """Store a message from user (buffered and group-committed)"""
+        now = self._db_timestamp()
+        self.write_queue.append('''
+            INSERT INTO user_messages (user_id, message_text, message_type, module_context, state_context, created_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (user_id, message_text, message_type, module_context, state_context, now))
+        
+        # Update user's last activity; repeated updates for a user collapse into one
+        backlog = self.write_queue.merge('''
+            UPDATE users SET last_activity = ? WHERE user_id = ?
+        ''', user_id, (now, user_id))
+        
+        if backlog:
+            await self.write_queue.flush()
+        logger.debug(f"Queued user message from {user_id}")
     
     async def store_bot_message(self, user_id: int, message_text: str, message_type: str = "text",
                                module_context: str = None, state_context: str = None):
-        """Store a message sent by bot"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                INSERT INTO bot_messages (user_id, message_text, message_type, module_context, state_context)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (user_id, message_text, message_type, module_context, state_context))
-            
-            conn.commit()
-            logger.info(f"Stored bot message to {user_id}")
+        """Store a message sent by bot (buffered and group-committed)"""
+        backlog = self.write_queue.append('''
+            INSERT INTO bot_messages (user_id, message_text, message_type, module_context, state_context, sent_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (user_id, message_text, message_type, module_context, state_context, self._db_timestamp()))
+        
+        if backlog:
+            await self.write_queue.flush()
+        logger.debug(f"Queued bot message to {user_id}")
     
-    async def get_user_messages(self, user_id: int, limit: int = 100) -> List[Dict[str, Any]]:
-        """Get user's message history"""
-        with sqlite3.connect(self.db_path) as conn:
+    # Kinds of rows stored in analytics_events
+    ANALYTICS_EVENT_KINDS = ('action', 'conversion', 'feature')
+    
+    async def store_analytics_event(self, user_id: int, event_kind: str, name: str, value: Any = None,
+                                    details: Dict[str, Any] = None):
+        """Store a tracked analytics event (buffered and group-committed)"""
+        if event_kind not in self.ANALYTICS_EVENT_KINDS:
+            raise ValueError(f"Unknown analytics event kind: {event_kind}")
+        if isinstance(value, (dict, list)):
+            value = json.dumps(value)
+        now = self._db_timestamp()
+        self.write_queue.append('''
+            INSERT INTO analytics_events (user_id, event_kind, name, value, details, ts)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (user_id, event_kind, name, value, json.dumps(details) if details else None, now))
+        
+        # One more event's weight on the user's forward-decayed engagement score
+        self.write_queue.append('''
+            UPDATE users SET engagement_log = logaddexp2(engagement_log, ?) WHERE user_id = ?
+        ''', (event_exponent(), user_id))
+        
+        # Tracked events count as user activity, as they did when stored as messages
+        backlog = self.write_queue.merge('''
+            UPDATE users SET last_activity = ? WHERE user_id = ?
+        ''', user_id, (now, user_id))
+        
+        if backlog:
+            await self.write_queue.flush()
+        logger.debug(f"Queued {event_kind} event '{name}' for {user_id}")
+    
+    async def get_user_event_summary(self, user_id: int) -> List[Dict[str, Any]]:
+        """Per (event_kind, name) counts, last occurrence and recency for a user.
+
+        ``within_1d``/``within_7d``/``within_30d`` are cumulative (events less
+        than 1, 7 and 30 days old); ``older`` counts the rest.
+        """
+        await self.write_queue.flush()
+        def query(conn):
             cursor = conn.cursor()
             cursor.execute('''
-                SELECT * FROM user_messages WHERE user_id = ? 
-                ORDER BY created_at DESC LIMIT ?
-            ''', (user_id, limit))
+                SELECT
+                    event_kind,
+                    name,
+                    COUNT(*) AS count,
+                    MAX(ts) AS last_ts,
+                    SUM(age < 1) AS within_1d,
+                    SUM(age < 7) AS within_7d,
+                    SUM(age < 30) AS within_30d,
+                    SUM(age >= 30) AS older
+                FROM (
+                    SELECT event_kind, name, ts, julianday('now') - julianday(ts) AS age
+                    FROM analytics_events WHERE user_id = ?
+                )
+                GROUP BY event_kind, name
+            ''', (user_id,))
             
             results = cursor.fetchall()
             columns = [description[0] for description in cursor.description]
             return [dict(zip(columns, row)) for row in results]
+        return await self.run_read(query)
     
-    async def get_bot_messages(self, user_id: int, limit: int = 100) -> List[Dict[str, Any]]:
-        """Get bot's message history to user"""
-        with sqlite3.connect(self.db_path) as conn:
+    async def get_engagement_score(self, user_id: int) -> float:
+        """Current decayed engagement score of a user"""
+        await self.write_queue.flush()
+        def query(conn):
+            row = conn.execute("SELECT engagement_log FROM users WHERE user_id = ?", (user_id,)).fetchone()
+            return row[0] if row else None
+        return current_score(await self.run_read(query))
+    
+    async def get_engagement_ranking(self, limit: int = 10, least_engaged: bool = False) -> List[Dict[str, Any]]:
+        """Top (or bottom) users by engagement score, read in order from idx_users_engagement"""
+        await self.write_queue.flush()
+        direction = "ASC" if least_engaged else "DESC"
+        def query(conn):
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT * FROM bot_messages WHERE user_id = ? 
-                ORDER BY sent_at DESC LIMIT ?
-            ''', (user_id, limit))
-            
-            results = cursor.fetchall()
+            cursor.execute(f'''
+                SELECT user_id, username, first_name, engagement_log, last_activity
+                FROM users
+                ORDER BY engagement_log {direction}
+                LIMIT ?
+            ''', (limit,))
             columns = [description[0] for description in cursor.description]
-            return [dict(zip(columns, row)) for row in results]
+            return [dict(zip(columns, row)) for row in cursor.fetchall()]
+        
+        now = time.time()
+        ranking = await self.run_read(query)
+        for row in ranking:
+            row["engagement_score"] = current_score(row.pop("engagement_log"), now)
+        return ranking
+    
+    async def recompute_engagement_scores(self, batch_users: int = 500) -> int:
+        """Rebuild every user's engagement score from analytics_events, a batch of users per transaction"""
+        await self.write_queue.flush()
+        def write(conn, after_user_id):
+            cursor = conn.cursor()
+            cursor.execute("SELECT user_id FROM users WHERE user_id > ? ORDER BY user_id LIMIT ?",
+                           (after_user_id, batch_users))
+            user_ids = [row[0] for row in cursor.fetchall()]
+            if user_ids:
+                cursor.execute(f'''
+                    UPDATE users SET engagement_log = (
+                        SELECT logsumexp2({event_exponent_sql('ts')}) FROM analytics_events
+                        WHERE analytics_events.user_id = users.user_id
+                    )
+                    WHERE user_id IN (SELECT value FROM json_each(?))
+                ''', (json.dumps(user_ids),))
+            return user_ids
+        
+        after_user_id, updated = -(2 ** 63), 0
+        while True:
+            user_ids = await self.run_write(write, after_user_id)
+            updated += len(user_ids)
+            if len(user_ids) < batch_users:
+                break
+            after_user_id = user_ids[-1]
+        logger.info(f"Recomputed engagement scores for {updated} users")
+        return updated
+    
+    async def save_analytics_counters(self, entries: Dict[str, List[tuple]]):
+        """Replace the checkpoint of each named counter set with its (name, value, updated_at) entries"""
+        def write(conn):
+            cursor = conn.cursor()
+            for counter, rows in entries.items():
+                cursor.execute("DELETE FROM analytics_counters WHERE counter = ?", (counter,))
+                cursor.executemany('''
+                    INSERT INTO analytics_counters (counter, name, value, updated_at)
+                    VALUES (?, ?, ?, ?)
+                ''', [(counter, name, value, updated_at) for name, value, updated_at in rows])
+        await self.run_write(write)
+    
+    async def load_analytics_counters(self) -> Dict[str, List[tuple]]:
+        """Checkpointed (name, value, updated_at) entries grouped by counter set"""
+        def query(conn):
+            cursor = conn.cursor()
+            cursor.execute("SELECT counter, name, value, updated_at FROM analytics_counters")
+            entries: Dict[str, List[tuple]] = {}
+            for counter, name, value, updated_at in cursor.fetchall():
+                entries.setdefault(counter, []).append((name, value, updated_at))
+            return entries
+        return await self.run_read(query)
+    
+    # Rows fetched per round trip by the keyset-paginated history readers
+    HISTORY_PAGE_SIZE = 200
+    
+    async def _iter_keyset(self, table: str, time_column: str, user_id: int, page_size: int,
+                           limit: Optional[int], newest_first: bool, extra_where: str = "",
+                           extra_params: tuple = ()):
+        """Stream a user's rows ordered by (time_column, id), one index-driven page at a time"""
+        await self.write_queue.flush()
+        direction, comparison = ("DESC", "<") if newest_first else ("ASC", ">")
+        page_size = max(1, page_size)
+        
+        def query(conn, cursor_key, count):
+            keyset = f"AND ({time_column}, id) {comparison} (?, ?)" if cursor_key else ""
+            cursor = conn.execute(f'''
+                SELECT * FROM {table}
+                WHERE user_id = ? {extra_where} {keyset}
+                ORDER BY {time_column} {direction}, id {direction}
+                LIMIT ?
+            ''', (user_id, *extra_params, *(cursor_key or ()), count))
+            return [description[0] for description in cursor.description], cursor.fetchall()
+        
+        cursor_key = None
+        remaining = limit
+        while remaining is None or remaining > 0:
+            count = page_size if remaining is None else min(page_size, remaining)
+            columns, rows = await self.run_read(query, cursor_key, count)
+            time_index, id_index = columns.index(time_column), columns.index('id')
+            for row in rows:
+                yield dict(zip(columns, row))
+            if len(rows) < count:
+                return
+            cursor_key = (rows[-1][time_index], rows[-1][id_index])
+            if remaining is not None:
+                remaining -= len(rows)
+    
+    def iter_user_messages(self, user_id: int, page_size: int = HISTORY_PAGE_SIZE, limit: Optional[int] = None,
+                           newest_first: bool = True, message_types: Optional[List[str]] = None):
+        """Stream a user's messages page by page using a (created_at, id) keyset cursor"""
+        extra_where, extra_params = "", ()
+        if message_types:
+            extra_where = f"AND message_type IN ({', '.join('?' for _ in message_types)})"
+            extra_params = tuple(message_types)
+        return self._iter_keyset('user_messages', 'created_at', user_id, page_size, limit,
+                                 newest_first, extra_where, extra_params)
+    
+    def iter_bot_messages(self, user_id: int, page_size: int = HISTORY_PAGE_SIZE, limit: Optional[int] = None,
+                          newest_first: bool = True):
+        """Stream the bot's messages to a user page by page using a (sent_at, id) keyset cursor"""
+        return self._iter_keyset('bot_messages', 'sent_at', user_id, page_size, limit, newest_first)
+    
+    async def iter_conversation_history(self, user_id: int, page_size: int = HISTORY_PAGE_SIZE,
+                                        limit: Optional[int] = None, newest_first: bool = True):
+        """Stream user and bot messages merged in (timestamp, sender, id) order.
+        
+        Each page is an ordered UNION ALL of two keyset range scans, so at most
+        2 * page_size rows are read per round trip however long the history is.
+        """
+        await self.write_queue.flush()
+        direction, comparison = ("DESC", "<") if newest_first else ("ASC", ">")
+        page_size = max(1, page_size)
+        # Id bounds that turn the per-branch (time, id) comparison into <= / < on time alone
+        id_after_all, id_before_all = 2 ** 63 - 1, -1
+        
+        def branch_bound(sender, cursor_key):
+            timestamp, cursor_sender, cursor_id = cursor_key
+            if sender == cursor_sender:
+                return timestamp, cursor_id
+            # Rows of the other branch with an equal timestamp sort on the sender label
+            sender_first = (sender > cursor_sender) == newest_first
+            if sender_first:
+                return timestamp, id_before_all if newest_first else id_after_all
+            return timestamp, id_after_all if newest_first else id_before_all
+        
+        def query(conn, cursor_key, count):
+            branches, params = [], []
+            for sender, table, time_column in (('user', 'user_messages', 'created_at'),
+                                               ('bot', 'bot_messages', 'sent_at')):
+                keyset = ""
+                params.append(user_id)
+                if cursor_key:
+                    keyset = f"AND ({time_column}, id) {comparison} (?, ?)"
+                    params.extend(branch_bound(sender, cursor_key))
+                params.append(count)
+                branches.append(f'''
+                    SELECT * FROM (
+                        SELECT '{sender}' AS sender, id, message_text, {time_column} AS timestamp,
+                               module_context, state_context
+                        FROM {table}
+                        WHERE user_id = ? {keyset}
+                        ORDER BY {time_column} {direction}, id {direction}
+                        LIMIT ?
+                    )
+                ''')
+            cursor = conn.execute(f'''
+                {' UNION ALL '.join(branches)}
+                ORDER BY timestamp {direction}, sender {direction}, id {direction}
+                LIMIT ?
+            ''', (*params, count))
+            return [description[0] for description in cursor.description], cursor.fetchall()
+        
+        cursor_key = None
+        remaining = limit
+        while remaining is None or remaining > 0:
+            count = page_size if remaining is None else min(page_size, remaining)
+            columns, rows = await self.run_read(query, cursor_key, count)
+            for row in rows:
+                yield dict(zip(columns, row))
+            if len(rows) < count:
+                return
+            last = dict(zip(columns, rows[-1]))
+            cursor_key = (last['timestamp'], last['sender'], last['id'])
+            if remaining is not None:
+                remaining -= len(rows)
+    
+    async def get_user_messages(self, user_id: int, limit: int = 100) -> List[Dict[str, Any]]:
+        """Get user's message history"""
+        return [message async for message in self.iter_user_messages(user_id, page_size=limit, limit=limit)]
+    
+    async def get_bot_messages(self, user_id: int, limit: int = 100) -> List[Dict[str, Any]]:
+        """Get bot's message history to user"""
+        return [message async for message in self.iter_bot_messages(user_id, page_size=limit, limit=limit)]
     
     async def get_conversation_history(self, user_id: int, limit: int = 50) -> List[Dict[str, Any]]:
         """Get combined conversation history (user + bot messages)"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT 'user' as sender, message_text, created_at as timestamp, module_context, state_context
-                FROM user_messages WHERE user_id = ?
-                UNION ALL
-                SELECT 'bot' as sender, message_text, sent_at as timestamp, module_context, state_context
-                FROM bot_messages WHERE user_id = ?
-                ORDER BY timestamp DESC LIMIT ?
-            ''', (user_id, user_id, limit))
-            
-            results = cursor.fetchall()
-            columns = [description[0] for description in cursor.description]
-            return [dict(zip(columns, row)) for row in results]
+        return [message async for message in self.iter_conversation_history(user_id, page_size=limit, limit=limit)]
     
     async def update_user_profile(self, user_id: int, **kwargs):
         """Update user profile information"""
@@ -452,19 +847,19 @@ class DatabaseManager:
         
         values.append(user_id)
         
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(f'''
+        def write(conn):
+            conn.execute(f'''
                 UPDATE users SET {', '.join(update_fields)}, updated_at = CURRENT_TIMESTAMP
                 WHERE user_id = ?
             ''', values)
-            
-            conn.commit()
-            logger.info(f"Updated user profile for {user_id}")
+        
+        await self.run_write(write)
+        self._publish_changes('users', [user_id])
+        logger.info(f"Updated user profile for {user_id}")
     
     async def get_user_profile(self, user_id: int) -> Optional[Dict[str, Any]]:
         """Get complete user profile"""
-        with sqlite3.connect(self.db_path) as conn:
+        def query(conn):
             cursor = conn.cursor()
             cursor.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
             result = cursor.fetchone()
@@ -473,23 +868,23 @@ class DatabaseManager:
                 columns = [description[0] for description in cursor.description]
                 return dict(zip(columns, result))
             return None
+        return await self.run_read(query)
     
     async def store_user_feedback(self, user_id: int, feedback_type: str, feedback_text: str,
                                  rating: int = None, content_id: int = None):
         """Store user feedback"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
+        def write(conn):
+            conn.execute('''
                 INSERT INTO user_feedback (user_id, feedback_type, feedback_text, rating, content_id)
                 VALUES (?, ?, ?, ?, ?)
             ''', (user_id, feedback_type, feedback_text, rating, content_id))
-            
-            conn.commit()
-            logger.info(f"Stored feedback from user {user_id}")
+        
+        await self.run_write(write)
+        logger.info(f"Stored feedback from user {user_id}")
     
     async def get_user_feedback(self, user_id: int, limit: int = 50) -> List[Dict[str, Any]]:
         """Get user's feedback history"""
-        with sqlite3.connect(self.db_path) as conn:
+        def query(conn):
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT * FROM user_feedback WHERE user_id = ? 
@@ -499,38 +894,38 @@ class DatabaseManager:
             results = cursor.fetchall()
             columns = [description[0] for description in cursor.description]
             return [dict(zip(columns, row)) for row in results]
+        return await self.run_read(query)
     
     async def start_user_session(self, user_id: int) -> int:
         """Start a new user session"""
-        with sqlite3.connect(self.db_path) as conn:
+        def write(conn):
             cursor = conn.cursor()
             cursor.execute('''
                 INSERT INTO user_sessions (user_id, session_start)
                 VALUES (?, CURRENT_TIMESTAMP)
             ''', (user_id,))
-            
-            session_id = cursor.lastrowid
-            conn.commit()
-            logger.info(f"Started session {session_id} for user {user_id}")
-            return session_id
+            return cursor.lastrowid
+        
+        session_id = await self.run_write(write)
+        logger.info(f"Started session {session_id} for user {user_id}")
+        return session_id
     
     async def end_user_session(self, session_id: int, messages_count: int = 0, 
                               modules_used: str = None, session_data: str = None):
         """End a user session"""
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
+        def write(conn):
+            conn.execute('''
                 UPDATE user_sessions 
                 SET session_end = CURRENT_TIMESTAMP, messages_count = ?, modules_used = ?, session_data = ?
                 WHERE id = ?
             ''', (messages_count, modules_used, session_data, session_id))
-            
-            conn.commit()
-            logger.info(f"Ended session {session_id}")
+        
+        await self.run_write(write)
+        logger.info(f"Ended session {session_id}")
     
     async def get_user_sessions(self, user_id: int, limit: int = 20) -> List[Dict[str, Any]]:
         """Get user's session history"""
-        with sqlite3.connect(self.db_path) as conn:
+        def query(conn):
             cursor = conn.cursor()
             cursor.execute('''
                 SELECT * FROM user_sessions WHERE user_id = ? 
@@ -540,81 +935,291 @@ class DatabaseManager:
             results = cursor.fetchall()
             columns = [description[0] for description in cursor.description]
             return [dict(zip(columns, row)) for row in results]
+        return await self.run_read(query)
     
-    async def get_user_statistics(self, user_id: int) -> Dict[str, Any]:
-        """Get comprehensive user statistics"""
-        with sqlite3.connect(self.db_path) as conn:
+    # Counter column -> table whose rows it counts, in select order
+    USER_COUNTER_SOURCES = {
+        'user_messages_count': 'user_messages',
+        'bot_messages_count': 'bot_messages',
+        'content_delivered_count': 'content_delivery',
+        'feedback_count': 'user_feedback',
+        'sessions_count': 'user_sessions'
+    }
+    USER_STATISTICS_COUNTERS = list(USER_COUNTER_SOURCES)
+    
+    # user_counters row holding the totals across all users (Telegram ids are positive)
+    GLOBAL_COUNTERS_ID = 0
+    
+    @classmethod
+    def _create_user_counters(cls, cursor):
+        """Create the user_counters table and the triggers that keep it current"""
+        columns = ',\n'.join(f'{column} INTEGER NOT NULL DEFAULT 0' for column in cls.USER_COUNTER_SOURCES)
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS user_counters (
+                user_id INTEGER PRIMARY KEY,
+                {columns},
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        
+        for column, table in cls.USER_COUNTER_SOURCES.items():
+            # Each row bumps the global row and, when it has one, its user's counter.
+            # A NULL user_id must not reach user_counters: NULL in an INTEGER PRIMARY KEY
+            # allocates a fresh rowid instead of conflicting.
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_counters_insert
+                AFTER INSERT ON {table}
+                BEGIN
+                    INSERT INTO user_counters (user_id, {column}, updated_at)
+                    SELECT user_id, 1, CURRENT_TIMESTAMP
+                    FROM (SELECT NEW.user_id AS user_id UNION ALL SELECT {cls.GLOBAL_COUNTERS_ID})
+                    WHERE user_id IS NOT NULL
+                    ON CONFLICT(user_id) DO UPDATE SET
+                        {column} = {column} + 1,
+                        updated_at = CURRENT_TIMESTAMP;
+                END
+            ''')
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_counters_delete
+                AFTER DELETE ON {table}
+                BEGIN
+                    UPDATE user_counters
+                    SET {column} = {column} - 1, updated_at = CURRENT_TIMESTAMP
+                    WHERE user_id = {cls.GLOBAL_COUNTERS_ID}
+                       OR (OLD.user_id IS NOT NULL AND user_id = OLD.user_id);
+                END
+            ''')
+            # Reassigning a row to another user moves it between per-user counters
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_counters_reassign
+                AFTER UPDATE OF user_id ON {table}
+                WHEN OLD.user_id IS NOT NEW.user_id
+                BEGIN
+                    UPDATE user_counters
+                    SET {column} = {column} - 1, updated_at = CURRENT_TIMESTAMP
+                    WHERE user_id = OLD.user_id;
+                    INSERT INTO user_counters (user_id, {column}, updated_at)
+                    SELECT NEW.user_id, 1, CURRENT_TIMESTAMP
+                    WHERE NEW.user_id IS NOT NULL
+                    ON CONFLICT(user_id) DO UPDATE SET
+                        {column} = {column} + 1,
+                        updated_at = CURRENT_TIMESTAMP;
+                END
+            ''')
+    
+    @classmethod
+    def _drop_user_counter_triggers(cls, cursor):
+        """Drop the triggers created by _create_user_counters"""
+        for table in cls.USER_COUNTER_SOURCES.values():
+            for event in ('insert', 'delete', 'reassign'):
+                cursor.execute(f'DROP TRIGGER IF EXISTS trg_{table}_counters_{event}')
+    
+    @classmethod
+    def _counted_user_ids_sql(cls) -> str:
+        """Every user_id that appears in any counted table"""
+        return ' UNION '.join(f'SELECT user_id FROM {table}' for table in cls.USER_COUNTER_SOURCES.values())
+    
+    @classmethod
+    def _actual_counters_sql(cls) -> str:
+        """Per-user counts computed from the source tables, plus the global row"""
+        per_user = ',\n'.join(
+            f'(SELECT COUNT(*) FROM {table} t WHERE t.user_id = ids.user_id) AS {column}'
+            for column, table in cls.USER_COUNTER_SOURCES.items()
+        )
+        totals = ',\n'.join(
+            f'(SELECT COUNT(*) FROM {table}) AS {column}'
+            for column, table in cls.USER_COUNTER_SOURCES.items()
+        )
+        return f'''
+            SELECT ids.user_id, {per_user}
+            FROM ({cls._counted_user_ids_sql()}) ids
+            WHERE ids.user_id IS NOT NULL AND ids.user_id != {cls.GLOBAL_COUNTERS_ID}
+            UNION ALL
+            SELECT {cls.GLOBAL_COUNTERS_ID}, {totals}
+        '''
+    
+    @classmethod
+    def _rebuild_user_counters(cls, conn) -> int:
+        """Recompute every counter from the source tables (caller owns the transaction)"""
+        columns = ', '.join(cls.USER_COUNTER_SOURCES)
+        conn.execute('DELETE FROM user_counters')
+        cursor = conn.execute(f'''
+            INSERT INTO user_counters (user_id, {columns})
+            {cls._actual_counters_sql()}
+        ''')
+        return cursor.rowcount
+    
+    async def rebuild_user_counters(self) -> int:
+        """Backfill user_counters from the source tables; returns the number of rows written"""
+        await self.write_queue.flush()
+        try:
+            # Runs on the writer thread, so no trigger update can interleave with the rebuild
+            rows = await self.run_write(self._rebuild_user_counters, timeout=600)
+            logger.info(f"Rebuilt user counters ({rows} rows)")
+            return rows
+        except Exception as e:
+            logger.error(f"Error rebuilding user counters: {e}")
+            raise
+    
+    @classmethod
+    def _check_user_counters(cls, conn) -> List[Dict[str, Any]]:
+        """Compare stored counters with the source tables and list every mismatch"""
+        columns = list(cls.USER_COUNTER_SOURCES)
+        stored = ', '.join(f'COALESCE(c.{column}, 0)' for column in columns)
+        differs = ' OR '.join(f'COALESCE(c.{column}, 0) != a.{column}' for column in columns)
+        cursor = conn.execute(f'''
+            WITH actual AS ({cls._actual_counters_sql()})
+            SELECT a.user_id, {', '.join(f'a.{column}' for column in columns)}, {stored}
+            FROM actual a
+            LEFT JOIN user_counters c ON c.user_id = a.user_id
+            WHERE c.user_id IS NULL OR {differs}
+            UNION ALL
+            SELECT c.user_id, {', '.join('0' for _ in columns)}, {', '.join(f'c.{column}' for column in columns)}
+            FROM user_counters c
+            WHERE c.user_id NOT IN (SELECT user_id FROM actual)
+              AND ({' OR '.join(f'c.{column} != 0' for column in columns)})
+        ''')
+        
+        mismatches = []
+        for row in cursor.fetchall():
+            actual = dict(zip(columns, row[1:1 + len(columns)]))
+            counted = dict(zip(columns, row[1 + len(columns):]))
+            mismatches.append({
+                'user_id': row[0],
+                'actual': actual,
+                'stored': counted,
+                'differences': {
+                    column: counted[column] - actual[column]
+                    for column in columns if counted[column] != actual[column]
+                }
+            })
+        return mismatches
+    
+    async def check_user_counters(self) -> List[Dict[str, Any]]:
+        """Consistency check of user_counters against full COUNT(*) scans"""
+        await self.write_queue.flush()
+        mismatches = await self.run_read(self._check_user_counters, timeout=600)
+        if mismatches:
+            logger.warning(f"User counters out of sync for {len(mismatches)} rows")
+        return mismatches
+    
+    async def get_global_counters(self) -> Dict[str, int]:
+        """Totals across all users from the global counters row"""
+        await self.write_queue.flush()
+        
+        def query(conn):
             cursor = conn.cursor()
-            
-            # Get basic counts
-            cursor.execute('SELECT COUNT(*) FROM user_messages WHERE user_id = ?', (user_id,))
-            user_messages_count = cursor.fetchone()[0]
-            
-            cursor.execute('SELECT COUNT(*) FROM bot_messages WHERE user_id = ?', (user_id,))
-            bot_messages_count = cursor.fetchone()[0]
-            
-            cursor.execute('SELECT COUNT(*) FROM content_delivery WHERE user_id = ?', (user_id,))
-            content_delivered_count = cursor.fetchone()[0]
-            
-            cursor.execute('SELECT COUNT(*) FROM user_feedback WHERE user_id = ?', (user_id,))
-            feedback_count = cursor.fetchone()[0]
-            
-            cursor.execute('SELECT COUNT(*) FROM user_sessions WHERE user_id = ?', (user_id,))
-            sessions_count = cursor.fetchone()[0]
-            
-            # Get user profile
-            profile = await self.get_user_profile(user_id)
-            
-            return {
+            cursor.execute(f'''
+                SELECT {', '.join(self.USER_COUNTER_SOURCES)}
+                FROM user_counters WHERE user_id = ?
+            ''', (self.GLOBAL_COUNTERS_ID,))
+            return cursor.fetchone()
+        
+        row = await self.run_read(query)
+        return dict(zip(self.USER_STATISTICS_COUNTERS, row or [0] * len(self.USER_STATISTICS_COUNTERS)))
+    
+    @classmethod
+    def _user_statistics_query(cls, conn, user_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Counts, active subscription and profile for many users in one statement"""
+        cursor = conn.cursor()
+        cursor.execute('''
+            WITH ids(user_id) AS (SELECT DISTINCT value FROM json_each(?))
+            SELECT
+                ids.user_id,
+                COALESCE(uc.user_messages_count, 0),
+                COALESCE(uc.bot_messages_count, 0),
+                COALESCE(uc.content_delivered_count, 0),
+                COALESCE(uc.feedback_count, 0),
+                COALESCE(uc.sessions_count, 0),
+                sub.id,
+                sub.subscription_type,
+                sub.user_goal,
+                u.*
+            FROM ids
+            LEFT JOIN user_counters uc ON uc.user_id = ids.user_id
+            LEFT JOIN users u ON u.user_id = ids.user_id
+            LEFT JOIN subscriptions sub ON sub.id = (
+                SELECT id FROM subscriptions
+                WHERE user_id = ids.user_id AND status = 'active' AND end_date > CURRENT_TIMESTAMP
+                ORDER BY created_at DESC LIMIT 1
+            )
+        ''', (json.dumps(list(user_ids)),))
+        
+        rows = cursor.fetchall()
+        counter_count = len(cls.USER_STATISTICS_COUNTERS)
+        profile_offset = 1 + counter_count + 3
+        profile_columns = [description[0] for description in cursor.description][profile_offset:]
+        
+        results = {}
+        for row in rows:
+            user_id = row[0]
+            profile = dict(zip(profile_columns, row[profile_offset:]))
+            subscription_id, subscription_type, user_goal = row[1 + counter_count:profile_offset]
+            results[user_id] = {
                 'user_id': user_id,
-                'profile': profile,
-                'statistics': {
-                    'user_messages_count': user_messages_count,
-                    'bot_messages_count': bot_messages_count,
-                    'content_delivered_count': content_delivered_count,
-                    'feedback_count': feedback_count,
-                    'sessions_count': sessions_count
-                }
+                'profile': profile if profile.get('user_id') is not None else None,
+                'active_subscription': (
+                    {'id': subscription_id, 'subscription_type': subscription_type, 'user_goal': user_goal}
+                    if subscription_id is not None else None
+                ),
+                'statistics': dict(zip(cls.USER_STATISTICS_COUNTERS, row[1:1 + counter_count]))
             }
+        return results
+    
+    async def get_user_statistics(self, user_id: int) -> Dict[str, Any]:
+        """Get comprehensive user statistics in a single round trip"""
+        await self.write_queue.flush()
+        results = await self.run_read(self._user_statistics_query, [user_id])
+        return results[user_id]
+    
+    async def get_users_statistics(self, user_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Get statistics for many users with one query, keyed by user_id"""
+        if not user_ids:
+            return {}
+        await self.write_queue.flush()
+        return await self.run_read(self._user_statistics_query, list(user_ids))
     
     async def create_subscription(self, user_id: int, order_id: str, user_goal: str, 
                                 subscription_type: str, plan_details: dict) -> bool:
         """Create a new subscription/order for a specific goal"""
-        try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT INTO subscriptions (
-                        user_id, order_id, user_goal, subscription_type,
-                        plan_name, plan_price, plan_duration, plan_approach, plan_result_time,
-                        status, created_at, updated_at
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
-                ''', (
+        def write(conn):
+            conn.execute('''
+                INSERT INTO subscriptions (
                     user_id, order_id, user_goal, subscription_type,
-                    plan_details.get('name', ''), plan_details.get('price', ''),
-                    plan_details.get('duration', ''), plan_details.get('approach', ''),
-                    plan_details.get('result_time', ''), 'pending_payment'
-                ))
-                conn.commit()
-                logger.info(f"Created subscription {order_id} for user {user_id}")
-                return True
+                    plan_name, plan_price, plan_duration, plan_approach, plan_result_time,
+                    status, created_at, updated_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP)
+            ''', (
+                user_id, order_id, user_goal, subscription_type,
+                plan_details.get('name', ''), plan_details.get('price', ''),
+                plan_details.get('duration', ''), plan_details.get('approach', ''),
+                plan_details.get('result_time', ''), 'pending_payment'
+            ))
+        
+        try:
+            await self.run_write(write)
+            self._publish_changes('subscriptions', [user_id])
+            logger.info(f"Created subscription {order_id} for user {user_id}")
+            return True
         except Exception as e:
             logger.error(f"Error creating subscription: {e}")
             return False
     
     async def get_subscription_by_order_id(self, order_id: str) -> dict:
         """Get subscription details by order ID"""
+        def query(conn):
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT * FROM subscriptions WHERE order_id = ?
+            ''', (order_id,))
+            result = cursor.fetchone()
+            if result:
+                columns = [description[0] for description in cursor.description]
+                return dict(zip(columns, result))
+            return {}
+        
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT * FROM subscriptions WHERE order_id = ?
-                ''', (order_id,))
-                result = cursor.fetchone()
-                if result:
-                    columns = [description[0] for description in cursor.description]
-                    return dict(zip(columns, result))
-                return {}
+            return await self.run_read(query)
         except Exception as e:
             logger.error(f"Error getting subscription: {e}")
             return {}
@@ -622,62 +1227,75 @@ class DatabaseManager:
     async def update_subscription_status(self, order_id: str, status: str, 
                                        payment_id: str = None, payment_method: str = None) -> bool:
         """Update subscription status (e.g., after payment)"""
+        def write(conn):
+            cursor = conn.cursor()
+            # Owners of the order, so the change can be published per user
+            cursor.execute('SELECT user_id FROM subscriptions WHERE order_id = ?', (order_id,))
+            user_ids = [row[0] for row in cursor.fetchall()]
+            if payment_id and payment_method:
+                cursor.execute('''
+                    UPDATE subscriptions 
+                    SET status = ?, payment_id = ?, payment_method = ?, 
+                        start_date = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+                    WHERE order_id = ?
+                ''', (status, payment_id, payment_method, order_id))
+            else:
+                cursor.execute('''
+                    UPDATE subscriptions 
+                    SET status = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE order_id = ?
+                ''', (status, order_id))
+            return user_ids
+        
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                if payment_id and payment_method:
-                    cursor.execute('''
-                        UPDATE subscriptions 
-                        SET status = ?, payment_id = ?, payment_method = ?, 
-                            start_date = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
-                        WHERE order_id = ?
-                    ''', (status, payment_id, payment_method, order_id))
-                else:
-                    cursor.execute('''
-                        UPDATE subscriptions 
-                        SET status = ?, updated_at = CURRENT_TIMESTAMP
-                        WHERE order_id = ?
-                    ''', (status, order_id))
-                conn.commit()
-                logger.info(f"Updated subscription {order_id} status to {status}")
-                return True
+            user_ids = await self.run_write(write)
+            self._publish_changes('subscriptions', user_ids)
+            logger.info(f"Updated subscription {order_id} status to {status}")
+            return True
         except Exception as e:
             logger.error(f"Error updating subscription status: {e}")
             return False
     
     async def get_user_active_subscriptions(self, user_id: int) -> list:
         """Get all active subscriptions for a user"""
+        def query(conn):
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT * FROM subscriptions 
+                WHERE user_id = ? AND status IN ('active', 'pending_payment')
+                ORDER BY created_at DESC
+            ''', (user_id,))
+            results = cursor.fetchall()
+            if results:
+                columns = [description[0] for description in cursor.description]
+                return [dict(zip(columns, result)) for result in results]
+            return []
+        
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    SELECT * FROM subscriptions 
-                    WHERE user_id = ? AND status IN ('active', 'pending_payment')
-                    ORDER BY created_at DESC
-                ''', (user_id,))
-                results = cursor.fetchall()
-                if results:
-                    columns = [description[0] for description in cursor.description]
-                    return [dict(zip(columns, result)) for result in results]
-                return []
+            return await self.run_read(query)
         except Exception as e:
             logger.error(f"Error getting user subscriptions: {e}")
             return []
     
     async def mark_goal_achieved(self, order_id: str) -> bool:
         """Mark a goal as achieved and end the subscription"""
+        def write(conn):
+            cursor = conn.cursor()
+            cursor.execute('SELECT user_id FROM subscriptions WHERE order_id = ?', (order_id,))
+            user_ids = [row[0] for row in cursor.fetchall()]
+            cursor.execute('''
+                UPDATE subscriptions 
+                SET goal_achieved = TRUE, status = 'completed', 
+                    end_date = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
+                WHERE order_id = ?
+            ''', (order_id,))
+            return user_ids
+        
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    UPDATE subscriptions 
-                    SET goal_achieved = TRUE, status = 'completed', 
-                        end_date = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP
-                    WHERE order_id = ?
-                ''', (order_id,))
-                conn.commit()
-                logger.info(f"Marked goal as achieved for subscription {order_id}")
-                return True
+            user_ids = await self.run_write(write)
+            self._publish_changes('subscriptions', user_ids)
+            logger.info(f"Marked goal as achieved for subscription {order_id}")
+            return True
         except Exception as e:
             logger.error(f"Error marking goal as achieved: {e}")
             return False
@@ -0,0 +1,139 @@
+"""
+Database Executor Module
+Runs blocking SQLite work off the event loop on dedicated threads.
+"""
+
+import asyncio
+import threading
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Pass as ``timeout`` to wait without limit even when the executor has a default timeout
+NO_TIMEOUT = float("inf")
+
+class DatabaseTimeoutError(asyncio.TimeoutError):
+    """Raised when a database call exceeds its timeout"""
+
+class DatabaseJobCancelled(Exception):
+    """Raised inside a worker thread when its job was cancelled before it started"""
+
+class _DatabaseJob:
+    """A single unit of database work that can be interrupted from the event loop"""
+
+    def __init__(self, pool, fn: Callable, args: tuple, kwargs: dict):
+        self.pool = pool
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.conn = None
+        self.cancelled = False
+        self._lock = threading.Lock()
+
+    def run(self) -> Any:
+        """Execute the job in the calling worker thread"""
+        if self.cancelled:
+            raise DatabaseJobCancelled()
+
+        conn = self.pool.acquire()
+        try:
+            with self._lock:
+                if self.cancelled:
+                    raise DatabaseJobCancelled()
+                self.conn = conn
+            with conn:
+                return self.fn(conn, *self.args, **self.kwargs)
+        finally:
+            with self._lock:
+                self.conn = None
+            self.pool.release(conn)
+
+    def cancel(self):
+        """Skip the job if it has not started, or interrupt its running statement"""
+        with self._lock:
+            self.cancelled = True
+            if self.conn is not None:
+                self.conn.interrupt()
+
+class DatabaseExecutor:
+    """Dispatches SQLite calls to a single writer thread and a pool of reader threads"""
+
+    def __init__(self, pool, reader_threads: int = 4, default_timeout: Optional[float] = 30.0,
+                 latency=None):
+        self.pool = pool
+        # Optional LatencyTracker; every call is recorded as db.read / db.write
+        self.latency = latency
+        self.reader_threads = max(1, reader_threads)
+        self.default_timeout = default_timeout
+        # A single writer serializes all in-process writes, so they never contend for the lock
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._readers = ThreadPoolExecutor(max_workers=self.reader_threads, thread_name_prefix="db-reader")
+        self.stats = {
+            "reads": 0,
+            "writes": 0,
+            "timeouts": 0,
+            "cancellations": 0,
+            "errors": 0
+        }
+
+    async def run_read(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """Run ``fn(conn, *args, **kwargs)`` on a reader thread"""
+        self.stats["reads"] += 1
+        return await self._run(self._readers, fn, args, kwargs, timeout, "db.read")
+
+    async def run_write(self, fn: Callable, *args, timeout: Optional[float] = None, **kwargs) -> Any:
+        """Run ``fn(conn, *args, **kwargs)`` on the writer thread inside a transaction"""
+        self.stats["writes"] += 1
+        return await self._run(self._writer, fn, args, kwargs, timeout, "db.write")
+
+    def submit_write(self, fn: Callable, *args, **kwargs):
+        """Queue ``fn(conn, *args, **kwargs)`` on the writer thread without awaiting it"""
+        self.stats["writes"] += 1
+        job = _DatabaseJob(self.pool, fn, args, kwargs)
+        return self._writer.submit(job.run)
+
+    async def _run(self, executor: ThreadPoolExecutor, fn: Callable, args: tuple,
+                   kwargs: dict, timeout: Optional[float], kind: str) -> Any:
+        """Submit a job and await it, interrupting SQLite on timeout or cancellation"""
+        timeout = self.default_timeout if timeout is None else timeout
+        if timeout == NO_TIMEOUT:
+            timeout = None
+        job = _DatabaseJob(self.pool, fn, args, kwargs)
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        error = True
+        future = loop.run_in_executor(executor, job.run)
+
+        try:
+            result = await asyncio.wait_for(future, timeout)
+            error = False
+            return result
+        except asyncio.TimeoutError:
+            job.cancel()
+            self.stats["timeouts"] += 1
+            raise DatabaseTimeoutError(f"Database call {getattr(fn, '__qualname__', fn)} timed out after {timeout}s")
+        except asyncio.CancelledError:
+            job.cancel()
+            self.stats["cancellations"] += 1
+            raise
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        finally:
+            # Includes time queued behind other jobs, which is what callers experience
+            if self.latency is not None:
+                self.latency.record(kind, time.perf_counter() - start, error)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get executor statistics"""
+        stats = dict(self.stats)
+        stats["reader_threads"] = self.reader_threads
+        return stats
+
+    def shutdown(self, wait: bool = True):
+        """Stop accepting work and optionally wait for queued jobs to finish"""
+        self._writer.shutdown(wait=wait)
+        self._readers.shutdown(wait=wait)
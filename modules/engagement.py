@@ -0,0 +1,65 @@
+"""
+Engagement Module
+Per-user engagement kept as a forward-decayed activity value in log2 form.
+"""
+
+import math
+import time
+import sqlite3
+from typing import Optional
+
+# Fixed reference time (2024-01-01 UTC) that event weights are measured from
+ENGAGEMENT_EPOCH = 1704067200.0
+
+# Seconds for an event's contribution to halve
+ENGAGEMENT_HALF_LIFE = 7 * 24 * 3600.0
+
+# Forward decay: an event at time t adds 2 ** ((t - epoch) / half_life) to a user's
+# total instead of every older event being decayed when a new one arrives. The score
+# at time now is total * 2 ** (-(now - epoch) / half_life), i.e. each event's weight
+# halved once per half-life since it happened. Every total shrinks by the same factor,
+# so ordering by the stored total is ordering by the current score and the column can
+# be indexed. Totals grow without bound, so users.engagement_log stores log2(total).
+
+def event_exponent(timestamp: Optional[float] = None, half_life: float = ENGAGEMENT_HALF_LIFE) -> float:
+    """log2 of the weight of an event at ``timestamp`` (now by default)"""
+    timestamp = time.time() if timestamp is None else timestamp
+    return (timestamp - ENGAGEMENT_EPOCH) / half_life
+
+def event_exponent_sql(column: str, half_life: float = ENGAGEMENT_HALF_LIFE) -> str:
+    """SQL expression for event_exponent() of a CURRENT_TIMESTAMP-format column"""
+    # 2440587.5 is the Julian day of the Unix epoch
+    return f"(((julianday({column}) - 2440587.5) * 86400.0 - {ENGAGEMENT_EPOCH}) / {float(half_life)})"
+
+def logaddexp2(total: Optional[float], exponent: Optional[float]) -> Optional[float]:
+    """log2(2 ** total + 2 ** exponent), treating NULL as an empty total"""
+    if total is None:
+        return exponent
+    if exponent is None:
+        return total
+    high, low = max(total, exponent), min(total, exponent)
+    return high + math.log2(1.0 + 2.0 ** (low - high))
+
+class LogSumExp2:
+    """SQLite aggregate: log2 of the sum of 2 ** value over the group"""
+
+    def __init__(self):
+        self.total = None
+
+    def step(self, exponent):
+        self.total = logaddexp2(self.total, exponent)
+
+    def finalize(self):
+        return self.total
+
+def register_sql_functions(conn: sqlite3.Connection):
+    """Make logaddexp2() and logsumexp2() available to SQL on a connection"""
+    conn.create_function("logaddexp2", 2, logaddexp2, deterministic=True)
+    conn.create_aggregate("logsumexp2", 1, LogSumExp2)
+
+def current_score(engagement_log: Optional[float], now: Optional[float] = None,
+                  half_life: float = ENGAGEMENT_HALF_LIFE) -> float:
+    """Decayed activity at ``now``: roughly the events of the last half-life, older ones counting less"""
+    if engagement_log is None:
+        return 0.0
+    return 2.0 ** (engagement_log - event_exponent(now, half_life))
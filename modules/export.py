@@ -0,0 +1,170 @@
+"""
+Export Module
+Streams tables or time ranges from SQLite to gzip-compressed NDJSON or CSV files.
+"""
+
+import os
+import io
+import csv
+import gzip
+import json
+import time
+import asyncio
+import logging
+import tempfile
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Exportable table -> column that date-range filters apply to
+EXPORT_TABLES = {
+    "analytics_events": "ts",
+    "user_messages": "created_at",
+    "bot_messages": "sent_at",
+    "users": "created_at",
+    "subscriptions": "created_at",
+    "daily_stats": "day",
+    "admin_actions": "timestamp"
+}
+
+EXPORT_FORMATS = ("ndjson", "csv")
+
+# Telegram bots may send documents up to 50 MB
+MAX_EXPORT_BYTES = 45 * 1024 * 1024
+
+class DataExporter:
+    """Writes table rows to a temporary ``.ndjson.gz`` or ``.csv.gz`` file in bounded memory.
+
+    Rows are read in rowid order, ``chunk_rows`` at a time, each chunk a
+    separate short read, and appended to the compressed file off the event
+    loop, so memory use does not depend on the size of the export. A
+    date-range filter does not change the total work: every chunk resumes
+    from the last rowid, so the table is walked at most once.
+    """
+
+    def __init__(self, db_manager, chunk_rows: int = 1000, max_bytes: int = MAX_EXPORT_BYTES):
+        self.db_manager = db_manager
+        self.chunk_rows = chunk_rows
+        self.max_bytes = max_bytes
+        self.stats = {
+            "exports": 0,
+            "rows_exported": 0,
+            "bytes_written": 0,
+            "truncated": 0,
+            "errors": 0
+        }
+
+    def _read_chunk(self, conn, table: str, time_column: str, after_rowid: int,
+                    since: Optional[str], until: Optional[str]) -> tuple:
+        """Next chunk of rows after a rowid within the date range (reader thread)"""
+        conditions, params = ["rowid > ?"], [after_rowid]
+        if since:
+            conditions.append(f"{time_column} >= ?")
+            params.append(since)
+        if until:
+            # until is an inclusive day
+            conditions.append(f"{time_column} < date(?, '+1 day')")
+            params.append(until)
+        cursor = conn.execute(f'''
+            SELECT rowid, * FROM {table}
+            WHERE {' AND '.join(conditions)}
+            ORDER BY rowid
+            LIMIT ?
+        ''', (*params, self.chunk_rows))
+        return [description[0] for description in cursor.description[1:]], cursor.fetchall()
+
+    @staticmethod
+    def _write_chunk(stream, fmt: str, columns: List[str], rows: List[tuple], header: bool):
+        """Append rows to the open compressed text stream (worker thread)"""
+        if fmt == "csv":
+            writer = csv.writer(stream)
+            if header:
+                writer.writerow(columns)
+            writer.writerows(row[1:] for row in rows)
+        else:
+            for row in rows:
+                stream.write(json.dumps(dict(zip(columns, row[1:])), ensure_ascii=False, default=str))
+                stream.write("\n")
+
+    async def export(self, table: str, fmt: str = "ndjson", since: Optional[str] = None,
+                     until: Optional[str] = None, directory: Optional[str] = None) -> Dict[str, Any]:
+        """Export a table (optionally a since/until day range) to a gzip temp file the caller must delete"""
+        if table not in EXPORT_TABLES:
+            raise ValueError(f"Unknown export table: {table} (choose from {', '.join(EXPORT_TABLES)})")
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Unknown export format: {fmt} (choose from {', '.join(EXPORT_FORMATS)})")
+        for day in (since, until):
+            try:
+                if day:
+                    datetime.strptime(day, "%Y-%m-%d")
+            except ValueError:
+                raise ValueError(f"Invalid date: {day} (expected YYYY-MM-DD)")
+
+        # Buffered rows are part of the table as far as the caller is concerned
+        await self.db_manager.flush_writes()
+        loop = asyncio.get_running_loop()
+        fd, path = tempfile.mkstemp(prefix=f"{table}_", suffix=f".{fmt}.gz", dir=directory)
+        raw = os.fdopen(fd, "wb")
+        stream = io.TextIOWrapper(gzip.GzipFile(fileobj=raw, mode="wb"), encoding="utf-8", newline="")
+        start = time.perf_counter()
+        rows_written, after_rowid, truncated = 0, -(2 ** 63), False
+        completed = False
+        try:
+            while True:
+                columns, rows = await self.db_manager.run_read(
+                    self._read_chunk, table, EXPORT_TABLES[table], after_rowid, since, until)
+                if rows_written == 0 or rows:
+                    await loop.run_in_executor(None, self._write_chunk, stream, fmt, columns, rows,
+                                               rows_written == 0)
+                rows_written += len(rows)
+                if len(rows) < self.chunk_rows:
+                    break
+                after_rowid = rows[-1][0]
+                if raw.tell() >= self.max_bytes:
+                    truncated = True
+                    break
+            await loop.run_in_executor(None, stream.close)
+            completed = True
+        except Exception:
+            self.stats["errors"] += 1
+            raise
+        finally:
+            # Also reached on cancellation, so a partial file is never left behind
+            if not completed:
+                try:
+                    stream.close()
+                except Exception as e:
+                    # Keep the original error; the file is discarded anyway
+                    logger.debug(f"Ignoring error closing partial export {path}: {e}")
+            # GzipFile leaves a fileobj it was given open
+            raw.close()
+            if not completed:
+                try:
+                    os.remove(path)
+                except OSError as e:
+                    logger.warning(f"Could not remove partial export {path}: {e}")
+
+        size = os.path.getsize(path)
+        self.stats["exports"] += 1
+        self.stats["rows_exported"] += rows_written
+        self.stats["bytes_written"] += size
+        if truncated:
+            self.stats["truncated"] += 1
+            logger.warning(f"Export of {table} stopped at {rows_written} rows ({size} bytes compressed)")
+        logger.info(f"Exported {rows_written} {table} rows to {path} in {time.perf_counter() - start:.2f}s")
+        return {
+            "path": path,
+            "filename": f"{table}_{since or 'start'}_{until or datetime.utcnow().strftime('%Y-%m-%d')}.{fmt}.gz",
+            "table": table,
+            "format": fmt,
+            "rows": rows_written,
+            "bytes": size,
+            "truncated": truncated,
+            "since": since,
+            "until": until
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get export statistics"""
+        return dict(self.stats)
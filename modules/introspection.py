@@ -0,0 +1,206 @@
+"""
+Introspection Module
+Per-table and per-index storage statistics without scanning large tables on demand.
+"""
+
+import sqlite3
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class DatabaseIntrospector:
+    """Cached storage statistics for every table and index.
+
+    Page counts and bytes come from the ``dbstat`` virtual table when SQLite
+    was built with it, otherwise only ``sqlite_stat1`` row estimates are
+    available. Exact row counts are refreshed in the background by counting
+    each table in short rowid-range chunks, so no single read holds a
+    snapshot open for long and admin screens never wait on a full scan.
+    """
+
+    def __init__(self, db_manager, size_ttl: float = 300.0, refresh_interval: float = 5.0,
+                 count_chunk_rows: int = 50000, chunks_per_step: int = 4):
+        self.db_manager = db_manager
+        self.size_ttl = size_ttl
+        self.refresh_interval = refresh_interval
+        self.count_chunk_rows = count_chunk_rows
+        self.chunks_per_step = chunks_per_step
+
+        self.has_dbstat: Optional[bool] = None
+        self._sizes: Dict[str, Dict[str, Any]] = {}
+        self._sizes_at = 0.0
+        # table -> {"rows", "counted_at"} from the last completed pass
+        self._exact_counts: Dict[str, Dict[str, Any]] = {}
+        # In-progress pass: (table, last rowid seen, rows so far)
+        self._count_cursor: Optional[List[Any]] = None
+        self._count_queue: List[str] = []
+        self._task: Optional[asyncio.Task] = None
+        self.stats = {
+            "size_refreshes": 0,
+            "count_chunks": 0,
+            "tables_counted": 0,
+            "errors": 0
+        }
+
+    def _read_sizes(self, conn: sqlite3.Connection) -> Dict[str, Dict[str, Any]]:
+        """Collect schema objects with dbstat sizes and sqlite_stat1 estimates (reader thread)"""
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT type, name, tbl_name FROM sqlite_master
+            WHERE type IN ('table', 'index')
+              -- substr rather than LIKE, where "_" would match any character
+              AND (substr(name, 1, 7) != 'sqlite_' OR substr(name, 1, 17) = 'sqlite_autoindex_')
+        ''')
+        objects = {name: {"type": kind, "table": table, "pages": None, "bytes": None,
+                          "unused_bytes": None, "estimated_rows": None}
+                   for kind, name, table in cursor.fetchall()}
+
+        if self.has_dbstat is not False:
+            try:
+                # aggregate=1 returns one row per b-tree instead of one per page
+                cursor.execute("SELECT name, pageno, pgsize, unused FROM dbstat('main', 1)")
+                for name, pages, size, unused in cursor.fetchall():
+                    if name in objects:
+                        objects[name].update(pages=pages, bytes=size, unused_bytes=unused)
+                self.has_dbstat = True
+            except sqlite3.OperationalError:
+                logger.info("dbstat is not available; table sizes fall back to sqlite_stat1 estimates")
+                self.has_dbstat = False
+
+        try:
+            cursor.execute("SELECT tbl, idx, stat FROM sqlite_stat1")
+            for table, index, stat in cursor.fetchall():
+                name = index or table
+                if name in objects and stat:
+                    objects[name]["estimated_rows"] = int(stat.split()[0])
+        except sqlite3.OperationalError:
+            # No ANALYZE / PRAGMA optimize has run yet
+            pass
+        return objects
+
+    async def refresh_sizes(self, force: bool = False) -> Dict[str, Dict[str, Any]]:
+        """Re-read page counts and estimates when older than ``size_ttl``"""
+        if force or not self._sizes or time.monotonic() - self._sizes_at >= self.size_ttl:
+            self._sizes = await self.db_manager.run_read(self._read_sizes)
+            self._sizes_at = time.monotonic()
+            self.stats["size_refreshes"] += 1
+        return self._sizes
+
+    def _count_chunk(self, conn: sqlite3.Connection, table: str, after_rowid: int) -> tuple:
+        """Count up to ``count_chunk_rows`` rows after a rowid; returns (rows, last rowid)"""
+        cursor = conn.cursor()
+        cursor.execute(f'''
+            SELECT COUNT(*), MAX(rowid) FROM (
+                SELECT rowid FROM "{table}" WHERE rowid > ? ORDER BY rowid LIMIT ?
+            )
+        ''', (after_rowid, self.count_chunk_rows))
+        return cursor.fetchone()
+
+    async def refresh_counts_step(self) -> int:
+        """Advance the background exact-count pass by a few chunks; returns chunks read"""
+        if self._count_cursor is None:
+            if not self._count_queue:
+                sizes = await self.refresh_sizes()
+                self._count_queue = sorted(name for name, info in sizes.items() if info["type"] == "table")
+                if not self._count_queue:
+                    return 0
+            self._count_cursor = [self._count_queue.pop(0), -(2 ** 63), 0]
+
+        chunks = 0
+        while chunks < self.chunks_per_step and self._count_cursor is not None:
+            table, after_rowid, rows = self._count_cursor
+            try:
+                count, last_rowid = await self.db_manager.run_read(self._count_chunk, table, after_rowid)
+            except sqlite3.OperationalError as e:
+                # Dropped table or one without a rowid; skip it this pass
+                logger.debug(f"Skipping row count for {table}: {e}")
+                self._exact_counts.pop(table, None)
+                self._count_cursor = None
+                break
+            chunks += 1
+            self.stats["count_chunks"] += 1
+            rows += count
+            if count < self.count_chunk_rows:
+                self._exact_counts[table] = {"rows": rows, "counted_at": datetime.now().isoformat()}
+                self.stats["tables_counted"] += 1
+                self._count_cursor = None
+            else:
+                self._count_cursor = [table, last_rowid, rows]
+        return chunks
+
+    async def get_table_stats(self) -> List[Dict[str, Any]]:
+        """Tables with their indexes, largest first, from cached sizes and counts"""
+        sizes = await self.refresh_sizes()
+        tables = {}
+        for name, info in sizes.items():
+            if info["type"] == "table":
+                counted = self._exact_counts.get(name)
+                tables[name] = {
+                    "name": name,
+                    "rows": counted["rows"] if counted else info["estimated_rows"],
+                    "rows_source": "exact" if counted else "sqlite_stat1" if info["estimated_rows"] is not None else "unknown",
+                    "counted_at": counted["counted_at"] if counted else None,
+                    "pages": info["pages"],
+                    "bytes": info["bytes"],
+                    "unused_bytes": info["unused_bytes"],
+                    "indexes": []
+                }
+        for name, info in sizes.items():
+            if info["type"] == "index" and info["table"] in tables:
+                tables[info["table"]]["indexes"].append({
+                    "name": name,
+                    "pages": info["pages"],
+                    "bytes": info["bytes"],
+                    "estimated_rows": info["estimated_rows"]
+                })
+        return sorted(tables.values(), key=lambda table: (table["bytes"] or 0, table["rows"] or 0), reverse=True)
+
+    def row_count(self, table: str) -> Optional[int]:
+        """Last exact row count of a table, if a pass has completed"""
+        counted = self._exact_counts.get(table)
+        return counted["rows"] if counted else None
+
+    async def _run(self):
+        """Keep counts and sizes fresh until cancelled"""
+        while True:
+            try:
+                await self.refresh_counts_step()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"Error refreshing database statistics: {e}")
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self):
+        """Start background refresh on the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop background refresh"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def close(self):
+        """Cancel background refresh without waiting"""
+        if self._task is not None:
+            self._task.cancel()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get introspection statistics"""
+        stats = dict(self.stats)
+        stats["has_dbstat"] = self.has_dbstat
+        stats["tables_with_exact_counts"] = len(self._exact_counts)
+        stats["counting"] = self._count_cursor[0] if self._count_cursor else None
+        stats["running"] = self._task is not None and not self._task.done()
+        return stats
@@ -0,0 +1,215 @@
+"""
+Latency Module
+Log-linear (HDR-style) latency histograms with percentiles for the Telegram bot.
+"""
+
+import time
+import threading
+import logging
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Values are recorded in microseconds. Below 2**SUB_BUCKET_BITS every value has its own
+# bucket; above it each power of two is split into 2**(SUB_BUCKET_BITS - 1) linear buckets,
+# which bounds the relative error of any reported percentile to about 1.6%.
+SUB_BUCKET_BITS = 7
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+SUB_BUCKET_HALF = SUB_BUCKET_COUNT >> 1
+
+def bucket_index(value_us: int) -> int:
+    """Bucket holding a non-negative integer microsecond value"""
+    if value_us < SUB_BUCKET_COUNT:
+        return value_us
+    shift = value_us.bit_length() - SUB_BUCKET_BITS
+    return SUB_BUCKET_COUNT + (shift - 1) * SUB_BUCKET_HALF + (value_us >> shift) - SUB_BUCKET_HALF
+
+def bucket_bounds(index: int) -> tuple:
+    """Inclusive lower and exclusive upper microsecond bounds of a bucket"""
+    if index < SUB_BUCKET_COUNT:
+        return index, index + 1
+    shift = (index - SUB_BUCKET_COUNT) // SUB_BUCKET_HALF + 1
+    sub_bucket = (index - SUB_BUCKET_COUNT) % SUB_BUCKET_HALF + SUB_BUCKET_HALF
+    return sub_bucket << shift, (sub_bucket + 1) << shift
+
+class LatencyHistogram:
+    """Sparse log-linear histogram of durations with count, error and extreme tracking"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget every recorded value"""
+        with self._lock:
+            self.buckets: Dict[int, int] = {}
+            self.count = 0
+            self.errors = 0
+            self.total_us = 0
+            self.min_us: Optional[int] = None
+            self.max_us = 0
+
+    def record(self, seconds: float, error: bool = False):
+        """Record one duration"""
+        value_us = max(0, int(seconds * 1_000_000))
+        index = bucket_index(value_us)
+        with self._lock:
+            self.buckets[index] = self.buckets.get(index, 0) + 1
+            self.count += 1
+            self.total_us += value_us
+            if error:
+                self.errors += 1
+            if self.min_us is None or value_us < self.min_us:
+                self.min_us = value_us
+            if value_us > self.max_us:
+                self.max_us = value_us
+
+    def merge(self, other: "LatencyHistogram"):
+        """Add another histogram's values into this one"""
+        with other._lock:
+            buckets = dict(other.buckets)
+            count, errors, total_us = other.count, other.errors, other.total_us
+            min_us, max_us = other.min_us, other.max_us
+        with self._lock:
+            for index, bucket_count in buckets.items():
+                self.buckets[index] = self.buckets.get(index, 0) + bucket_count
+            self.count += count
+            self.errors += errors
+            self.total_us += total_us
+            if min_us is not None and (self.min_us is None or min_us < self.min_us):
+                self.min_us = min_us
+            self.max_us = max(self.max_us, max_us)
+
+    def _percentiles_locked(self, quantiles) -> Dict[float, float]:
+        """Values in seconds at each quantile (0-100), reported as bucket midpoints"""
+        results = {}
+        if not self.count:
+            return {quantile: 0.0 for quantile in quantiles}
+        ordered = sorted(self.buckets.items())
+        for quantile in quantiles:
+            rank = max(1, int(round(quantile / 100.0 * self.count)))
+            seen = 0
+            for index, bucket_count in ordered:
+                seen += bucket_count
+                if seen >= rank:
+                    low, high = bucket_bounds(index)
+                    # Never report beyond the observed extremes
+                    value = min(max((low + high - 1) / 2.0, self.min_us), self.max_us)
+                    results[quantile] = value / 1_000_000
+                    break
+        return results
+
+    def percentile(self, quantile: float) -> float:
+        """Duration in seconds at the given percentile (0-100)"""
+        with self._lock:
+            return self._percentiles_locked([quantile])[quantile]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Summary with count, errors, mean, min, p50, p90, p99 and max (seconds)"""
+        with self._lock:
+            percentiles = self._percentiles_locked([50, 90, 99])
+            return {
+                "count": self.count,
+                "errors": self.errors,
+                "mean": (self.total_us / self.count / 1_000_000) if self.count else 0.0,
+                "min": (self.min_us or 0) / 1_000_000,
+                "p50": percentiles[50],
+                "p90": percentiles[90],
+                "p99": percentiles[99],
+                "max": self.max_us / 1_000_000
+            }
+
+class LatencyTracker:
+    """Per-name latency histograms since start plus a rolling recent window.
+
+    The window is kept as a ring of short slots, so "last 5 minutes" is
+    accurate to one slot without ever rescanning recorded values.
+    """
+
+    def __init__(self, window_seconds: float = 300.0, slot_seconds: float = 60.0):
+        self.window_seconds = window_seconds
+        self.slot_seconds = slot_seconds
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._totals: Dict[str, LatencyHistogram] = {}
+        # name -> deque of (slot number, histogram), oldest first
+        self._slots: Dict[str, deque] = {}
+
+    def _slot_histogram(self, name: str, slot: int) -> LatencyHistogram:
+        """Histogram for the current slot, dropping slots that left the window (lock held)"""
+        slots = self._slots.setdefault(name, deque())
+        if not slots or slots[-1][0] != slot:
+            slots.append((slot, LatencyHistogram()))
+        oldest = slot - int(self.window_seconds // self.slot_seconds)
+        while slots and slots[0][0] < oldest:
+            slots.popleft()
+        return slots[-1][1]
+
+    def record(self, name: str, seconds: float, error: bool = False):
+        """Record one duration under a name"""
+        slot = int(time.time() // self.slot_seconds)
+        with self._lock:
+            total = self._totals.get(name)
+            if total is None:
+                total = self._totals[name] = LatencyHistogram()
+            current = self._slot_histogram(name, slot)
+        total.record(seconds, error)
+        current.record(seconds, error)
+
+    @contextmanager
+    def time(self, name: str):
+        """Context manager recording the duration of its block (errors flagged)"""
+        start = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.record(name, time.perf_counter() - start, error)
+
+    def histogram(self, name: str, window: bool = False) -> LatencyHistogram:
+        """Merged histogram for a name, since start or over the recent window"""
+        if not window:
+            with self._lock:
+                return self._totals.get(name) or LatencyHistogram()
+        oldest = int(time.time() // self.slot_seconds) - int(self.window_seconds // self.slot_seconds)
+        with self._lock:
+            slots = [histogram for slot, histogram in self._slots.get(name, ()) if slot >= oldest]
+        merged = LatencyHistogram()
+        for histogram in slots:
+            merged.merge(histogram)
+        return merged
+
+    def snapshot(self, window: bool = False, reset: bool = False) -> Dict[str, Dict[str, Any]]:
+        """Summaries per name; ``reset`` clears the chosen view after reading it"""
+        with self._lock:
+            names = list(self._totals)
+        summaries = {}
+        for name in names:
+            summary = self.histogram(name, window).snapshot()
+            if summary["count"]:
+                summaries[name] = summary
+        if reset:
+            self.reset(window=window)
+        return summaries
+
+    def reset(self, window: bool = False):
+        """Clear the recent window, or everything recorded since start"""
+        with self._lock:
+            self._slots.clear()
+            if not window:
+                self._totals.clear()
+                self.started_at = time.time()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Both views, for reporting"""
+        return {
+            "since": self.started_at,
+            "window_seconds": self.window_seconds,
+            "window": self.snapshot(window=True),
+            "total": self.snapshot()
+        }
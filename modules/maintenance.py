@@ -0,0 +1,230 @@
+"""
+Maintenance Module
+Background incremental vacuum and statistics refresh for the SQLite database.
+"""
+
+import os
+import time
+import shutil
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# PRAGMA auto_vacuum values
+AUTO_VACUUM_MODES = {0: "none", 1: "full", 2: "incremental"}
+
+class MaintenanceScheduler:
+    """Reclaims free pages in small slices while the database is quiet.
+
+    Each slice is one ``PRAGMA incremental_vacuum(pages_per_slice)`` on the
+    writer thread, so the write lock is held for milliseconds instead of the
+    whole-file rewrite of ``VACUUM``. Statistics are refreshed with
+    ``PRAGMA optimize`` under an ``analysis_limit`` rather than a full ``ANALYZE``.
+    """
+
+    def __init__(self, db_manager, interval: float = 60.0, pages_per_slice: int = 256,
+                 max_slices_per_run: int = 20, min_free_pages: int = 64, quiet_ops: int = 30,
+                 optimize_interval: float = 3600.0, analysis_limit: int = 400,
+                 slice_pause: float = 0.05):
+        self.db_manager = db_manager
+        self.interval = interval
+        self.pages_per_slice = pages_per_slice
+        self.max_slices_per_run = max_slices_per_run
+        self.min_free_pages = min_free_pages
+        # At most this many database calls per interval counts as a quiet period
+        self.quiet_ops = quiet_ops
+        self.optimize_interval = optimize_interval
+        self.analysis_limit = analysis_limit
+        self.slice_pause = slice_pause
+
+        self._task: Optional[asyncio.Task] = None
+        # auto_vacuum mode once known; files without incremental mode only get PRAGMA optimize
+        self.mode: Optional[str] = None
+        self._last_ops = self._executor_ops()
+        self._last_optimize = time.monotonic()
+        self.stats = {
+            "runs": 0,
+            "busy_skips": 0,
+            "slices": 0,
+            "pages_reclaimed": 0,
+            "bytes_reclaimed": 0,
+            "total_lock_time": 0.0,
+            "max_lock_time": 0.0,
+            "last_slice": None,
+            "optimize_runs": 0,
+            "last_optimize": None,
+            "conversions": 0,
+            "errors": 0
+        }
+
+    def _executor_ops(self) -> int:
+        stats = self.db_manager.executor.stats
+        return stats["reads"] + stats["writes"]
+
+    def is_quiet(self) -> bool:
+        """Whether few database calls happened since the previous check and nothing is queued"""
+        ops = self._executor_ops()
+        recent, self._last_ops = ops - self._last_ops, ops
+        return (recent <= self.quiet_ops and not self.db_manager.write_queue.pending
+                and self.db_manager.pool.stats["in_use"] == 0)
+
+    async def get_auto_vacuum_mode(self) -> str:
+        """Current auto_vacuum mode of the database file"""
+        def query(conn):
+            return conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        mode = await self.db_manager.run_read(query)
+        return AUTO_VACUUM_MODES.get(mode, str(mode))
+
+    async def convert_to_incremental(self) -> str:
+        """Switch the file to auto_vacuum=INCREMENTAL, rebuilding it with one full VACUUM if needed.
+
+        New databases get the mode from the connection pool; older files need
+        this one-off rewrite, which holds an exclusive lock for its whole
+        duration (blocking every process, including the main bot) and needs
+        free disk for a full copy. It is never run by the scheduler, only by
+        an explicit operator command.
+        """
+        def convert(conn):
+            mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+            if mode == 2:
+                return "incremental", 0.0
+            size = os.path.getsize(self.db_manager.db_path)
+            free = shutil.disk_usage(os.path.dirname(os.path.abspath(self.db_manager.db_path))).free
+            if free < 2 * size:
+                logger.warning(f"Not enough disk to enable incremental vacuum ({free} bytes free, {size} bytes database)")
+                return AUTO_VACUUM_MODES.get(mode, str(mode)), 0.0
+            start = time.perf_counter()
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            conn.execute("VACUUM")
+            return AUTO_VACUUM_MODES.get(conn.execute("PRAGMA auto_vacuum").fetchone()[0]), time.perf_counter() - start
+
+        mode, elapsed = await self.db_manager.run_write(convert, timeout=600)
+        self.mode = mode
+        if elapsed:
+            self.stats["conversions"] += 1
+            logger.info(f"Database switched to auto_vacuum={mode} with a one-time VACUUM ({elapsed:.2f}s)")
+        return mode
+
+    async def vacuum_slice(self) -> Dict[str, Any]:
+        """Reclaim up to ``pages_per_slice`` free pages in one short write transaction"""
+        def vacuum(conn):
+            free_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+            if free_before < self.min_free_pages:
+                return free_before, free_before, 0.0, page_size
+            start = time.perf_counter()
+            # executescript steps the pragma to completion; execute() would free a single page
+            conn.executescript(f"PRAGMA incremental_vacuum({int(self.pages_per_slice)})")
+            lock_time = time.perf_counter() - start
+            return free_before, conn.execute("PRAGMA freelist_count").fetchone()[0], lock_time, page_size
+
+        free_before, free_after, lock_time, page_size = await self.db_manager.run_write(vacuum)
+        pages = free_before - free_after
+        result = {
+            "pages": pages,
+            "bytes": pages * page_size,
+            "lock_time": lock_time,
+            "free_pages": free_after,
+            "timestamp": datetime.now().isoformat()
+        }
+        if pages:
+            self.stats["slices"] += 1
+            self.stats["pages_reclaimed"] += pages
+            self.stats["bytes_reclaimed"] += result["bytes"]
+            self.stats["total_lock_time"] += lock_time
+            self.stats["max_lock_time"] = max(self.stats["max_lock_time"], lock_time)
+            self.stats["last_slice"] = result
+            logger.debug(f"Incremental vacuum reclaimed {pages} pages in {lock_time * 1000:.1f}ms "
+                         f"({free_after} free pages left)")
+        return result
+
+    async def optimize(self) -> float:
+        """Refresh planner statistics for tables that need it, bounded by analysis_limit"""
+        def optimize(conn):
+            start = time.perf_counter()
+            conn.execute(f"PRAGMA analysis_limit={int(self.analysis_limit)}")
+            conn.execute("PRAGMA optimize").fetchall()
+            return time.perf_counter() - start
+
+        elapsed = await self.db_manager.run_write(optimize)
+        self._last_optimize = time.monotonic()
+        self.stats["optimize_runs"] += 1
+        self.stats["last_optimize"] = {"elapsed": elapsed, "timestamp": datetime.now().isoformat()}
+        return elapsed
+
+    async def run_once(self, force: bool = False) -> Dict[str, Any]:
+        """One maintenance pass: vacuum slices and, when due, PRAGMA optimize (only when quiet unless forced)"""
+        self.stats["runs"] += 1
+        if not force and not self.is_quiet():
+            self.stats["busy_skips"] += 1
+            return {"skipped": True}
+
+        if self.mode is None:
+            self.mode = await self.get_auto_vacuum_mode()
+
+        pages, lock_time = 0, 0.0
+        for _ in range(self.max_slices_per_run if self.mode == "incremental" else 0):
+            result = await self.vacuum_slice()
+            pages += result["pages"]
+            lock_time = max(lock_time, result["lock_time"])
+            if not result["pages"] or result["free_pages"] < self.min_free_pages:
+                break
+            # Give queued reads and writes a turn between slices
+            await asyncio.sleep(self.slice_pause)
+            if not force and self.db_manager.write_queue.pending:
+                break
+
+        optimized = False
+        if force or time.monotonic() - self._last_optimize >= self.optimize_interval:
+            await self.optimize()
+            optimized = True
+
+        if pages:
+            logger.info(f"Maintenance reclaimed {pages} pages (max slice lock {lock_time * 1000:.1f}ms)")
+        self._last_ops = self._executor_ops()
+        return {"skipped": False, "pages": pages, "max_lock_time": lock_time, "optimized": optimized}
+
+    async def _run(self):
+        """Run maintenance passes until cancelled"""
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"Error running database maintenance: {e}")
+
+    def start(self):
+        """Start the scheduler on the running event loop"""
+        if self._task is None or self._task.done():
+            self._last_ops = self._executor_ops()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+            logger.info(f"Database maintenance scheduler started (every {self.interval}s)")
+
+    async def stop(self):
+        """Stop the scheduler and wait for the current pass to finish"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get maintenance statistics"""
+        stats = dict(self.stats)
+        stats["running"] = self._task is not None and not self._task.done()
+        stats["auto_vacuum"] = self.mode
+        stats["avg_lock_time"] = stats["total_lock_time"] / stats["slices"] if stats["slices"] else 0.0
+        return stats
+
+    def close(self):
+        """Cancel the scheduler task without waiting"""
+        if self._task is not None:
+            self._task.cancel()
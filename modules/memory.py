@@ -0,0 +1,208 @@
+"""
+Memory Module
+Process memory watchdog that sheds in-memory state in stages before the dyno hits its cap.
+"""
+
+import os
+import gc
+import time
+import ctypes
+import asyncio
+import logging
+import psutil
+from collections import deque
+from datetime import datetime
+from typing import Callable, Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Heroku standard-1X / eco dynos
+DEFAULT_MEMORY_LIMIT_MB = 512
+
+# Shedding stages, cheapest first, with the share of the memory limit that triggers each
+STAGE_THRESHOLDS = {
+    "evict_cache": 0.70,
+    "trim_analytics": 0.80,
+    "gc": 0.90
+}
+
+def detect_memory_limit() -> int:
+    """Memory limit in bytes: MEMORY_LIMIT_MB, else the cgroup limit, else the Heroku default"""
+    configured = os.getenv("MEMORY_LIMIT_MB")
+    if configured:
+        return int(float(configured) * 1024 * 1024)
+    for path in ("/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes"):
+        try:
+            with open(path) as f:
+                value = f.read().strip()
+        except OSError:
+            continue
+        # "max" or a huge sentinel means unlimited
+        if value.isdigit() and int(value) < psutil.virtual_memory().total:
+            return int(value)
+    return DEFAULT_MEMORY_LIMIT_MB * 1024 * 1024
+
+def release_free_heap() -> bool:
+    """Ask glibc to return freed heap pages to the OS (no-op elsewhere)"""
+    try:
+        return bool(ctypes.CDLL("libc.so.6").malloc_trim(0))
+    except (OSError, AttributeError):
+        return False
+
+class MemoryWatchdog:
+    """Samples process RSS and sheds registered in-memory state in stages.
+
+    Consumers register a ``size`` callback (approximate bytes held) and a
+    ``shed`` callback for one stage. When RSS crosses a stage threshold, that
+    stage and every cheaper one run, each at most once per ``cooldown``.
+    """
+
+    def __init__(self, limit_bytes: Optional[int] = None, interval: float = 15.0,
+                 cooldown: float = 60.0, thresholds: Optional[Dict[str, float]] = None):
+        self.limit_bytes = limit_bytes or detect_memory_limit()
+        self.interval = interval
+        self.cooldown = cooldown
+        self.thresholds = {**STAGE_THRESHOLDS, **(thresholds or {})}
+        self._process = psutil.Process()
+        self._consumers: Dict[str, Dict[str, Any]] = {}
+        self._last_run: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.actions = deque(maxlen=20)
+        self.last_sample: Optional[Dict[str, Any]] = None
+        self.stats = {
+            "samples": 0,
+            "peak_rss": 0,
+            "actions": 0,
+            "errors": 0
+        }
+        self.register("gc", "gc", size=None, shed=self._collect_garbage)
+
+    def register(self, name: str, stage: str, size: Optional[Callable[[], int]] = None,
+                 shed: Optional[Callable[[], Dict[str, Any]]] = None):
+        """Register a memory consumer; ``shed`` returns a dict describing what it released"""
+        if stage not in self.thresholds:
+            raise ValueError(f"Unknown memory stage: {stage}")
+        self._consumers[name] = {"stage": stage, "size": size, "shed": shed}
+
+    @staticmethod
+    def _collect_garbage() -> Dict[str, Any]:
+        collected = gc.collect()
+        return {"objects_collected": collected, "heap_trimmed": release_free_heap()}
+
+    def rss(self) -> int:
+        """Current resident set size in bytes"""
+        return self._process.memory_info().rss
+
+    def consumer_sizes(self) -> Dict[str, int]:
+        """Approximate bytes held by each registered consumer"""
+        sizes = {}
+        for name, consumer in self._consumers.items():
+            if consumer["size"] is not None:
+                try:
+                    sizes[name] = int(consumer["size"]())
+                except Exception as e:
+                    logger.error(f"Error measuring {name} memory: {e}")
+        return sizes
+
+    def sample(self) -> Dict[str, Any]:
+        """Measure RSS and consumer sizes without running any stage (read-only)"""
+        rss = self.rss()
+        usage = rss / self.limit_bytes
+        crossed = [stage for stage, threshold in self.thresholds.items() if usage >= threshold]
+        return {
+            "rss": rss,
+            "usage": usage,
+            # The stage a check() would run now, reported but not run
+            "stage": max(crossed, key=self.thresholds.get) if crossed else None,
+            "consumers": self.consumer_sizes(),
+            "timestamp": datetime.now().isoformat()
+        }
+
+    def check(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """Sample RSS once and run every stage whose threshold is crossed"""
+        now = time.monotonic() if now is None else now
+        rss = self.rss()
+        usage = rss / self.limit_bytes
+        self.stats["samples"] += 1
+        self.stats["peak_rss"] = max(self.stats["peak_rss"], rss)
+
+        stage = None
+        for candidate, threshold in sorted(self.thresholds.items(), key=lambda item: item[1]):
+            if usage < threshold:
+                break
+            stage = candidate
+            if now - self._last_run.get(candidate, float("-inf")) < self.cooldown:
+                continue
+            self._last_run[candidate] = now
+            for name, consumer in self._consumers.items():
+                if consumer["stage"] == candidate and consumer["shed"] is not None:
+                    self._shed(name, candidate, consumer["shed"], usage)
+
+        self.last_sample = {
+            "rss": rss,
+            "usage": usage,
+            "stage": stage,
+            "consumers": self.consumer_sizes(),
+            "timestamp": datetime.now().isoformat()
+        }
+        return self.last_sample
+
+    def _shed(self, name: str, stage: str, shed: Callable[[], Dict[str, Any]], usage: float):
+        """Run one shedding action and record what it did"""
+        rss_before = self.rss()
+        try:
+            result = shed() or {}
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"Error shedding {name} memory: {e}")
+            return
+        rss_after = self.rss()
+        self.stats["actions"] += 1
+        action = {
+            "stage": stage,
+            "consumer": name,
+            "usage": usage,
+            "rss_before": rss_before,
+            "rss_after": rss_after,
+            "result": result,
+            "timestamp": datetime.now().isoformat()
+        }
+        self.actions.append(action)
+        logger.warning(f"Memory at {usage:.0%} of limit: {stage}/{name} {result} "
+                       f"(RSS {rss_before / 1024 / 1024:.1f} -> {rss_after / 1024 / 1024:.1f} MB)")
+
+    async def _run(self):
+        """Sample until cancelled"""
+        while True:
+            try:
+                self.check()
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"Error in memory watchdog: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """Start sampling on the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+            logger.info(f"Memory watchdog started (limit {self.limit_bytes / 1024 / 1024:.0f} MB)")
+
+    async def stop(self):
+        """Stop sampling"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get watchdog statistics, the latest sample and recent actions"""
+        stats = dict(self.stats)
+        stats["limit_bytes"] = self.limit_bytes
+        stats["thresholds"] = dict(self.thresholds)
+        stats["last_sample"] = self.last_sample
+        stats["recent_actions"] = list(self.actions)
+        stats["running"] = self._task is not None and not self._task.done()
+        return stats
@@ -0,0 +1,470 @@
+"""
+Migrations Module
+Versioned schema migrations keyed on SQLite's PRAGMA user_version.
+"""
+
+import sqlite3
+import logging
+from typing import Callable, List, Tuple
+from modules.engagement import register_sql_functions, event_exponent_sql
+
+logger = logging.getLogger(__name__)
+
+def _migration_001_base_schema(conn: sqlite3.Connection):
+    """Core bot tables and indexes"""
+    cursor = conn.cursor()
+
+    # Users table - Main user information
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id INTEGER PRIMARY KEY,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            language TEXT DEFAULT 'ru',
+            city TEXT,
+            timezone TEXT,
+            timezone_offset TEXT,
+            timezone_name TEXT,
+            messaging_enabled BOOLEAN DEFAULT TRUE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_activity TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # User states table - Current state and temporary data
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_states (
+            user_id INTEGER PRIMARY KEY,
+            current_state TEXT,
+            state_data TEXT,
+            onboarding_step INTEGER DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+
+    # User messages table - All messages from users
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            message_text TEXT,
+            message_type TEXT DEFAULT 'text',
+            module_context TEXT,
+            state_context TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+
+    # Bot messages table - All messages sent by bot
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS bot_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            message_text TEXT,
+            message_type TEXT DEFAULT 'text',
+            module_context TEXT,
+            state_context TEXT,
+            sent_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+
+    # User preferences table - Detailed user preferences
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_preferences (
+            user_id INTEGER PRIMARY KEY,
+            key_texts TEXT,
+            content_preferences TEXT,
+            delivery_preferences TEXT,
+            communication_preferences TEXT,
+            goals TEXT,
+            challenges TEXT,
+            setup_completed BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+
+    # Subscriptions table - Subscription management (goal-oriented)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS subscriptions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            order_id TEXT UNIQUE,
+            user_goal TEXT,
+            subscription_type TEXT,
+            plan_name TEXT,
+            plan_price TEXT,
+            plan_duration TEXT,
+            plan_approach TEXT,
+            plan_result_time TEXT,
+            status TEXT DEFAULT 'pending_payment',
+            start_date TIMESTAMP,
+            end_date TIMESTAMP,
+            payment_id TEXT,
+            payment_method TEXT,
+            auto_renewal BOOLEAN DEFAULT FALSE,
+            goal_achieved BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+
+    # Content delivery table - All content sent to users
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS content_delivery (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            order_id TEXT,
+            content_type TEXT,
+            content_text TEXT,
+            delivery_method TEXT DEFAULT 'telegram',
+            delivery_status TEXT DEFAULT 'sent',
+            iteration_number INTEGER,
+            feedback TEXT,
+            feedback_rating INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            delivered_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id),
+            FOREIGN KEY (order_id) REFERENCES subscriptions (order_id)
+        )
+    ''')
+
+    # User sessions table - Track user interaction sessions
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            session_start TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            session_end TIMESTAMP,
+            messages_count INTEGER DEFAULT 0,
+            modules_used TEXT,
+            session_data TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+
+    # User feedback table - Store all user feedback
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_feedback (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            feedback_type TEXT,
+            feedback_text TEXT,
+            rating INTEGER,
+            content_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id),
+            FOREIGN KEY (content_id) REFERENCES content_delivery (id)
+        )
+    ''')
+
+    # Create indexes for better performance
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_messages_user_id ON user_messages(user_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_messages_created_at ON user_messages(created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_bot_messages_user_id ON bot_messages(user_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_bot_messages_sent_at ON bot_messages(sent_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_content_delivery_user_id ON content_delivery(user_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_content_delivery_delivered_at ON content_delivery(delivered_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_sessions_user_id ON user_sessions(user_id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_feedback_user_id ON user_feedback(user_id)')
+
+def _migration_002_user_counters(conn: sqlite3.Connection):
+    """Trigger-maintained per-user counters, backfilled from existing rows"""
+    from modules.database import DatabaseManager
+
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_counters'")
+    counters_existed = cursor.fetchone() is not None
+    DatabaseManager._create_user_counters(cursor)
+    if not counters_existed:
+        DatabaseManager._rebuild_user_counters(conn)
+
+def _migration_003_admin_tables(conn: sqlite3.Connection):
+    """Admin bot action and log tables"""
+    cursor = conn.cursor()
+
+    # Admin actions table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS admin_actions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            admin_user_id INTEGER NOT NULL,
+            action_type TEXT NOT NULL,
+            target_user_id INTEGER,
+            action_data TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            status TEXT DEFAULT 'completed'
+        )
+    ''')
+
+    # Admin logs table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS admin_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            admin_user_id INTEGER NOT NULL,
+            log_level TEXT NOT NULL,
+            message TEXT NOT NULL,
+            context TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def _migration_004_history_keyset_indexes(conn: sqlite3.Connection):
+    """Composite (user_id, time) indexes for keyset-paginated history reads"""
+    cursor = conn.cursor()
+
+    # The implicit rowid suffix makes these cover (user_id, time, id) keyset cursors
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_user_messages_user_created ON user_messages(user_id, created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_bot_messages_user_sent ON bot_messages(user_id, sent_at)')
+
+    # Single-column user_id indexes are now redundant prefixes of the composite ones
+    cursor.execute('DROP INDEX IF EXISTS idx_user_messages_user_id')
+    cursor.execute('DROP INDEX IF EXISTS idx_bot_messages_user_id')
+
+def _migration_005_analytics_events(conn: sqlite3.Connection):
+    """Typed analytics_events table; moves tracked events out of user_messages"""
+    cursor = conn.cursor()
+
+    # Analytics events table - Tracked actions, conversions and feature usage
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS analytics_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            event_kind TEXT NOT NULL,
+            name TEXT NOT NULL,
+            value NUMERIC,
+            details TEXT,
+            ts TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_analytics_events_user_ts ON analytics_events(user_id, ts)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_analytics_events_kind_name_ts ON analytics_events(event_kind, name, ts)')
+
+    # Copy the JSON blobs the tracker used to write into user_messages, then drop them there
+    cursor.execute('''
+        INSERT INTO analytics_events (user_id, event_kind, name, value, details, ts)
+        SELECT
+            user_id,
+            CASE message_type
+                WHEN 'analytics_track' THEN 'action'
+                WHEN 'conversion_track' THEN 'conversion'
+                ELSE 'feature'
+            END,
+            COALESCE(
+                CASE WHEN json_valid(message_text) THEN json_extract(
+                    message_text,
+                    CASE message_type
+                        WHEN 'analytics_track' THEN '$.action'
+                        WHEN 'conversion_track' THEN '$.conversion_type'
+                        ELSE '$.feature'
+                    END
+                ) END,
+                state_context,
+                'unknown'
+            ),
+            CASE WHEN json_valid(message_text) THEN json_extract(message_text, '$.value') END,
+            CASE WHEN json_valid(message_text) THEN json_extract(message_text, '$.details') END,
+            COALESCE(created_at, CURRENT_TIMESTAMP)
+        FROM user_messages
+        WHERE message_type IN ('analytics_track', 'conversion_track', 'feature_usage')
+        ORDER BY id
+    ''')
+    if cursor.rowcount:
+        logger.info(f"Moved {cursor.rowcount} tracked events from user_messages to analytics_events")
+    cursor.execute('''
+        DELETE FROM user_messages
+        WHERE message_type IN ('analytics_track', 'conversion_track', 'feature_usage')
+    ''')
+
+def _migration_006_change_log(conn: sqlite3.Connection):
+    """change_log table filled by triggers, for cross-process cache invalidation"""
+    cursor = conn.cursor()
+
+    # Change log table - (table, user_id) touched by any process, in commit order
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS change_log (
+            seq INTEGER PRIMARY KEY AUTOINCREMENT,
+            table_name TEXT NOT NULL,
+            key INTEGER,
+            changed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_change_log_changed_at ON change_log(changed_at)')
+
+    # users: last_activity is bumped on every message and is not worth invalidating for
+    watched = {
+        'users': 'UPDATE OF username, first_name, last_name, language, city, timezone, '
+                 'timezone_offset, timezone_name, messaging_enabled',
+        'user_states': 'UPDATE',
+        'user_preferences': 'UPDATE',
+        'subscriptions': 'UPDATE'
+    }
+    for table, update_event in watched.items():
+        for event, row in (('INSERT', 'NEW'), (update_event, 'NEW'), ('DELETE', 'OLD')):
+            suffix = event.split()[0].lower()
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_change_log_{suffix}
+                AFTER {event} ON {table}
+                BEGIN
+                    INSERT INTO change_log (table_name, key) VALUES ('{table}', {row}.user_id);
+                END
+            ''')
+
+def _migration_007_daily_rollups(conn: sqlite3.Connection):
+    """daily_stats rollups and their per-source high-water marks"""
+    cursor = conn.cursor()
+
+    # Daily stats table - Row counts per day, message type and plan type, filled by RollupManager
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_stats (
+            day TEXT NOT NULL,
+            message_type TEXT NOT NULL DEFAULT '',
+            plan_type TEXT NOT NULL DEFAULT '',
+            user_messages INTEGER NOT NULL DEFAULT 0,
+            bot_messages INTEGER NOT NULL DEFAULT 0,
+            new_users INTEGER NOT NULL DEFAULT 0,
+            new_subscriptions INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, message_type, plan_type)
+        )
+    ''')
+
+    # Daily active users table - Distinct (day, user) pairs, since distinct counts cannot be summed
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_active_users (
+            day TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            PRIMARY KEY (day, user_id)
+        )
+    ''')
+
+    # Rollup watermarks table - Last id (or created_at) of each source table already counted
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rollup_watermarks (
+            source TEXT PRIMARY KEY,
+            high_water,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # users has no increasing id (user_id is the Telegram id), so new rows are found by created_at
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_created_at ON users(created_at)')
+
+def _migration_008_analytics_counters(conn: sqlite3.Connection):
+    """analytics_counters checkpoint of the in-memory analytics counters"""
+    cursor = conn.cursor()
+
+    # Analytics counters table - Last checkpointed value of each (counter, name) and when it was taken
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS analytics_counters (
+            counter TEXT NOT NULL,
+            name TEXT NOT NULL,
+            value REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (counter, name)
+        )
+    ''')
+
+def _migration_009_engagement_score(conn: sqlite3.Connection):
+    """users.engagement_log forward-decayed engagement score, indexed for ranking"""
+    cursor = conn.cursor()
+    register_sql_functions(conn)
+
+    cursor.execute('ALTER TABLE users ADD COLUMN engagement_log REAL')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_engagement ON users(engagement_log)')
+
+    # Seed scores from the events tracked so far
+    cursor.execute(f'''
+        UPDATE users SET engagement_log = (
+            SELECT logsumexp2({event_exponent_sql('ts')}) FROM analytics_events
+            WHERE analytics_events.user_id = users.user_id
+        )
+    ''')
+
+def _migration_010_change_log_origin(conn: sqlite3.Connection):
+    """change_log.origin so a process can skip the changes it made itself"""
+    cursor = conn.cursor()
+
+    # NULL for writers that do not stamp it (other tools, older code); treated as foreign
+    cursor.execute('ALTER TABLE change_log ADD COLUMN origin INTEGER')
+
+def _migration_011_user_counters_null_guard(conn: sqlite3.Connection):
+    """Recreate the user_counters triggers so rows without a user_id only count globally"""
+    from modules.database import DatabaseManager
+
+    cursor = conn.cursor()
+    DatabaseManager._drop_user_counter_triggers(cursor)
+    DatabaseManager._create_user_counters(cursor)
+    # Drops the stray rows the old insert trigger created for NULL user_ids
+    DatabaseManager._rebuild_user_counters(conn)
+
+# (version, description, migration) - append only, never renumber or edit an applied migration.
+# Early migrations use IF NOT EXISTS so databases created before versioning adopt them cleanly.
+SCHEMA_MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "base schema", _migration_001_base_schema),
+    (2, "user counters", _migration_002_user_counters),
+    (3, "admin tables", _migration_003_admin_tables),
+    (4, "history keyset indexes", _migration_004_history_keyset_indexes),
+    (5, "analytics events", _migration_005_analytics_events),
+    (6, "change log", _migration_006_change_log),
+    (7, "daily rollups", _migration_007_daily_rollups),
+    (8, "analytics counters", _migration_008_analytics_counters),
+    (9, "engagement score", _migration_009_engagement_score),
+    (10, "change log origin", _migration_010_change_log_origin),
+    (11, "user counters null guard", _migration_011_user_counters_null_guard),
+]
+
+class SchemaMigrator:
+    """Applies pending numbered migrations and records progress in PRAGMA user_version"""
+
+    def __init__(self, migrations: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = None):
+        migrations = SCHEMA_MIGRATIONS if migrations is None else migrations
+        self.migrations = sorted(migrations, key=lambda migration: migration[0])
+        versions = [migration[0] for migration in self.migrations]
+        if len(set(versions)) != len(versions) or any(version < 1 for version in versions):
+            raise ValueError(f"Migration versions must be unique and positive: {versions}")
+
+    @property
+    def latest_version(self) -> int:
+        """Schema version after all known migrations are applied"""
+        return self.migrations[-1][0] if self.migrations else 0
+
+    @staticmethod
+    def get_version(conn: sqlite3.Connection) -> int:
+        """Read the schema version stored in the database header"""
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+    def pending(self, conn: sqlite3.Connection) -> List[Tuple[int, str, Callable[[sqlite3.Connection], None]]]:
+        """Migrations newer than the database's schema version"""
+        version = self.get_version(conn)
+        return [migration for migration in self.migrations if migration[0] > version]
+
+    def migrate(self, conn: sqlite3.Connection) -> List[int]:
+        """Apply pending migrations in one transaction; returns the versions applied"""
+        # Fast path: a header read, no DDL and no write lock when the schema is current
+        if self.get_version(conn) >= self.latest_version:
+            return []
+
+        if conn.in_transaction:
+            conn.commit()
+        # Take the write lock up front, then re-check in case another process migrated first
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            pending = self.pending(conn)
+            for version, description, migration in pending:
+                logger.info(f"Applying schema migration {version}: {description}")
+                migration(conn)
+            if pending:
+                conn.execute(f"PRAGMA user_version = {int(pending[-1][0])}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+        return [migration[0] for migration in pending]
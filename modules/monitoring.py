@@ -5,7 +5,6 @@ Provides comprehensive monitoring and logging for the Telegram bot.
 
 import logging
 import psutil
-import sqlite3
 import os
 import json
 from datetime import datetime, timedelta
@@ -19,9 +18,11 @@ logger = logging.getLogger(__name__)
 class MonitoringManager:
     """Centralized monitoring and logging manager"""
     
-    def __init__(self, db_manager, bot_instance=None):
+    def __init__(self, db_manager, bot_instance=None, performance_manager=None):
         self.db_manager = db_manager
         self.bot_instance = bot_instance
+        # Optional PerformanceManager whose cache warm-up gates readiness
+        self.performance_manager = performance_manager
         self.metrics = {
             "start_time": datetime.now(),
             "total_messages": 0,
@@ -111,43 +112,47 @@ class MonitoringManager:
     async def get_user_statistics(self, user_id: int) -> Dict[str, Any]:
         """Get statistics for a specific user"""
         try:
-            # Get user messages
-            messages = await self.db_manager.get_user_messages(user_id, limit=1000)
-            
-            # Calculate statistics
-            total_messages = len(messages)
-            user_messages = len([m for m in messages if m['message_type'] == 'user_message'])
-            bot_messages = len([m for m in messages if m['message_type'] == 'bot_message'])
-            
-            # Get subscription info
-            subscription = await self.db_manager.get_active_subscription(user_id)
-            
-            # Get user profile
-            profile = await self.db_manager.get_user_profile(user_id)
-            
-            stats = {
-                "user_id": user_id,
-                "total_messages": total_messages,
-                "user_messages": user_messages,
-                "bot_messages": bot_messages,
-                "has_active_subscription": subscription is not None,
-                "subscription_type": subscription['subscription_type'] if subscription else None,
-                "user_goal": subscription['user_goal'] if subscription else None,
-                "created_at": profile['created_at'] if profile else None,
-                "last_activity": profile['last_activity'] if profile else None
-            }
-            
-            return stats
+            # Counts, active subscription and profile come back from one aggregated query
+            user_stats = await self.db_manager.get_user_statistics(user_id)
+            return self._format_user_statistics(user_stats)
             
         except Exception as e:
             logger.error(f"Error getting user statistics: {e}")
             return {}
     
+    async def get_users_statistics(self, user_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Get statistics for many users at once, keyed by user_id"""
+        try:
+            users_stats = await self.db_manager.get_users_statistics(user_ids)
+            return {user_id: self._format_user_statistics(stats) for user_id, stats in users_stats.items()}
+            
+        except Exception as e:
+            logger.error(f"Error getting users statistics: {e}")
+            return {}
+    
+    def _format_user_statistics(self, user_stats: Dict[str, Any]) -> Dict[str, Any]:
+        """Shape DatabaseManager statistics into the monitoring format"""
+        counts = user_stats['statistics']
+        subscription = user_stats['active_subscription']
+        profile = user_stats['profile']
+        
+        return {
+            "user_id": user_stats['user_id'],
+            "total_messages": counts['user_messages_count'] + counts['bot_messages_count'],
+            "user_messages": counts['user_messages_count'],
+            "bot_messages": counts['bot_messages_count'],
+            "has_active_subscription": subscription is not None,
+            "subscription_type": subscription['subscription_type'] if subscription else None,
+            "user_goal": subscription['user_goal'] if subscription else None,
+            "created_at": profile['created_at'] if profile else None,
+            "last_activity": profile['last_activity'] if profile else None
+        }
+    
     async def get_system_statistics(self) -> Dict[str, Any]:
         """Get overall system statistics"""
         try:
             # Get database statistics
-            with sqlite3.connect(self.db_manager.db_path) as conn:
+            def query(conn):
                 cursor = conn.cursor()
                 
                 # Count users
@@ -158,12 +163,17 @@ class MonitoringManager:
                 cursor.execute("SELECT COUNT(*) FROM subscriptions WHERE status = 'active'")
                 active_subscriptions = cursor.fetchone()[0]
                 
-                # Count messages
-                cursor.execute("SELECT COUNT(*) FROM user_messages")
-                total_user_messages = cursor.fetchone()[0]
+                # Count messages (trigger-maintained global counters row)
+                cursor.execute(
+                    "SELECT user_messages_count, bot_messages_count FROM user_counters WHERE user_id = ?",
+                    (self.db_manager.GLOBAL_COUNTERS_ID,)
+                )
+                total_user_messages, total_bot_messages = cursor.fetchone() or (0, 0)
                 
-                cursor.execute("SELECT COUNT(*) FROM bot_messages")
-                total_bot_messages = cursor.fetchone()[0]
+                return total_users, active_subscriptions, total_user_messages, total_bot_messages
+            
+            (total_users, active_subscriptions,
+             total_user_messages, total_bot_messages) = await self.db_manager.run_read(query)
             
             # Get system metrics
             cpu_percent = psutil.cpu_percent(interval=1)
@@ -230,30 +240,20 @@ class MonitoringManager:
             # Get system statistics
             stats = await self.get_system_statistics()
             
-            # Get database statistics for yesterday
-            with sqlite3.connect(self.db_manager.db_path) as conn:
+            # Yesterday's row totals come from daily_stats, kept current by the rollup task
+            def query(conn):
                 cursor = conn.cursor()
                 
-                # Count new users yesterday
+                # Count new users, messages and new subscriptions yesterday
                 cursor.execute("""
-                    SELECT COUNT(*) FROM users 
-                    WHERE DATE(created_at) = ?
+                    SELECT COALESCE(SUM(new_users), 0), COALESCE(SUM(user_messages), 0),
+                           COALESCE(SUM(new_subscriptions), 0)
+                    FROM daily_stats 
+                    WHERE day = ?
                 """, (yesterday_str,))
-                new_users = cursor.fetchone()[0]
-                
-                # Count messages yesterday
-                cursor.execute("""
-                    SELECT COUNT(*) FROM user_messages 
-                    WHERE DATE(timestamp) = ?
-                """, (yesterday_str,))
-                messages_yesterday = cursor.fetchone()[0]
-                
-                # Count new subscriptions yesterday
-                cursor.execute("""
-                    SELECT COUNT(*) FROM subscriptions 
-                    WHERE DATE(created_at) = ?
-                """, (yesterday_str,))
-                new_subscriptions = cursor.fetchone()[0]
+                return cursor.fetchone()
+            
+            new_users, messages_yesterday, new_subscriptions = await self.db_manager.run_read(query)
             
             report = f"""
 📊 **Daily Report - {yesterday_str}**
@@ -282,6 +282,9 @@ class MonitoringManager:
 • Last activity: {self.metrics['last_activity'].strftime('%H:%M:%S')}
             """
             
+            rollups_note = self.db_manager.rollups.lag_note()
+            if rollups_note:
+                report = f"{report.rstrip()}\n\n{rollups_note}"
             return report.strip()
             
         except Exception as e:
@@ -300,14 +303,13 @@ class MonitoringManager:
         except Exception as e:
             logger.error(f"Error sending daily report: {e}")
     
-    def get_health_status(self) -> Dict[str, Any]:
+    async def get_health_status(self) -> Dict[str, Any]:
         """Get current health status"""
         try:
-            # Check database connectivity
+            # Check database connectivity on a reader thread, never blocking the event loop
             db_healthy = True
             try:
-                with sqlite3.connect(self.db_manager.db_path) as conn:
-                    conn.execute("SELECT 1")
+                await self.db_manager.run_read(lambda conn: conn.execute("SELECT 1").fetchone(), timeout=5.0)
             except:
                 db_healthy = False
             
@@ -315,11 +317,15 @@ class MonitoringManager:
             memory = psutil.virtual_memory()
             disk = psutil.disk_usage('/')
             
+            warmup = self.performance_manager.get_warmup_status() if self.performance_manager else None
+            
             health_status = {
                 "status": "healthy" if db_healthy and memory.percent < 90 and disk.percent < 90 else "warning",
                 "database": "healthy" if db_healthy else "error",
                 "memory": "healthy" if memory.percent < 80 else "warning" if memory.percent < 90 else "critical",
                 "disk": "healthy" if disk.percent < 80 else "warning" if disk.percent < 90 else "critical",
+                "ready": db_healthy and (warmup is None or warmup["ready"]),
+                "cache_warmup": warmup,
                 "uptime": (datetime.now() - self.metrics["start_time"]).total_seconds(),
                 "timestamp": datetime.now().isoformat()
             }
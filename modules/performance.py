@@ -8,167 +8,191 @@ import time
 import logging
 from typing import Dict, Any, Optional, List
 from datetime import datetime, timedelta
-from functools import lru_cache, wraps
-import sqlite3
+from functools import wraps
+from modules.cache import LRUTTLCache, CachedLoader
+from modules.latency import LatencyTracker
+from modules.memory import MemoryWatchdog
 
 logger = logging.getLogger(__name__)
 
 class PerformanceManager:
     """Centralized performance management and optimization"""
     
-    def __init__(self, db_manager):
+    # TTL in seconds per cache namespace
+    # Long TTLs are safe because writes (local and from other processes) invalidate entries
+    CACHE_TTLS = {
+        "user_state": 1800,
+        "user_profile": 3600,
+        "subscription": 1800
+    }
+    
+    # Cache namespaces derived from each table, invalidated on DatabaseManager change events
+    TABLE_NAMESPACES = {
+        "user_states": ["user_state"],
+        "users": ["user_profile"],
+        "subscriptions": ["subscription"]
+    }
+    
+    # Extra seconds an expired entry may be served while it is refreshed in the background
+    CACHE_STALE_TTLS = {
+        "user_state": 0,
+        "user_profile": 300,
+        "subscription": 0
+    }
+    
+    def __init__(self, db_manager, cache_max_entries: int = 10000, cache_max_bytes: int = 32 * 1024 * 1024,
+                 stale_ttls: Optional[Dict[str, float]] = None, batch_concurrency: int = 8):
         self.db_manager = db_manager
-        self.cache = {}
-        self.cache_ttl = {}
+        self.cache = LRUTTLCache(
+            max_entries=cache_max_entries,
+            max_bytes=cache_max_bytes,
+            default_ttl=300,
+            namespace_ttls=self.CACHE_TTLS
+        )
+        stale_ttls = {**self.CACHE_STALE_TTLS, **(stale_ttls or {})}
+        # Single-flight loaders: concurrent misses for one user share a single query
+        self.loaders = {
+            "user_state": CachedLoader(self.cache, "user_state", db_manager.get_user_state_data,
+                                       stale_ttl=stale_ttls["user_state"]),
+            "user_profile": CachedLoader(self.cache, "user_profile", db_manager.get_user_profile,
+                                         stale_ttl=stale_ttls["user_profile"]),
+            "subscription": CachedLoader(self.cache, "subscription", db_manager.get_active_subscription,
+                                         stale_ttl=stale_ttls["subscription"])
+        }
+        db_manager.add_change_listener(self._on_database_change)
+        # Shares the database layer's tracker so handler and query latencies are reported together
+        self.latency = getattr(db_manager, "latency", None) or LatencyTracker()
         self.performance_metrics = {
-            "db_queries": 0,
-            "cache_hits": 0,
-            "cache_misses": 0,
-            "slow_queries": 0,
-            "average_response_time": 0.0
+            "slow_queries": 0
         }
         self.slow_query_threshold = 1.0  # seconds
+        # Users whose message groups are processed at the same time in batch_process_messages
+        self.batch_concurrency = max(1, batch_concurrency)
+        # Sheds cold cache entries first when the process nears the dyno memory cap
+        self.memory_watchdog = MemoryWatchdog()
+        self.memory_watchdog.register("cache", "evict_cache", size=lambda: self.cache.size_bytes,
+                                      shed=self._shed_cache)
+        
+        # Startup cache warm-up; "pending" until preload_frequent_data has run
+        self.warmup = {
+            "state": "pending",
+            "users": 0,
+            "loaded": 0,
+            "elapsed": 0.0,
+            "error": None,
+            "finished_at": None
+        }
+        self.batch_metrics = {
+            "batches": 0,
+            "messages": 0,
+            "users": 0,
+            "prefetched_states": 0,
+            "total_time": 0.0,
+            "last_batch": None
+        }
     
-    def cache_result(self, key: str, value: Any, ttl_seconds: int = 300):
-        """Cache a result with TTL"""
+    def cache_result(self, key: str, value: Any, ttl_seconds: Optional[int] = None, namespace: str = "default"):
+        """Cache a result; the TTL defaults to the namespace TTL"""
         try:
-            self.cache[key] = value
-            self.cache_ttl[key] = time.time() + ttl_seconds
+            self.cache.set(namespace, key, value, ttl_seconds)
         except Exception as e:
             logger.error(f"Error caching result: {e}")
     
-    def get_cached_result(self, key: str) -> Optional[Any]:
+    def get_cached_result(self, key: str, namespace: str = "default", default: Any = None) -> Optional[Any]:
         """Get cached result if still valid"""
         try:
-            if key in self.cache:
-                if time.time() < self.cache_ttl.get(key, 0):
-                    self.performance_metrics["cache_hits"] += 1
-                    return self.cache[key]
-                else:
-                    # Expired, remove from cache
-                    del self.cache[key]
-                    del self.cache_ttl[key]
-            
-            self.performance_metrics["cache_misses"] += 1
-            return None
-            
+            return self.cache.get(namespace, key, default)
         except Exception as e:
             logger.error(f"Error getting cached result: {e}")
-            return None
+            return default
     
     def clear_cache(self):
         """Clear all cached data"""
         try:
             self.cache.clear()
-            self.cache_ttl.clear()
             logger.info("Cache cleared")
         except Exception as e:
             logger.error(f"Error clearing cache: {e}")
     
     def measure_time(self, func_name: str):
-        """Decorator to measure function execution time"""
+        """Decorator recording execution time into the ``func_name`` latency histogram"""
         def decorator(func):
             @wraps(func)
             async def async_wrapper(*args, **kwargs):
-                start_time = time.time()
+                start_time = time.perf_counter()
                 try:
                     result = await func(*args, **kwargs)
-                    execution_time = time.time() - start_time
-                    
-                    # Update performance metrics
-                    self.performance_metrics["average_response_time"] = (
-                        (self.performance_metrics["average_response_time"] + execution_time) / 2
-                    )
-                    
-                    if execution_time > self.slow_query_threshold:
-                        self.performance_metrics["slow_queries"] += 1
-                        logger.warning(f"Slow {func_name}: {execution_time:.2f}s")
-                    
-                    return result
                 except Exception as e:
-                    execution_time = time.time() - start_time
+                    execution_time = time.perf_counter() - start_time
+                    self._record_time(func_name, execution_time, error=True)
                     logger.error(f"Error in {func_name} after {execution_time:.2f}s: {e}")
                     raise
+                self._record_time(func_name, time.perf_counter() - start_time)
+                return result
             
             @wraps(func)
             def sync_wrapper(*args, **kwargs):
-                start_time = time.time()
+                start_time = time.perf_counter()
                 try:
                     result = func(*args, **kwargs)
-                    execution_time = time.time() - start_time
-                    
-                    if execution_time > self.slow_query_threshold:
-                        self.performance_metrics["slow_queries"] += 1
-                        logger.warning(f"Slow {func_name}: {execution_time:.2f}s")
-                    
-                    return result
                 except Exception as e:
-                    execution_time = time.time() - start_time
+                    execution_time = time.perf_counter() - start_time
+                    self._record_time(func_name, execution_time, error=True)
                     logger.error(f"Error in {func_name} after {execution_time:.2f}s: {e}")
                     raise
+                self._record_time(func_name, time.perf_counter() - start_time)
+                return result
             
             return async_wrapper if asyncio.iscoroutinefunction(func) else sync_wrapper
         return decorator
     
-    async def optimize_database(self):
-        """Optimize database performance"""
+    def _record_time(self, func_name: str, execution_time: float, error: bool = False):
+        """Record one timed call and flag it if slow"""
+        self.latency.record(func_name, execution_time, error)
+        if execution_time > self.slow_query_threshold:
+            self.performance_metrics["slow_queries"] += 1
+            logger.warning(f"Slow {func_name}: {execution_time:.2f}s")
+    
+    def get_latency_stats(self, window: bool = True, reset: bool = False) -> Dict[str, Dict[str, Any]]:
+        """Per-name latency percentiles over the recent window (or since start)"""
+        return self.latency.snapshot(window=window, reset=reset)
+    
+    async def optimize_database(self) -> Dict[str, Any]:
+        """Optimize database performance without blocking the main bot.
+
+        Reclaims free pages in short incremental-vacuum slices and refreshes
+        statistics with a bounded ``PRAGMA optimize`` instead of VACUUM and ANALYZE.
+        """
         try:
-            with sqlite3.connect(self.db_manager.db_path) as conn:
-                cursor = conn.cursor()
-                
-                # Analyze database for query optimization
-                cursor.execute("ANALYZE")
-                
-                # Vacuum database to reclaim space
-                cursor.execute("VACUUM")
-                
-                # Update statistics
-                cursor.execute("PRAGMA optimize")
-                
-                conn.commit()
-                logger.info("Database optimization completed")
+            result = await self.db_manager.maintenance.run_once(force=True)
+            logger.info(f"Database optimization completed ({result['pages']} pages reclaimed)")
+            return result
                 
         except Exception as e:
             logger.error(f"Error optimizing database: {e}")
+            return {"error": str(e)}
     
     async def get_cached_user_state(self, user_id: int) -> Optional[Dict[str, Any]]:
         """Get user state with caching"""
         try:
-            cache_key = f"user_state_{user_id}"
-            cached_result = self.get_cached_result(cache_key)
-            
-            if cached_result is not None:
-                return cached_result
-            
-            # Get from database
-            state_data = await self.db_manager.get_user_state_data(user_id)
-            
-            # Cache for 5 minutes
-            self.cache_result(cache_key, state_data, 300)
-            
-            return state_data
-            
+            return await self.loaders["user_state"].get(user_id)
         except Exception as e:
             logger.error(f"Error getting cached user state: {e}")
             return None
     
+    async def get_cached_user_states(self, user_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Get many user states with caching; all misses are loaded in one query"""
+        try:
+            loader = self.loaders["user_state"]
+            return await loader.get_many(user_ids, self.db_manager.get_user_state_data_many)
+        except Exception as e:
+            logger.error(f"Error getting cached user states: {e}")
+            return {}
+    
     async def get_cached_user_profile(self, user_id: int) -> Optional[Dict[str, Any]]:
         """Get user profile with caching"""
         try:
-            cache_key = f"user_profile_{user_id}"
-            cached_result = self.get_cached_result(cache_key)
-            
-            if cached_result is not None:
-                return cached_result
-            
-            # Get from database
-            profile = await self.db_manager.get_user_profile(user_id)
-            
-            # Cache for 10 minutes
-            self.cache_result(cache_key, profile, 600)
-            
-            return profile
-            
+            return await self.loaders["user_profile"].get(user_id)
         except Exception as e:
             logger.error(f"Error getting cached user profile: {e}")
             return None
@@ -176,20 +200,7 @@ class PerformanceManager:
     async def get_cached_subscription(self, user_id: int) -> Optional[Dict[str, Any]]:
         """Get user subscription with caching"""
         try:
-            cache_key = f"subscription_{user_id}"
-            cached_result = self.get_cached_result(cache_key)
-            
-            if cached_result is not None:
-                return cached_result
-            
-            # Get from database
-            subscription = await self.db_manager.get_active_subscription(user_id)
-            
-            # Cache for 5 minutes
-            self.cache_result(cache_key, subscription, 300)
-            
-            return subscription
-            
+            return await self.loaders["subscription"].get(user_id)
         except Exception as e:
             logger.error(f"Error getting cached subscription: {e}")
             return None
@@ -197,29 +208,31 @@ class PerformanceManager:
     def invalidate_user_cache(self, user_id: int):
         """Invalidate all cached data for a user"""
         try:
-            cache_keys_to_remove = [
-                f"user_state_{user_id}",
-                f"user_profile_{user_id}",
-                f"subscription_{user_id}"
-            ]
-            
-            for key in cache_keys_to_remove:
-                if key in self.cache:
-                    del self.cache[key]
-                if key in self.cache_ttl:
-                    del self.cache_ttl[key]
+            for loader in self.loaders.values():
+                loader.invalidate(user_id)
             
             logger.debug(f"Cache invalidated for user {user_id}")
             
         except Exception as e:
             logger.error(f"Error invalidating user cache: {e}")
     
+    def _on_database_change(self, table: str, user_id: int):
+        """Invalidate exactly the cache entries derived from a changed row"""
+        if table == "*":
+            for loader in self.loaders.values():
+                loader.invalidate_all()
+            return
+        for namespace in self.TABLE_NAMESPACES.get(table, ()):
+            self.loaders[namespace].invalidate(user_id)
+    
     async def batch_process_messages(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Process multiple messages in batch for better performance"""
+        """Process multiple messages in batch, concurrently per user and in order within a user"""
         try:
             if not messages:
                 return []
             
+            start_time = time.perf_counter()
+            
             # Group messages by user_id for batch processing
             user_messages = {}
             for message in messages:
@@ -229,23 +242,73 @@ class PerformanceManager:
                         user_messages[user_id] = []
                     user_messages[user_id].append(message)
             
-            # Process each user's messages
-            results = []
-            for user_id, user_msg_list in user_messages.items():
-                # Get user state once for all messages
-                user_state = await self.get_cached_user_state(user_id)
-                
-                for message in user_msg_list:
-                    # Process message with cached state
-                    result = await self._process_single_message(message, user_state)
-                    results.append(result)
-            
+            # Load every state the cache is missing with a single query, counting the keys
+            # this batch loaded itself (the loader's stats are shared with concurrent callers)
+            prefetched = 0
+            
+            async def load_states(user_ids):
+                nonlocal prefetched
+                prefetched += len(user_ids)
+                return await self.db_manager.get_user_state_data_many(user_ids)
+            
+            try:
+                user_states = await self.loaders["user_state"].get_many(list(user_messages), load_states)
+            except Exception as e:
+                logger.error(f"Error getting cached user states: {e}")
+                user_states = {}
+            
+            semaphore = asyncio.Semaphore(self.batch_concurrency)
+            
+            async def process_user(user_id, user_msg_list):
+                async with semaphore:
+                    user_state = user_states.get(user_id)
+                    user_results = []
+                    for message in user_msg_list:
+                        # Process message with pre-loaded state, keeping the user's order
+                        result = await self._process_single_message(message, user_state)
+                        user_results.append(result)
+                    return user_results
+            
+            grouped_results = await asyncio.gather(
+                *(process_user(user_id, user_msg_list) for user_id, user_msg_list in user_messages.items())
+            )
+            results = [result for user_results in grouped_results for result in user_results]
+            
+            self._record_batch(len(results), len(user_messages), prefetched, time.perf_counter() - start_time)
             return results
             
         except Exception as e:
             logger.error(f"Error batch processing messages: {e}")
             return []
     
+    def _record_batch(self, message_count: int, user_count: int, prefetched: int, elapsed: float):
+        """Record throughput of one processed batch"""
+        last_batch = {
+            "messages": message_count,
+            "users": user_count,
+            "prefetched_states": prefetched,
+            "elapsed": elapsed,
+            "messages_per_second": message_count / elapsed if elapsed > 0 else 0.0,
+            "timestamp": datetime.now().isoformat()
+        }
+        self.batch_metrics["batches"] += 1
+        self.batch_metrics["messages"] += message_count
+        self.batch_metrics["users"] += user_count
+        self.batch_metrics["prefetched_states"] += prefetched
+        self.batch_metrics["total_time"] += elapsed
+        self.batch_metrics["last_batch"] = last_batch
+        self.latency.record("batch.process_messages", elapsed)
+        logger.debug(f"Processed batch of {message_count} messages from {user_count} users in {elapsed:.3f}s "
+                     f"({last_batch['messages_per_second']:.0f} msg/s, {prefetched} states prefetched)")
+    
+    def get_batch_metrics(self) -> Dict[str, Any]:
+        """Throughput of the last batch and of all batches so far"""
+        metrics = dict(self.batch_metrics)
+        metrics["messages_per_second"] = (
+            metrics["messages"] / metrics["total_time"] if metrics["total_time"] > 0 else 0.0
+        )
+        return metrics
+    
     async def _process_single_message(self, message: Dict[str, Any], user_state: Dict[str, Any]) -> Dict[str, Any]:
         """Process a single message with pre-loaded user state"""
         try:
@@ -264,20 +327,39 @@ class PerformanceManager:
     def get_performance_metrics(self) -> Dict[str, Any]:
         """Get current performance metrics"""
         try:
-            cache_size = len(self.cache)
-            cache_hit_rate = 0.0
-            
-            total_requests = self.performance_metrics["cache_hits"] + self.performance_metrics["cache_misses"]
-            if total_requests > 0:
-                cache_hit_rate = (self.performance_metrics["cache_hits"] / total_requests) * 100
+            cache_stats = self.cache.get_stats()
+            cache_hit_rate = cache_stats["hit_rate"]
+            latency = self.latency.snapshot()
+            db_calls = [summary for name, summary in latency.items() if name.startswith("db.")]
+            timed_calls = [summary for name, summary in latency.items() if not name.startswith("db.")]
+            timed_count = sum(summary["count"] for summary in timed_calls)
+            profiler = getattr(self.db_manager, "profiler", None)
+            sql_stats = profiler.get_stats() if profiler is not None else None
             
             metrics = {
                 "timestamp": datetime.now().isoformat(),
-                "cache_size": cache_size,
+                "cache_size": cache_stats["entries"],
+                "cache_bytes": cache_stats["bytes"],
                 "cache_hit_rate": cache_hit_rate,
-                "db_queries": self.performance_metrics["db_queries"],
+                "cache_hits": cache_stats["hits"],
+                "cache_misses": cache_stats["misses"],
+                "cache_evictions": cache_stats["evictions"],
+                "cache_namespaces": cache_stats["namespaces"],
+                "cache_loaders": {name: loader.get_stats() for name, loader in self.loaders.items()},
+                # Individual SQL statements when profiled, otherwise executor calls
+                "db_queries": sql_stats["statements"] if sql_stats else sum(summary["count"] for summary in db_calls),
+                "db_calls": sum(summary["count"] for summary in db_calls),
                 "slow_queries": self.performance_metrics["slow_queries"],
-                "average_response_time": self.performance_metrics["average_response_time"],
+                "slow_statements": sql_stats["slow"] if sql_stats else 0,
+                "average_response_time": (
+                    sum(summary["mean"] * summary["count"] for summary in timed_calls) / timed_count
+                    if timed_count else 0.0
+                ),
+                "batch_processing": self.get_batch_metrics(),
+                "warmup": self.get_warmup_status(),
+                "memory": self.memory_watchdog.get_stats(),
+                "latency_window": self.latency.snapshot(window=True),
+                "latency_total": latency,
                 "performance_status": "good" if cache_hit_rate > 70 and self.performance_metrics["slow_queries"] < 10 else "needs_optimization"
             }
             
@@ -290,37 +372,86 @@ class PerformanceManager:
     async def cleanup_old_cache(self):
         """Clean up expired cache entries"""
         try:
-            current_time = time.time()
-            expired_keys = []
-            
-            for key, expiry_time in self.cache_ttl.items():
-                if current_time >= expiry_time:
-                    expired_keys.append(key)
+            # Pops only the expired entries off the expiry heap
+            expired = self.cache.expire()
             
-            for key in expired_keys:
-                if key in self.cache:
-                    del self.cache[key]
-                if key in self.cache_ttl:
-                    del self.cache_ttl[key]
-            
-            if expired_keys:
-                logger.info(f"Cleaned up {len(expired_keys)} expired cache entries")
+            if expired:
+                logger.info(f"Cleaned up {expired} expired cache entries")
                 
         except Exception as e:
             logger.error(f"Error cleaning up old cache: {e}")
     
-    async def preload_frequent_data(self):
-        """Preload frequently accessed data into cache"""
+    async def preload_frequent_data(self, active_hours: float = 24, max_users: int = 3000,
+                                    time_budget: float = 15.0, chunk_size: int = 500) -> Dict[str, Any]:
+        """Warm the cache with state, profile and subscription of recently active users.
+
+        Users are loaded most-recent-first in chunks of three set-based queries
+        until everyone is cached or ``time_budget`` seconds have passed.
+        """
+        start_time = time.monotonic()
+        deadline = start_time + time_budget
+        # Never warm more than the cache can hold (three entries per user)
+        max_users = min(max_users, self.cache.max_entries // len(self.loaders))
+        self.warmup.update({"state": "warming", "users": 0, "loaded": 0, "elapsed": 0.0, "error": None})
+        bulk_loaders = {
+            "user_state": self.db_manager.get_user_state_data_many,
+            "user_profile": self.db_manager.get_user_profiles_many,
+            "subscription": self.db_manager.get_active_subscriptions_many
+        }
+        
         try:
-            # This would preload common data like user states, profiles, etc.
-            # For now, it's a placeholder
-            logger.info("Preloading frequent data...")
-            
-            # Example: Preload active user states
-            # This would be implemented based on actual usage patterns
-            
+            logger.info(f"Preloading data for users active in the last {active_hours}h...")
+            user_ids = await asyncio.wait_for(
+                self.db_manager.get_recently_active_user_ids(active_hours, max_users), time_budget
+            )
+            self.warmup["users"] = len(user_ids)
+            
+            for offset in range(0, len(user_ids), chunk_size):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                chunk = user_ids[offset:offset + chunk_size]
+                await asyncio.wait_for(asyncio.gather(*(
+                    self.loaders[namespace].get_many(chunk, bulk_loader)
+                    for namespace, bulk_loader in bulk_loaders.items()
+                )), remaining)
+                self.warmup["loaded"] += len(chunk)
+            
+            self.warmup["state"] = "ready" if self.warmup["loaded"] == len(user_ids) else "partial"
+        except asyncio.TimeoutError:
+            self.warmup["state"] = "partial"
         except Exception as e:
+            self.warmup["state"] = "failed"
+            self.warmup["error"] = str(e)
             logger.error(f"Error preloading frequent data: {e}")
+        
+        self.warmup["elapsed"] = time.monotonic() - start_time
+        self.warmup["finished_at"] = datetime.now().isoformat()
+        logger.info(f"Cache warm-up {self.warmup['state']}: {self.warmup['loaded']}/{self.warmup['users']} "
+                    f"users in {self.warmup['elapsed']:.2f}s")
+        return self.get_warmup_status()
+    
+    @property
+    def is_ready(self) -> bool:
+        """Whether the startup warm-up has finished (a partial or failed warm-up still counts)"""
+        return self.warmup["state"] in ("ready", "partial", "failed")
+    
+    def get_warmup_status(self) -> Dict[str, Any]:
+        """Startup warm-up progress for health checks"""
+        status = dict(self.warmup)
+        status["ready"] = self.is_ready
+        return status
+    
+    def _shed_cache(self) -> Dict[str, Any]:
+        """Evict the colder half of the cache (by bytes)"""
+        entries, freed = self.cache.shrink(self.cache.size_bytes // 2)
+        return {"entries_evicted": entries, "bytes_evicted": freed}
+    
+    def register_analytics(self, analytics_manager):
+        """Let the memory watchdog measure and trim an AnalyticsManager's in-memory data"""
+        self.memory_watchdog.register("analytics", "trim_analytics",
+                                      size=analytics_manager.get_memory_usage,
+                                      shed=analytics_manager.trim_memory)
     
     def optimize_memory_usage(self):
         """Optimize memory usage by cleaning up unused data"""
@@ -338,33 +469,27 @@ class PerformanceManager:
             logger.error(f"Error optimizing memory usage: {e}")
     
     async def get_database_stats(self) -> Dict[str, Any]:
-        """Get database performance statistics"""
+        """Get database size and per-table storage statistics (served from cached introspection)"""
         try:
-            with sqlite3.connect(self.db_manager.db_path) as conn:
+            def query(conn):
                 cursor = conn.cursor()
                 
                 # Get database size
                 cursor.execute("SELECT page_count * page_size as size FROM pragma_page_count(), pragma_page_size()")
-                db_size = cursor.fetchone()[0]
-                
-                # Get table sizes
-                cursor.execute("""
-                    SELECT name, 
-                           (SELECT COUNT(*) FROM sqlite_master WHERE type='table' AND name=m.name) as row_count
-                    FROM sqlite_master m 
-                    WHERE type='table' AND name NOT LIKE 'sqlite_%'
-                """)
-                table_stats = cursor.fetchall()
-                
-                stats = {
-                    "database_size_bytes": db_size,
-                    "database_size_mb": db_size / (1024 * 1024),
-                    "table_count": len(table_stats),
-                    "tables": [{"name": name, "rows": row_count} for name, row_count in table_stats]
-                }
-                
-                return stats
-                
+                return cursor.fetchone()[0]
+            
+            db_size = await self.db_manager.run_read(query)
+            tables = await self.db_manager.introspector.get_table_stats()
+            
+            stats = {
+                "database_size_bytes": db_size,
+                "database_size_mb": db_size / (1024 * 1024),
+                "table_count": len(tables),
+                "tables": tables
+            }
+            
+            return stats
+            
         except Exception as e:
             logger.error(f"Error getting database stats: {e}")
             return {"error": str(e)}
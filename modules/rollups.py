@@ -0,0 +1,229 @@
+"""
+Rollups Module
+Incrementally maintained daily_stats so reports never aggregate the raw tables.
+"""
+
+import sqlite3
+import time
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# source table -> (daily_stats column, key column, day column, message_type expr, plan_type expr)
+ROLLUP_SOURCES = {
+    "user_messages": ("user_messages", "id", "created_at", "COALESCE(message_type, '')", "''"),
+    "bot_messages": ("bot_messages", "id", "sent_at", "COALESCE(message_type, '')", "''"),
+    "users": ("new_users", "created_at", "created_at", "''", "''"),
+    "subscriptions": ("new_subscriptions", "id", "created_at", "''", "COALESCE(subscription_type, '')"),
+}
+
+class RollupManager:
+    """Keeps daily_stats current from rows added since each source's high-water mark.
+
+    Every step counts one chunk of new rows, upserts the per-day totals and
+    advances the watermark in the same write transaction, so a crash never
+    counts a row twice. Tables with an AUTOINCREMENT id are followed by id;
+    ``users`` is followed by ``created_at`` up to the last completed second.
+    Deleted rows are not subtracted and status changes are not tracked, so
+    figures that depend on mutable columns are still read from the source.
+    """
+
+    def __init__(self, db_manager, interval: float = 60.0, batch_rows: int = 5000,
+                 active_days: int = 90, prune_interval: float = 3600.0):
+        self.db_manager = db_manager
+        self.interval = interval
+        self.batch_rows = batch_rows
+        # How many days of daily_active_users to keep
+        self.active_days = active_days
+        self.prune_interval = prune_interval
+
+        self._task: Optional[asyncio.Task] = None
+        self._last_prune = 0.0
+        self.caught_up = False
+        # Sources the last refresh left unfinished
+        self.pending = list(ROLLUP_SOURCES)
+        self.watermarks: Dict[str, Any] = {}
+        self.stats = {
+            "refreshes": 0,
+            "steps": 0,
+            "rows_rolled_up": 0,
+            "backfills": 0,
+            "last_refresh": None,
+            "errors": 0
+        }
+
+    def _step(self, conn: sqlite3.Connection, source: str) -> Tuple[int, bool, Any]:
+        """Roll up one chunk of new rows (writer thread); returns (rows, caught up, watermark)"""
+        column, key, day_column, message_type, plan_type = ROLLUP_SOURCES[source]
+        cursor = conn.cursor()
+        cursor.execute("SELECT high_water FROM rollup_watermarks WHERE source = ?", (source,))
+        row = cursor.fetchone()
+        low = row[0] if row and row[0] is not None else (0 if key == "id" else "")
+
+        if key == "id":
+            cursor.execute(f'''
+                SELECT COUNT(*), MAX(id) FROM (
+                    SELECT id FROM {source} WHERE id > ? ORDER BY id LIMIT ?
+                )
+            ''', (low, self.batch_rows))
+            chunk_rows, high = cursor.fetchone()
+            caught_up = chunk_rows < self.batch_rows
+        else:
+            # Rows stamped in the current second may still be joined by others with the same stamp
+            cursor.execute(f'''
+                SELECT MAX({key}) FROM {source}
+                WHERE {key} > ? AND {key} < datetime('now')
+            ''', (low,))
+            high = cursor.fetchone()[0]
+            caught_up = True
+        if high is None:
+            return 0, True, low
+
+        cursor.execute(f'''
+            SELECT DATE({day_column}), {message_type}, {plan_type}, COUNT(*)
+            FROM {source}
+            WHERE {key} > ? AND {key} <= ? AND {day_column} IS NOT NULL
+            GROUP BY 1, 2, 3
+        ''', (low, high))
+        groups = cursor.fetchall()
+        cursor.executemany(f'''
+            INSERT INTO daily_stats (day, message_type, plan_type, {column})
+            VALUES (?, ?, ?, ?)
+            ON CONFLICT (day, message_type, plan_type) DO UPDATE SET {column} = {column} + excluded.{column}
+        ''', groups)
+
+        if source == "user_messages":
+            cursor.execute('''
+                INSERT OR IGNORE INTO daily_active_users (day, user_id)
+                SELECT DISTINCT DATE(created_at), user_id FROM user_messages
+                WHERE id > ? AND id <= ? AND user_id IS NOT NULL
+                  AND created_at >= date('now', ?)
+            ''', (low, high, f"-{int(self.active_days)} days"))
+
+        cursor.execute('''
+            INSERT INTO rollup_watermarks (source, high_water, updated_at)
+            VALUES (?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT (source) DO UPDATE SET high_water = excluded.high_water, updated_at = excluded.updated_at
+        ''', (source, high))
+        return sum(group[3] for group in groups), caught_up, high
+
+    async def refresh(self, time_budget: Optional[float] = None) -> int:
+        """Roll up new rows from every source until caught up or out of time; returns rows added"""
+        deadline = time.monotonic() + time_budget if time_budget is not None else None
+        pending = list(ROLLUP_SOURCES)
+        rows = 0
+        while pending:
+            for source in list(pending):
+                added, caught_up, high_water = await self.db_manager.run_write(self._step, source)
+                self.stats["steps"] += 1
+                rows += added
+                self.watermarks[source] = high_water
+                if caught_up:
+                    pending.remove(source)
+            if pending and deadline is not None and time.monotonic() >= deadline:
+                break
+
+        self.caught_up = not pending
+        self.pending = pending
+        self.stats["refreshes"] += 1
+        self.stats["rows_rolled_up"] += rows
+        self.stats["last_refresh"] = datetime.now().isoformat()
+        if rows and not self.caught_up:
+            logger.info(f"Rolled up {rows} rows; still behind on {', '.join(pending)}")
+        return rows
+
+    def lag_note(self) -> Optional[str]:
+        """Warning line for reports built from daily_stats while it is behind, else None"""
+        if self.caught_up:
+            return None
+        if not self.stats["refreshes"]:
+            return "⚠️ Rollups not refreshed yet; daily figures may be incomplete"
+        marks = ", ".join(f"{source}={self.watermarks.get(source, 'start')}" for source in self.pending)
+        return f"⚠️ Rollups behind, as of watermark `{marks}`"
+
+    async def backfill(self, source: Optional[str] = None, time_budget: Optional[float] = None) -> int:
+        """Rebuild daily_stats from scratch for one source (or all) and roll up again"""
+        sources = [source] if source else list(ROLLUP_SOURCES)
+        for name in sources:
+            if name not in ROLLUP_SOURCES:
+                raise ValueError(f"Unknown rollup source: {name}")
+
+        def reset(conn):
+            cursor = conn.cursor()
+            for name in sources:
+                column = ROLLUP_SOURCES[name][0]
+                cursor.execute(f"UPDATE daily_stats SET {column} = 0 WHERE {column} != 0")
+                cursor.execute("DELETE FROM rollup_watermarks WHERE source = ?", (name,))
+            if "user_messages" in sources:
+                cursor.execute("DELETE FROM daily_active_users")
+            cursor.execute('''
+                DELETE FROM daily_stats
+                WHERE user_messages = 0 AND bot_messages = 0 AND new_users = 0 AND new_subscriptions = 0
+            ''')
+
+        await self.db_manager.run_write(reset)
+        for name in sources:
+            self.watermarks.pop(name, None)
+        self.stats["backfills"] += 1
+        logger.info(f"Rebuilding daily rollups for {', '.join(sources)}")
+        return await self.refresh(time_budget=time_budget)
+
+    async def prune(self) -> int:
+        """Drop daily_active_users older than ``active_days``"""
+        def delete(conn):
+            return conn.execute("DELETE FROM daily_active_users WHERE day < date('now', ?)",
+                                (f"-{int(self.active_days)} days",)).rowcount
+        deleted = await self.db_manager.run_write(delete)
+        self._last_prune = time.monotonic()
+        return deleted
+
+    async def _run(self):
+        """Refresh rollups until cancelled"""
+        while True:
+            try:
+                await self.refresh(time_budget=self.interval / 2)
+                if time.monotonic() - self._last_prune >= self.prune_interval:
+                    await self.prune()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.stats["errors"] += 1
+                logger.error(f"Error refreshing daily rollups: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        """Start background refresh on the running event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop background refresh"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    @property
+    def running(self) -> bool:
+        """Whether the background refresh task is active"""
+        return self._task is not None and not self._task.done()
+
+    def close(self):
+        """Cancel background refresh without waiting"""
+        if self._task is not None:
+            self._task.cancel()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get rollup statistics and watermarks"""
+        stats = dict(self.stats)
+        stats["caught_up"] = self.caught_up
+        stats["watermarks"] = dict(self.watermarks)
+        stats["pending"] = list(self.pending)
+        stats["running"] = self.running
+        return stats
@@ -0,0 +1,326 @@
+"""
+SQL Profiler Module
+Statement-level profiling of SQLite connections, aggregated by normalized SQL fingerprint.
+"""
+
+import re
+import sqlite3
+import threading
+import time
+import logging
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_COMMENT_RE = re.compile(r"--[^\n]*|/\*.*?\*/", re.DOTALL)
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+_WHITESPACE_RE = re.compile(r"\s+")
+_IN_LIST_RE = re.compile(r"\bIN \((?:\?, )*\?\)", re.IGNORECASE)
+_VALUES_LIST_RE = re.compile(r"(\((?:\?, )*\?\))(?:, \1)+")
+
+def fingerprint(sql: str) -> str:
+    """Normalize SQL so statements differing only in literals or list lengths share a key"""
+    text = _COMMENT_RE.sub(" ", sql)
+    text = _STRING_RE.sub("?", text)
+    text = _NUMBER_RE.sub("?", text)
+    text = _WHITESPACE_RE.sub(" ", text).strip().rstrip(";").strip()
+    text = text.replace("( ", "(").replace(" )", ")").replace(" ,", ",")
+    text = re.sub(r",(?=\S)", ", ", text)
+    text = _IN_LIST_RE.sub("IN (?...)", text)
+    return _VALUES_LIST_RE.sub(r"\1, ...", text)
+
+class SQLProfiler:
+    """Aggregates call count, time, rows and VM steps per SQL fingerprint.
+
+    Connections opened through ``connect`` time every ``execute``,
+    ``executemany``, fetch and commit, and count SQLite virtual machine
+    steps through a progress handler, so expensive statements show up even
+    when their wall time is hidden by lock waits or cheap hardware.
+    """
+
+    def __init__(self, slow_threshold: float = 0.5, max_fingerprints: int = 500,
+                 progress_steps: int = 1000, enabled: bool = True):
+        self.slow_threshold = slow_threshold
+        self.max_fingerprints = max_fingerprints
+        self.progress_steps = progress_steps
+        self.enabled = enabled
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        # Raw SQL -> fingerprint; the repo issues a small, fixed set of statements
+        self._fingerprints: Dict[str, str] = {}
+        self.totals = {
+            "statements": 0,
+            "errors": 0,
+            "slow": 0,
+            "dropped": 0
+        }
+
+    def connect(self, database: str, **kwargs) -> sqlite3.Connection:
+        """Open a profiled connection (accepts the same arguments as ``sqlite3.connect``)"""
+        conn = sqlite3.connect(database, factory=ProfiledConnection, **kwargs)
+        conn.profiler = self
+        if self.progress_steps:
+            conn.set_progress_handler(conn._count_steps, self.progress_steps)
+        return conn
+
+    def fingerprint(self, sql: str) -> str:
+        """Memoized fingerprint of a statement"""
+        key = self._fingerprints.get(sql)
+        if key is None:
+            key = fingerprint(sql)
+            if len(self._fingerprints) >= 4 * self.max_fingerprints:
+                self._fingerprints.clear()
+            self._fingerprints[sql] = key
+        return key
+
+    def record(self, key: str, elapsed: float, rows: int = 0, steps: int = 0,
+               error: bool = False, new_call: bool = True):
+        """Add one execution (or the fetch tail of one, with ``new_call=False``)"""
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                if len(self._stats) >= self.max_fingerprints:
+                    # Keep memory bounded if something generates unbounded SQL text
+                    self.totals["dropped"] += 1
+                    key = "(other)"
+                    stats = self._stats.get(key)
+                if stats is None:
+                    stats = self._stats[key] = {
+                        "calls": 0,
+                        "errors": 0,
+                        "slow": 0,
+                        "total_time": 0.0,
+                        "max_time": 0.0,
+                        "rows": 0,
+                        "vm_steps": 0
+                    }
+            if new_call:
+                stats["calls"] += 1
+                self.totals["statements"] += 1
+            stats["total_time"] += elapsed
+            stats["rows"] += rows
+            stats["vm_steps"] += steps
+            if error:
+                stats["errors"] += 1
+                self.totals["errors"] += 1
+
+    def record_max(self, key: str, elapsed: float, previous: float = 0.0):
+        """Track the slowest single statement (execute plus all of its fetches)"""
+        with self._lock:
+            stats = self._stats.get(key) or self._stats.get("(other)")
+            if stats is not None and elapsed > stats["max_time"]:
+                stats["max_time"] = elapsed
+            slow = previous < self.slow_threshold <= elapsed
+            if slow:
+                self.totals["slow"] += 1
+                if stats is not None:
+                    stats["slow"] += 1
+        if slow:
+            logger.warning(f"Slow SQL ({elapsed:.3f}s): {key[:200]}")
+
+    def top(self, limit: int = 10, order_by: str = "total_time") -> List[Dict[str, Any]]:
+        """Heaviest fingerprints by total_time, max_time, calls, rows or vm_steps"""
+        with self._lock:
+            entries = [dict(stats, sql=key) for key, stats in self._stats.items()]
+        for entry in entries:
+            entry["avg_time"] = entry["total_time"] / entry["calls"] if entry["calls"] else 0.0
+        if order_by not in ("total_time", "max_time", "avg_time", "calls", "rows", "vm_steps", "errors"):
+            order_by = "total_time"
+        entries.sort(key=lambda entry: entry[order_by], reverse=True)
+        return entries[:limit]
+
+    def reset(self):
+        """Forget all collected statistics"""
+        with self._lock:
+            self._stats.clear()
+            for counter in self.totals:
+                self.totals[counter] = 0
+            self.started_at = time.time()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get profiler totals"""
+        with self._lock:
+            stats = dict(self.totals)
+            stats["fingerprints"] = len(self._stats)
+            stats["total_time"] = sum(entry["total_time"] for entry in self._stats.values())
+        stats["since"] = self.started_at
+        stats["enabled"] = self.enabled
+        stats["slow_threshold"] = self.slow_threshold
+        return stats
+
+class ProfiledCursor(sqlite3.Cursor):
+    """Cursor that reports its statements and fetched rows to the connection's profiler.
+
+    Row-by-row fetches only add to counters on the cursor; they are reported
+    in one ``record`` call when the result is exhausted, the cursor is closed
+    or reused, or it is garbage collected, so iterating a large result does
+    not take the profiler lock once per row.
+    """
+
+    _key: Optional[str] = None
+    _elapsed = 0.0
+    _fetch_time = 0.0
+    _fetch_rows = 0
+    _fetch_steps = 0
+
+    def _profiled(self, method, sql: str, *args):
+        # A reused cursor first reports the fetches of its previous statement
+        self._flush_fetches()
+        profiler = self.connection.profiler
+        if profiler is None or not profiler.enabled:
+            self._key = None
+            return method(sql, *args)
+
+        key = profiler.fingerprint(sql)
+        steps_before = self.connection._steps
+        start = time.perf_counter()
+        error = True
+        try:
+            method(sql, *args)
+            error = False
+            return self
+        finally:
+            elapsed = time.perf_counter() - start
+            # SELECT rows are counted as they are fetched; DML reports rows changed
+            rows = self.rowcount if self.rowcount > 0 and self.description is None else 0
+            profiler.record(key, elapsed, rows, self.connection._steps - steps_before, error)
+            self._key, self._elapsed = key, elapsed
+            profiler.record_max(key, elapsed)
+
+    def _fetched(self, start: float, steps_before: int, rows: int, done: bool):
+        """Add fetch time, steps and rows to the pending totals, reporting them once ``done``"""
+        self._fetch_time += time.perf_counter() - start
+        self._fetch_rows += rows
+        self._fetch_steps += self.connection._steps - steps_before
+        if done:
+            self._flush_fetches()
+
+    def _flush_fetches(self):
+        """Charge the pending fetch totals to the statement that produced them"""
+        if self._key is None or not (self._fetch_time or self._fetch_rows or self._fetch_steps):
+            return
+        elapsed, rows, steps = self._fetch_time, self._fetch_rows, self._fetch_steps
+        self._fetch_time, self._fetch_rows, self._fetch_steps = 0.0, 0, 0
+        profiler = self.connection.profiler
+        profiler.record(self._key, elapsed, rows, steps, new_call=False)
+        previous = self._elapsed
+        self._elapsed += elapsed
+        profiler.record_max(self._key, self._elapsed, previous)
+
+    def execute(self, sql: str, parameters=()):
+        return self._profiled(super().execute, sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters):
+        return self._profiled(super().executemany, sql, seq_of_parameters)
+
+    def executescript(self, sql_script: str):
+        return self._profiled(super().executescript, sql_script)
+
+    def fetchone(self):
+        if self._key is None:
+            return super().fetchone()
+        start, steps = time.perf_counter(), self.connection._steps
+        row = super().fetchone()
+        self._fetched(start, steps, 0 if row is None else 1, done=row is None)
+        return row
+
+    def fetchmany(self, size: Optional[int] = None):
+        size = self.arraysize if size is None else size
+        if self._key is None:
+            return super().fetchmany(size)
+        start, steps = time.perf_counter(), self.connection._steps
+        rows = super().fetchmany(size)
+        self._fetched(start, steps, len(rows), done=len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        if self._key is None:
+            return super().fetchall()
+        start, steps = time.perf_counter(), self.connection._steps
+        rows = super().fetchall()
+        self._fetched(start, steps, len(rows), done=True)
+        return rows
+
+    def __next__(self):
+        if self._key is None:
+            return super().__next__()
+        start, steps = time.perf_counter(), self.connection._steps
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(start, steps, 0, done=True)
+            raise
+        self._fetched(start, steps, 1, done=False)
+        return row
+
+    def close(self):
+        self._flush_fetches()
+        super().close()
+
+    def __del__(self):
+        # Single-row lookups rarely exhaust or close their cursor
+        try:
+            self._flush_fetches()
+        except Exception:
+            pass
+
+class ProfiledConnection(sqlite3.Connection):
+    """Connection whose cursors, shortcut ``execute`` calls and commits are profiled"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.profiler: Optional[SQLProfiler] = None
+        self._steps = 0
+
+    def _count_steps(self) -> int:
+        """Progress handler; returning 0 lets the statement continue"""
+        self._steps += self.profiler.progress_steps
+        return 0
+
+    def cursor(self, factory=ProfiledCursor):
+        return super().cursor(factory)
+
+    # sqlite3.Connection.execute* create plain cursors internally, so route them through ours
+    def execute(self, sql: str, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql: str, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script: str):
+        return self.cursor().executescript(sql_script)
+
+    def _timed(self, key: str, method):
+        profiler = self.profiler
+        if profiler is None or not profiler.enabled or not self.in_transaction:
+            return method()
+        start = time.perf_counter()
+        error = True
+        try:
+            method()
+            error = False
+        finally:
+            elapsed = time.perf_counter() - start
+            profiler.record(key, elapsed, error=error)
+            profiler.record_max(key, elapsed)
+
+    def commit(self):
+        # Commits carry the fsync cost, so they are profiled like any other statement
+        self._timed("COMMIT", super().commit)
+
+    def rollback(self):
+        self._timed("ROLLBACK", super().rollback)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # The C implementation commits without going through commit(), so mirror it here
+        if exc_type is None:
+            try:
+                self.commit()
+            except Exception:
+                self.rollback()
+                raise
+        else:
+            self.rollback()
+        return False
@@ -0,0 +1,196 @@
+"""
+Write-Behind Module
+Batches high-volume inserts and merges repeated updates into group commits.
+"""
+
+import sqlite3
+import threading
+import logging
+from typing import Dict, Any, Hashable, List, Tuple
+from modules.db_executor import NO_TIMEOUT
+
+logger = logging.getLogger(__name__)
+
+# Errors caused by the row itself; such rows would fail again, so they are dropped.
+# Anything else (interrupt, busy, I/O, failed commit) puts the whole batch back.
+PERMANENT_ROW_ERRORS = (sqlite3.IntegrityError, sqlite3.DataError, sqlite3.InterfaceError)
+
+class WriteBehindQueue:
+    """In-process write-behind buffer flushed on the database writer thread.
+
+    ``append`` rows are written with one ``executemany`` per statement; ``merge``
+    rows are keyed, so only the latest parameters per key reach the database.
+    A batch that cannot be committed is put back and written with the next one.
+    """
+
+    def __init__(self, executor, flush_interval: float = 0.5, max_batch_size: int = 200,
+                 max_pending: int = 10000):
+        self.executor = executor
+        self.flush_interval = flush_interval
+        self.max_batch_size = max_batch_size
+        self.max_pending = max_pending
+
+        self._lock = threading.Lock()
+        self._appends: Dict[str, List[tuple]] = {}
+        self._merges: Dict[str, Dict[Hashable, tuple]] = {}
+        self._pending = 0
+        self._in_flight = 0
+        self._flush_scheduled = False
+        self._stop = threading.Event()
+        self.stats = {
+            "enqueued": 0,
+            "merged": 0,
+            "flushes": 0,
+            "rows_written": 0,
+            "rows_failed": 0,
+            "batches_requeued": 0,
+            "largest_batch": 0
+        }
+
+        self._flusher = threading.Thread(target=self._flush_loop, name="db-write-behind", daemon=True)
+        self._flusher.start()
+
+    @property
+    def pending(self) -> int:
+        """Number of buffered rows not yet written"""
+        return self._pending
+
+    def append(self, sql: str, params: tuple) -> bool:
+        """Buffer an insert; returns True when the caller should apply backpressure"""
+        with self._lock:
+            self._appends.setdefault(sql, []).append(params)
+            self._pending += 1
+            self.stats["enqueued"] += 1
+            return self._after_enqueue()
+
+    def merge(self, sql: str, key: Hashable, params: tuple) -> bool:
+        """Buffer a keyed update, replacing any earlier pending update for the same key"""
+        with self._lock:
+            bucket = self._merges.setdefault(sql, {})
+            if key in bucket:
+                self.stats["merged"] += 1
+            else:
+                self._pending += 1
+            bucket[key] = params
+            self.stats["enqueued"] += 1
+            return self._after_enqueue()
+
+    def _after_enqueue(self) -> bool:
+        """Kick off an early flush once a full batch is buffered (lock held)"""
+        if self._pending >= self.max_batch_size and not self._flush_scheduled:
+            self._flush_scheduled = True
+            self.executor.submit_write(self._write_batch)
+        return self._pending >= self.max_pending
+
+    def _take_batch(self) -> Tuple[Dict[str, List[tuple]], Dict[str, Dict[Hashable, tuple]], int]:
+        """Swap out the buffers so producers can keep appending during the write"""
+        with self._lock:
+            appends, merges, count = self._appends, self._merges, self._pending
+            self._appends, self._merges, self._pending = {}, {}, 0
+            self._flush_scheduled = False
+            if count:
+                self._in_flight += 1
+            return appends, merges, count
+
+    def _requeue(self, appends: Dict[str, List[tuple]], merges: Dict[str, Dict[Hashable, tuple]], count: int):
+        """Put a batch that was not committed back ahead of anything buffered since"""
+        with self._lock:
+            restored_appends = {sql: list(rows) for sql, rows in appends.items()}
+            for sql, rows in self._appends.items():
+                restored_appends.setdefault(sql, []).extend(rows)
+            # Updates buffered since the batch was taken are newer and win
+            restored_merges = {sql: dict(rows) for sql, rows in merges.items()}
+            overlap = 0
+            for sql, rows in self._merges.items():
+                bucket = restored_merges.setdefault(sql, {})
+                for key, params in rows.items():
+                    if key in bucket:
+                        overlap += 1
+                    bucket[key] = params
+            self._appends, self._merges = restored_appends, restored_merges
+            self._pending += count - overlap
+
+    def _write_batch(self, conn) -> int:
+        """Write everything buffered in a single transaction (runs on the writer thread)"""
+        appends, merges, count = self._take_batch()
+        if not count:
+            return 0
+
+        # Inserts first so merged updates (e.g. last_activity) see the new rows
+        batches = list(appends.items()) + [(sql, list(rows.values())) for sql, rows in merges.items()]
+        failed = 0
+        try:
+            try:
+                cursor = conn.cursor()
+                for sql, rows in batches:
+                    cursor.executemany(sql, rows)
+            except PERMANENT_ROW_ERRORS as e:
+                # Retry row by row so one bad row does not drop the whole batch
+                logger.warning(f"Write-behind batch of {count} rows failed ({e}), retrying individually")
+                conn.rollback()
+                for sql, rows in batches:
+                    for params in rows:
+                        try:
+                            conn.execute(sql, params)
+                        except PERMANENT_ROW_ERRORS as row_error:
+                            failed += 1
+                            logger.error(f"Dropping write-behind row: {row_error}")
+            # Commit before leaving the in-flight state so flush() callers observe the rows
+            conn.commit()
+        except Exception as e:
+            # Nothing from this batch is committed; keep the rows for the next flush
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                pass
+            self._requeue(appends, merges, count)
+            self.stats["batches_requeued"] += 1
+            logger.warning(f"Write-behind batch of {count} rows not committed ({e}), requeued")
+            raise
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+        self.stats["flushes"] += 1
+        self.stats["rows_failed"] += failed
+        self.stats["rows_written"] += count - failed
+        self.stats["largest_batch"] = max(self.stats["largest_batch"], count)
+        logger.debug(f"Write-behind flushed {count} rows")
+        return count
+
+    async def flush(self) -> int:
+        """Write all buffered rows now and wait for the commit"""
+        if not self._pending and not self._in_flight:
+            return 0
+        # Writer jobs run in order, so this also waits for any batch already being written.
+        # No timeout: interrupting the batch would only put it back in the buffer.
+        return await self.executor.run_write(self._write_batch, timeout=NO_TIMEOUT)
+
+    def _flush_loop(self):
+        """Periodically flush buffered rows from a background thread"""
+        while not self._stop.wait(self.flush_interval):
+            if self._pending:
+                try:
+                    self.executor.submit_write(self._write_batch)
+                except RuntimeError:
+                    # Executor already shut down
+                    break
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get write-behind statistics"""
+        stats = dict(self.stats)
+        stats["pending"] = self._pending
+        stats["flush_interval"] = self.flush_interval
+        stats["max_batch_size"] = self.max_batch_size
+        return stats
+
+    def close(self):
+        """Stop the background flusher and synchronously write anything still buffered"""
+        self._stop.set()
+        self._flusher.join(timeout=self.flush_interval * 2)
+        if self._pending:
+            try:
+                self.executor.submit_write(self._write_batch).result()
+            except Exception as e:
+                logger.error(f"Error flushing write-behind queue on shutdown: {e}")
+        logger.info("Write-behind queue closed")
@@ -0,0 +1,14 @@
+"""
+Shared fixtures: a DatabaseManager on a fresh, fully migrated SQLite file.
+"""
+
+import pytest
+
+from modules.database import DatabaseManager
+
+@pytest.fixture
+def db_manager(tmp_path):
+    """DatabaseManager on a temporary database, closed after the test"""
+    manager = DatabaseManager(str(tmp_path / "bot.db"), reader_threads=2, write_flush_interval=60.0)
+    yield manager
+    manager.close()
@@ -0,0 +1,99 @@
+"""
+Tests for the in-memory analytics structures and their checkpoint lifecycle.
+"""
+
+import asyncio
+
+import pytest
+
+from modules.analytics import AnalyticsManager
+from modules.counters import ActionRing, DecayingCounter
+
+def test_action_ring_keeps_the_newest_entries_in_order():
+    ring = ActionRing(3)
+    for code in range(5):
+        ring.append(code, float(code))
+
+    assert len(ring) == 3
+    assert ring.items() == [(2, 2.0), (3, 3.0), (4, 4.0)]
+    assert ring.items(limit=2) == [(3, 3.0), (4, 4.0)]
+    assert ring.last_time() == 4.0
+    assert ActionRing(3).last_time() == 0.0
+
+def test_decaying_counter_halves_every_half_life():
+    counter = DecayingCounter(half_life=10.0)
+    counter.add("export", now=0.0)
+    counter.add("export", now=0.0)
+    counter.add("help", now=10.0)
+
+    assert counter.get("export", now=10.0) == pytest.approx(1.0)
+    assert counter.snapshot(now=20.0) == {"export": 0.5, "help": 0.5}
+    # Both fall below the floor long after the last use
+    assert counter.prune(now=200.0) == 2
+    assert len(counter) == 0
+
+def test_running_totals_and_key_limit():
+    totals = DecayingCounter(half_life=None, max_keys=10)
+    for n in range(20):
+        totals.add(f"name{n}", amount=n, now=0.0)
+
+    assert len(totals) <= 10
+    # The smallest counters are evicted first and totals never decay
+    assert totals.get("name19", now=1e9) == 19
+    assert totals.get("name0") == 0.0
+
+@pytest.mark.asyncio
+async def test_checkpoint_and_restore_round_trip(db_manager):
+    analytics = AnalyticsManager(db_manager)
+    await analytics.track_conversion(1, "payment")
+    await analytics.track_conversion(2, "payment")
+    await analytics.track_feature_usage(1, "export")
+    await analytics.track_error("timeout")
+    await analytics.checkpoint()
+
+    restored = AnalyticsManager(db_manager)
+    assert await restored.restore() == 3
+    assert restored.analytics_data["conversion_funnels"].get("payment") == 2
+    assert restored.analytics_data["feature_usage"].get("export") == pytest.approx(1.0, rel=1e-3)
+    assert restored.analytics_data["error_patterns"].get("timeout") == pytest.approx(1.0, rel=1e-3)
+
+@pytest.mark.asyncio
+async def test_stop_writes_a_final_checkpoint(db_manager):
+    analytics = AnalyticsManager(db_manager, checkpoint_interval=3600)
+    analytics.start()
+    await analytics.track_conversion(1, "trial")
+    # Let the task restore first, so stop() knows the counters are complete
+    while not analytics._restored:
+        await asyncio.sleep(0.01)
+    await analytics.stop()
+
+    saved = await db_manager.load_analytics_counters()
+    assert [name for name, _, _ in saved["conversion_funnels"]] == ["trial"]
+
+@pytest.mark.asyncio
+async def test_recent_actions_are_kept_per_user(db_manager):
+    analytics = AnalyticsManager(db_manager)
+    analytics.MAX_RECENT_ACTIONS = 2
+    for action in ("start", "menu", "pay"):
+        await analytics.track_user_action(7, action)
+
+    assert [entry["action"] for entry in analytics.get_recent_actions(7)] == ["menu", "pay"]
+    assert analytics.get_recent_actions(8) == []
+
+@pytest.mark.asyncio
+async def test_admin_bot_starts_and_checkpoints_analytics(tmp_path, monkeypatch):
+    from admin_bot_complete import CompleteAdminBot
+
+    monkeypatch.setenv("ADMIN_BOT_TOKEN", "123456:TEST")
+    monkeypatch.setenv("DATABASE_PATH", str(tmp_path / "admin.db"))
+    bot = CompleteAdminBot()
+    try:
+        await bot.start_background_tasks()
+        await bot.analytics.track_conversion(1, "payment")
+        await bot.stop_background_tasks()
+        saved = await bot.db_manager.load_analytics_counters()
+    finally:
+        bot.db_manager.close()
+
+    assert bot.analytics._task is None
+    assert [name for name, _, _ in saved["conversion_funnels"]] == ["payment"]
@@ -0,0 +1,49 @@
+"""
+Tests for the typed analytics_events table and the per-user event summary.
+"""
+
+import json
+
+import pytest
+
+async def events(db_manager):
+    return await db_manager.run_read(lambda conn: conn.execute(
+        "SELECT user_id, event_kind, name, value, details FROM analytics_events ORDER BY id").fetchall())
+
+@pytest.mark.asyncio
+async def test_events_are_stored_typed_and_buffered(db_manager):
+    await db_manager.initialize_user(1, "alice")
+    await db_manager.store_analytics_event(1, "action", "open_menu", details={"from": "start"})
+    await db_manager.store_analytics_event(1, "conversion", "payment", value={"amount": 10})
+    assert await events(db_manager) == []
+
+    await db_manager.flush_writes()
+    assert await events(db_manager) == [
+        (1, "action", "open_menu", None, json.dumps({"from": "start"})),
+        (1, "conversion", "payment", json.dumps({"amount": 10}), None),
+    ]
+    # Nothing is written to user_messages any more
+    assert await db_manager.get_user_messages(1) == []
+
+@pytest.mark.asyncio
+async def test_unknown_event_kind_is_rejected(db_manager):
+    with pytest.raises(ValueError):
+        await db_manager.store_analytics_event(1, "click", "button")
+
+@pytest.mark.asyncio
+async def test_summary_counts_per_name_with_cumulative_recency(db_manager):
+    def write(conn):
+        for age in ("-2 hours", "-3 days", "-10 days", "-40 days"):
+            conn.execute("INSERT INTO analytics_events (user_id, event_kind, name, ts) "
+                         "VALUES (1, 'feature', 'export', datetime('now', ?))", (age,))
+        conn.execute("INSERT INTO analytics_events (user_id, event_kind, name, ts) "
+                     "VALUES (1, 'action', 'open_menu', datetime('now', '-1 hour'))")
+        conn.execute("INSERT INTO analytics_events (user_id, event_kind, name, ts) "
+                     "VALUES (2, 'feature', 'export', datetime('now'))")
+    await db_manager.run_write(write)
+
+    summary = {(row["event_kind"], row["name"]): row for row in await db_manager.get_user_event_summary(1)}
+    assert set(summary) == {("feature", "export"), ("action", "open_menu")}
+    export = summary[("feature", "export")]
+    assert export["count"] == 4
+    assert (export["within_1d"], export["within_7d"], export["within_30d"], export["older"]) == (1, 2, 3, 1)
@@ -0,0 +1,72 @@
+"""
+Tests for batch message processing: one state prefetch, per-user ordering, bounded concurrency.
+"""
+
+import asyncio
+
+import pytest
+
+from modules.performance import PerformanceManager
+
+def messages_for(user_ids, per_user):
+    return [{"id": f"{user_id}-{n}", "user_id": user_id} for n in range(per_user) for user_id in user_ids]
+
+@pytest.mark.asyncio
+async def test_missing_states_are_prefetched_in_one_query(db_manager, monkeypatch):
+    performance = PerformanceManager(db_manager)
+    for user_id in (1, 2, 3):
+        await db_manager.set_user_state(user_id, "menu", {"user": user_id})
+    await performance.get_cached_user_state(1)
+
+    bulk_calls = []
+    load_many = db_manager.get_user_state_data_many
+
+    async def counting_load_many(user_ids):
+        bulk_calls.append(list(user_ids))
+        return await load_many(user_ids)
+
+    monkeypatch.setattr(db_manager, "get_user_state_data_many", counting_load_many)
+    seen_states = {}
+
+    async def process(message, user_state):
+        seen_states[message["user_id"]] = user_state
+        return {"message_id": message["id"], "processed": True}
+
+    monkeypatch.setattr(performance, "_process_single_message", process)
+    results = await performance.batch_process_messages(messages_for([1, 2, 3], 2))
+
+    assert len(results) == 6
+    assert bulk_calls == [[2, 3]]
+    assert seen_states == {1: {"user": 1}, 2: {"user": 2}, 3: {"user": 3}}
+    last_batch = performance.batch_metrics["last_batch"]
+    assert (last_batch["messages"], last_batch["users"], last_batch["prefetched_states"]) == (6, 3, 2)
+
+@pytest.mark.asyncio
+async def test_users_run_concurrently_but_each_in_order(db_manager, monkeypatch):
+    performance = PerformanceManager(db_manager, batch_concurrency=2)
+    running, peak, order = 0, 0, {}
+
+    async def process(message, user_state):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        order.setdefault(message["user_id"], []).append(message["id"])
+        running -= 1
+        return {"message_id": message["id"]}
+
+    monkeypatch.setattr(performance, "_process_single_message", process)
+    results = await performance.batch_process_messages(messages_for([1, 2, 3, 4], 3))
+
+    assert peak == 2
+    assert order == {user_id: [f"{user_id}-{n}" for n in range(3)] for user_id in (1, 2, 3, 4)}
+    # Results are grouped per user, in message order within each user
+    assert [result["message_id"] for result in results] == \
+        [f"{user_id}-{n}" for user_id in (1, 2, 3, 4) for n in range(3)]
+
+@pytest.mark.asyncio
+async def test_messages_without_user_are_skipped(db_manager):
+    performance = PerformanceManager(db_manager)
+    assert await performance.batch_process_messages([]) == []
+    results = await performance.batch_process_messages([{"id": 1}, {"id": 2, "user_id": 5}])
+    assert [result["message_id"] for result in results] == [2]
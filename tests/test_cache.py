@@ -0,0 +1,105 @@
+"""
+Tests for the bounded LRU cache with per-namespace TTLs.
+"""
+
+import time
+
+import pytest
+
+from modules.cache import LRUTTLCache, estimate_size
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable replacement for time.monotonic"""
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    return now
+
+def test_entry_limit_evicts_least_recently_used():
+    cache = LRUTTLCache(max_entries=3, max_bytes=0)
+    for key in "abc":
+        cache.set("ns", key, key.upper())
+    # Touching "a" makes "b" the least recently used entry
+    assert cache.get("ns", "a") == "A"
+    cache.set("ns", "d", "D")
+
+    assert len(cache) == 3
+    assert cache.get("ns", "b") is None
+    assert [cache.get("ns", key) for key in "acd"] == ["A", "C", "D"]
+    assert cache.get_stats()["namespaces"]["ns"]["evictions"] == 1
+
+def test_byte_budget_evicts_until_within_budget():
+    value = "x" * 1000
+    size = estimate_size(value)
+    cache = LRUTTLCache(max_entries=100, max_bytes=size * 3)
+    for key in range(5):
+        cache.set("ns", key, value)
+
+    assert len(cache) == 3
+    assert cache.size_bytes == size * 3
+    assert [cache.contains("ns", key) for key in range(5)] == [False, False, True, True, True]
+
+def test_value_larger_than_budget_is_not_cached():
+    cache = LRUTTLCache(max_bytes=500)
+    cache.set("ns", "small", 1)
+    cache.set("ns", "small", "x" * 1000)
+
+    # The oversize value also drops the previous one so it is not served stale
+    assert not cache.contains("ns", "small")
+    assert cache.size_bytes == 0
+
+def test_entries_expire_by_namespace_ttl(clock):
+    cache = LRUTTLCache(default_ttl=60.0, namespace_ttls={"short": 5.0})
+    cache.set("short", 1, "a")
+    cache.set("long", 1, "b")
+    cache.set("long", 2, "c", ttl=1.0)
+
+    clock[0] += 2
+    assert cache.expire() == 1
+    assert cache.contains("short", 1)
+
+    clock[0] += 4
+    assert cache.get("short", 1) is None
+    assert cache.get("long", 1) == "b"
+    stats = cache.get_stats()["namespaces"]
+    assert stats["short"]["expirations"] == 1
+    assert stats["short"]["ttl"] == 5.0
+    assert stats["long"]["ttl"] == 60.0
+
+def test_replaced_entry_uses_its_new_expiry(clock):
+    cache = LRUTTLCache(default_ttl=10.0)
+    cache.set("ns", "k", "old")
+    clock[0] += 8
+    cache.set("ns", "k", "new")
+
+    # The superseded heap item for "old" must not expire the new value
+    clock[0] += 5
+    assert cache.expire() == 0
+    assert cache.get("ns", "k") == "new"
+
+def test_shrink_and_invalidation():
+    cache = LRUTTLCache(max_bytes=0)
+    for key in range(10):
+        cache.set("a", key, "x" * 100)
+    cache.set("b", 0, "y")
+
+    entry_size = estimate_size("x" * 100)
+    evicted, freed = cache.shrink(cache.size_bytes - 3 * entry_size)
+    assert (evicted, freed) == (3, 3 * entry_size)
+    assert not cache.contains("a", 0)
+
+    assert cache.invalidate_namespace("a") == 7
+    assert cache.delete("b", 0)
+    assert not cache.delete("b", 0)
+    assert len(cache) == 0 and cache.size_bytes == 0
+
+def test_stats_count_hits_and_misses_per_namespace():
+    cache = LRUTTLCache()
+    cache.set("ns", 1, None)
+    assert cache.get("ns", 1, "default") is None
+    assert cache.get("ns", 2, "default") == "default"
+
+    stats = cache.get_stats()
+    assert (stats["hits"], stats["misses"], stats["sets"]) == (1, 1, 1)
+    assert stats["hit_rate"] == 50.0
+    assert stats["namespaces"]["ns"]["entries"] == 1
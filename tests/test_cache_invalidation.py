@@ -0,0 +1,72 @@
+"""
+Tests for cache invalidation driven by DatabaseManager change events.
+"""
+
+import pytest
+
+from modules.performance import PerformanceManager
+
+@pytest.fixture
+def performance(db_manager):
+    return PerformanceManager(db_manager)
+
+@pytest.mark.asyncio
+async def test_write_invalidates_only_the_affected_user_and_namespace(db_manager, performance):
+    for user_id in (1, 2):
+        await db_manager.initialize_user(user_id, f"user{user_id}")
+        await db_manager.set_user_state(user_id, "menu", {"step": 1})
+        await performance.get_cached_user_state(user_id)
+        await performance.get_cached_user_profile(user_id)
+
+    await db_manager.set_user_state(1, "menu", {"step": 2})
+
+    assert not performance.cache.contains("user_state", 1)
+    assert performance.cache.contains("user_state", 2)
+    assert performance.cache.contains("user_profile", 1)
+    assert await performance.get_cached_user_state(1) == {"step": 2}
+
+@pytest.mark.asyncio
+async def test_profile_update_is_visible_through_the_cache(db_manager, performance):
+    await db_manager.initialize_user(1, "alice", first_name="Alice")
+    assert (await performance.get_cached_user_profile(1))["city"] is None
+
+    await db_manager.update_user_profile(1, city="Berlin")
+    assert (await performance.get_cached_user_profile(1))["city"] == "Berlin"
+
+@pytest.mark.asyncio
+async def test_order_update_invalidates_the_owning_user(db_manager, performance):
+    await db_manager.initialize_user(1, "alice")
+    await db_manager.create_subscription(1, "order-1", "goal", "regular", {"name": "Basic"})
+    await db_manager.run_write(lambda conn: conn.execute(
+        "UPDATE subscriptions SET end_date = datetime('now', '+7 days') WHERE order_id = 'order-1'"))
+    assert await performance.get_cached_subscription(1) is None
+
+    await db_manager.update_subscription_status("order-1", "active", "pay-1", "card")
+    subscription = await performance.get_cached_subscription(1)
+    assert subscription["order_id"] == "order-1"
+    assert subscription["status"] == "active"
+
+@pytest.mark.asyncio
+async def test_reset_event_drops_every_loader_namespace(db_manager, performance):
+    await db_manager.initialize_user(1, "alice")
+    await performance.get_cached_user_state(1)
+    await performance.get_cached_user_profile(1)
+
+    db_manager._publish_reset()
+
+    assert not performance.cache.contains("user_state", 1)
+    assert not performance.cache.contains("user_profile", 1)
+
+@pytest.mark.asyncio
+async def test_failing_listener_does_not_break_writes(db_manager, performance):
+    def broken(table, user_id):
+        raise RuntimeError("listener bug")
+
+    db_manager.add_change_listener(broken)
+    await db_manager.initialize_user(1, "alice")
+    await performance.get_cached_user_state(1)
+    await db_manager.set_user_state(1, "menu", {"step": 3})
+
+    # Listeners after the failing one still run
+    db_manager.remove_change_listener(broken)
+    assert await performance.get_cached_user_state(1) == {"step": 3}
@@ -0,0 +1,79 @@
+"""
+Tests for the startup cache warm-up of recently active users.
+"""
+
+import pytest
+
+from modules.performance import PerformanceManager
+
+async def add_users(db_manager, recent, old):
+    for user_id in list(recent) + list(old):
+        await db_manager.initialize_user(user_id, f"user{user_id}")
+        await db_manager.set_user_state(user_id, "menu", {"user": user_id})
+
+    def backdate(conn):
+        for minutes, user_id in enumerate(recent):
+            conn.execute("UPDATE users SET last_activity = datetime('now', ?) WHERE user_id = ?",
+                         (f"-{minutes} minutes", user_id))
+        for user_id in old:
+            conn.execute("UPDATE users SET last_activity = datetime('now', '-3 days') WHERE user_id = ?",
+                         (user_id,))
+    await db_manager.run_write(backdate)
+
+@pytest.mark.asyncio
+async def test_warmup_loads_recent_users_in_chunks(db_manager, monkeypatch):
+    await add_users(db_manager, recent=range(1, 6), old=[100])
+    performance = PerformanceManager(db_manager)
+    assert not performance.is_ready
+
+    chunks = []
+    load_many = db_manager.get_user_state_data_many
+
+    async def counting_load_many(user_ids):
+        chunks.append(list(user_ids))
+        return await load_many(user_ids)
+
+    monkeypatch.setattr(db_manager, "get_user_state_data_many", counting_load_many)
+    status = await performance.preload_frequent_data(active_hours=24, chunk_size=2)
+
+    assert status["state"] == "ready" and status["ready"]
+    assert (status["users"], status["loaded"]) == (5, 5)
+    # Most recently active first, one bulk query per chunk
+    assert chunks == [[1, 2], [3, 4], [5]]
+    for user_id in range(1, 6):
+        for namespace in ("user_state", "user_profile", "subscription"):
+            assert performance.cache.contains(namespace, user_id)
+    assert not performance.cache.contains("user_state", 100)
+
+@pytest.mark.asyncio
+async def test_warmup_is_capped_by_cache_capacity(db_manager):
+    await add_users(db_manager, recent=range(1, 6), old=[])
+    performance = PerformanceManager(db_manager, cache_max_entries=6)
+
+    status = await performance.preload_frequent_data()
+    # Three entries per user, so only the two most recent users fit
+    assert (status["users"], status["loaded"]) == (2, 2)
+    assert len(performance.cache) == 6
+
+@pytest.mark.asyncio
+async def test_exhausted_time_budget_leaves_a_partial_warmup(db_manager):
+    await add_users(db_manager, recent=range(1, 4), old=[])
+    performance = PerformanceManager(db_manager)
+
+    status = await performance.preload_frequent_data(time_budget=0.0)
+    assert status["state"] == "partial"
+    assert status["loaded"] < 3
+    assert performance.is_ready
+
+@pytest.mark.asyncio
+async def test_failed_warmup_is_reported_and_still_ready(db_manager, monkeypatch):
+    performance = PerformanceManager(db_manager)
+
+    async def broken(hours, limit):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr(db_manager, "get_recently_active_user_ids", broken)
+    status = await performance.preload_frequent_data()
+    assert status["state"] == "failed"
+    assert status["error"] == "database is locked"
+    assert status["ready"]
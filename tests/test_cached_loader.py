@@ -0,0 +1,148 @@
+"""
+Tests for single-flight, stale-while-revalidate loading through CachedLoader.
+"""
+
+import asyncio
+
+import pytest
+
+from modules.cache import CachedLoader, LRUTTLCache, cached
+
+class CountingLoader:
+    """Async loader that records its calls and blocks until released"""
+
+    def __init__(self):
+        self.calls = []
+        self.release = asyncio.Event()
+        self.version = 0
+
+    async def __call__(self, key):
+        self.calls.append(key)
+        await self.release.wait()
+        return f"{key}-v{self.version}"
+
+    async def bulk(self, keys):
+        self.calls.append(tuple(keys))
+        await self.release.wait()
+        return {key: f"{key}-bulk" for key in keys}
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_load():
+    source = CountingLoader()
+    loader = CachedLoader(LRUTTLCache(), "users", source, ttl=60.0)
+
+    waiters = [asyncio.create_task(loader.get(1)) for _ in range(5)]
+    await asyncio.sleep(0)
+    source.release.set()
+
+    assert await asyncio.gather(*waiters) == ["1-v0"] * 5
+    assert source.calls == [1]
+    assert loader.stats["loads"] == 1
+    assert loader.stats["coalesced"] == 4
+    # Served from the cache afterwards
+    assert await loader.get(1) == "1-v0"
+    assert source.calls == [1]
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_abort_shared_load():
+    source = CountingLoader()
+    loader = CachedLoader(LRUTTLCache(), "users", source, ttl=60.0)
+
+    first = asyncio.create_task(loader.get(1))
+    second = asyncio.create_task(loader.get(1))
+    await asyncio.sleep(0)
+    first.cancel()
+    source.release.set()
+
+    assert await second == "1-v0"
+    assert loader.cache.contains("users", 1)
+
+@pytest.mark.asyncio
+async def test_stale_entry_is_served_while_refreshing_once():
+    source = CountingLoader()
+    source.release.set()
+    loader = CachedLoader(LRUTTLCache(), "users", source, ttl=0.05, stale_ttl=60.0)
+    assert await loader.get(1) == "1-v0"
+
+    await asyncio.sleep(0.06)
+    source.version = 1
+    source.release.clear()
+    # Both callers get the stale value immediately; only one refresh starts
+    assert await loader.get(1) == "1-v0"
+    assert await loader.get(1) == "1-v0"
+    assert loader.stats["stale_served"] == 2
+    assert loader.stats["background_refreshes"] == 1
+
+    source.release.set()
+    await asyncio.sleep(0.01)
+    assert await loader.get(1) == "1-v1"
+    assert source.calls == [1, 1]
+
+@pytest.mark.asyncio
+async def test_load_errors_are_not_cached():
+    attempts = []
+
+    async def flaky(key):
+        attempts.append(key)
+        if len(attempts) == 1:
+            raise RuntimeError("database unavailable")
+        return "ok"
+
+    loader = CachedLoader(LRUTTLCache(), "users", flaky, ttl=60.0)
+    with pytest.raises(RuntimeError):
+        await loader.get(1)
+    assert await loader.get(1) == "ok"
+    assert loader.stats["load_errors"] == 1
+    assert attempts == [1, 1]
+
+@pytest.mark.asyncio
+async def test_invalidate_discards_in_flight_result():
+    source = CountingLoader()
+    loader = CachedLoader(LRUTTLCache(), "users", source, ttl=60.0)
+
+    pending = asyncio.create_task(loader.get(1))
+    await asyncio.sleep(0)
+    loader.invalidate(1)
+    source.release.set()
+
+    # The caller still gets its value, but the possibly outdated result is not cached
+    assert await pending == "1-v0"
+    assert not loader.cache.contains("users", 1)
+
+@pytest.mark.asyncio
+async def test_get_many_loads_missing_keys_in_one_call_and_coalesces():
+    source = CountingLoader()
+    loader = CachedLoader(LRUTTLCache(), "users", source, ttl=60.0)
+    source.release.set()
+    assert await loader.get(1) == "1-v0"
+    source.release.clear()
+
+    bulk = asyncio.create_task(loader.get_many([1, 2, 3, 2], source.bulk))
+    await asyncio.sleep(0)
+    # A single get for a key in the bulk load waits for it instead of loading again
+    single = asyncio.create_task(loader.get(3))
+    await asyncio.sleep(0)
+    source.release.set()
+
+    assert await bulk == {1: "1-v0", 2: "2-bulk", 3: "3-bulk"}
+    assert await single == "3-bulk"
+    assert source.calls == [1, (2, 3)]
+    assert loader.stats["bulk_loads"] == 1
+    assert loader.stats["bulk_keys"] == 2
+    assert loader.stats["coalesced"] == 1
+
+@pytest.mark.asyncio
+async def test_cached_decorator_exposes_loader_and_invalidate():
+    calls = []
+
+    @cached(LRUTTLCache(), "profiles", ttl=60.0)
+    async def load_profile(user_id):
+        calls.append(user_id)
+        return {"id": user_id}
+
+    assert await load_profile(7) == {"id": 7}
+    assert await load_profile(7) == {"id": 7}
+    load_profile.invalidate(7)
+    assert await load_profile(7) == {"id": 7}
+    assert calls == [7, 7]
+    assert load_profile.loader.get_stats()["loads"] == 2
@@ -0,0 +1,83 @@
+"""
+Tests for the change_log watcher and its origin filtering.
+"""
+
+import sqlite3
+
+import pytest
+
+from modules.change_feed import PROCESS_ORIGIN, ChangeLogWatcher
+
+@pytest.fixture
+def watcher(db_manager):
+    watcher = ChangeLogWatcher(db_manager, prune_every=0)
+    yield watcher
+    watcher.close()
+
+@pytest.fixture
+def events(db_manager):
+    received = []
+    db_manager.add_change_listener(lambda table, key: received.append((table, key)))
+    return received
+
+def foreign_write(db_manager, sql, params=()):
+    """Commit a statement from a connection that is not part of this process's pool"""
+    conn = sqlite3.connect(db_manager.db_path)
+    try:
+        with conn:
+            conn.execute(sql, params)
+    finally:
+        conn.close()
+
+@pytest.mark.asyncio
+async def test_own_writes_are_stamped_and_skipped(db_manager, watcher, events):
+    await db_manager.set_user_state(1, "menu", {})
+    events.clear()
+
+    assert await watcher.poll_once() == 0
+    assert events == []
+    assert watcher.stats["own_changes_skipped"] == 1
+    origins = await db_manager.run_read(lambda conn: conn.execute(
+        "SELECT DISTINCT origin FROM change_log").fetchall())
+    assert origins == [(PROCESS_ORIGIN,)]
+
+@pytest.mark.asyncio
+async def test_foreign_writes_are_published_once_per_key(db_manager, watcher, events):
+    await db_manager.set_user_state(1, "menu", {})
+    events.clear()
+    for step in range(3):
+        foreign_write(db_manager, "UPDATE user_states SET current_state = ? WHERE user_id = 1", (f"s{step}",))
+    foreign_write(db_manager, "INSERT INTO user_states (user_id, current_state) VALUES (2, 'start')")
+
+    assert await watcher.poll_once() == 2
+    assert events == [("user_states", 1), ("user_states", 2)]
+    # Nothing new: data_version is unchanged and the poll is a header check only
+    assert await watcher.poll_once() == 0
+    assert watcher.stats["version_changes"] == 1
+
+@pytest.mark.asyncio
+async def test_pruned_unseen_rows_trigger_a_reset(db_manager, watcher, events):
+    foreign_write(db_manager, "INSERT INTO user_states (user_id, current_state) VALUES (1, 'start')")
+    foreign_write(db_manager, "DELETE FROM change_log")
+
+    assert await watcher.poll_once() == 0
+    assert events == [("*", None)]
+    assert watcher.stats["resets"] == 1
+
+    # The watcher resumes after the gap
+    foreign_write(db_manager, "UPDATE user_states SET current_state = 'menu' WHERE user_id = 1")
+    events.clear()
+    assert await watcher.poll_once() == 1
+    assert events == [("user_states", 1)]
+
+@pytest.mark.asyncio
+async def test_prune_removes_rows_older_than_retention(db_manager, watcher):
+    await db_manager.set_user_state(1, "menu", {})
+    await db_manager.run_write(lambda conn: conn.execute(
+        "UPDATE change_log SET changed_at = datetime('now', '-2 hours')"))
+    await db_manager.set_user_state(2, "menu", {})
+
+    assert await watcher.prune() == 1
+    remaining = await db_manager.run_read(lambda conn: conn.execute(
+        "SELECT key FROM change_log").fetchall())
+    assert remaining == [(2,)]
@@ -0,0 +1,90 @@
+"""
+Tests for ConnectionPool: connection reuse, bounded checkout and per-connection setup.
+"""
+
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from modules.connection_pool import ConnectionPool, PoolTimeoutError
+
+@pytest.fixture
+def pool(tmp_path):
+    connection_pool = ConnectionPool(str(tmp_path / "pool.db"), max_connections=2, checkout_timeout=1.0)
+    yield connection_pool
+    connection_pool.close()
+
+def test_connections_are_configured_once_and_reused(tmp_path):
+    configured = []
+    pool = ConnectionPool(str(tmp_path / "pool.db"), max_connections=2, on_connect=configured.append)
+    try:
+        with pool.connection() as conn:
+            first = conn
+            assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+            assert conn.execute("PRAGMA busy_timeout").fetchone()[0] == 5000
+        with pool.connection() as conn:
+            assert conn is first
+        assert configured == [first]
+        assert pool.get_stats()["connections_created"] == 1
+        assert pool.get_stats()["checkouts"] == 2
+    finally:
+        pool.close()
+
+def test_checkout_times_out_when_every_connection_is_in_use(pool):
+    held = [pool.acquire(), pool.acquire()]
+    with pytest.raises(PoolTimeoutError):
+        pool.acquire(timeout=0.05)
+
+    stats = pool.get_stats()
+    assert stats["open_connections"] == 2
+    assert stats["in_use"] == 2
+    assert stats["checkout_waits"] == 1
+    assert stats["checkout_timeouts"] == 1
+    for conn in held:
+        pool.release(conn)
+
+def test_waiting_checkout_gets_the_released_connection(pool):
+    held = [pool.acquire(), pool.acquire()]
+    releaser = threading.Timer(0.1, pool.release, args=(held[0],))
+    releaser.start()
+
+    start = time.monotonic()
+    conn = pool.acquire(timeout=2.0)
+    assert conn is held[0]
+    assert time.monotonic() - start >= 0.05
+    assert pool.get_stats()["max_wait_time"] > 0
+    pool.release(conn)
+    pool.release(held[1])
+    releaser.join()
+
+def test_context_manager_commits_or_rolls_back(pool):
+    with pool.connection() as conn:
+        conn.execute("CREATE TABLE items (name TEXT)")
+    with pytest.raises(RuntimeError):
+        with pool.connection() as conn:
+            conn.execute("INSERT INTO items VALUES ('lost')")
+            raise RuntimeError("boom")
+    with pool.connection() as conn:
+        conn.execute("INSERT INTO items VALUES ('kept')")
+    with pool.connection() as conn:
+        assert conn.execute("SELECT name FROM items").fetchall() == [("kept",)]
+
+def test_release_rolls_back_a_dangling_transaction(pool):
+    with pool.connection() as conn:
+        conn.execute("CREATE TABLE items (name TEXT)")
+    conn = pool.acquire()
+    conn.execute("INSERT INTO items VALUES ('uncommitted')")
+    assert conn.in_transaction
+    pool.release(conn)
+
+    conn = pool.acquire()
+    assert not conn.in_transaction
+    assert conn.execute("SELECT COUNT(*) FROM items").fetchone()[0] == 0
+    pool.release(conn)
+
+def test_closed_pool_refuses_checkouts(pool):
+    pool.close()
+    with pytest.raises(sqlite3.ProgrammingError):
+        pool.acquire()
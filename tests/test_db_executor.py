@@ -0,0 +1,107 @@
+"""
+Tests for DatabaseExecutor: off-loop execution, timeouts and interruption.
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+
+from modules.connection_pool import ConnectionPool
+from modules.db_executor import DatabaseExecutor, DatabaseTimeoutError
+
+# Counts far enough that only sqlite3_interrupt() ends it within the test's patience
+SLOW_QUERY = '''
+    WITH RECURSIVE counter(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM counter LIMIT 500000000)
+    SELECT MAX(x) FROM counter
+'''
+
+@pytest.fixture
+def executor(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "executor.db"), max_connections=3)
+    database_executor = DatabaseExecutor(pool, reader_threads=2, default_timeout=10.0)
+    yield database_executor
+    database_executor.shutdown()
+    pool.close()
+
+def slow_query(conn):
+    return conn.execute(SLOW_QUERY).fetchone()
+
+@pytest.mark.asyncio
+async def test_reads_and_writes_run_on_their_own_threads(executor):
+    def thread_name(conn):
+        return threading.current_thread().name
+
+    assert (await executor.run_read(thread_name)).startswith("db-reader")
+    assert (await executor.run_write(thread_name)).startswith("db-writer")
+    assert executor.get_stats()["reads"] == 1
+    assert executor.get_stats()["writes"] == 1
+
+@pytest.mark.asyncio
+async def test_write_commits_on_success_and_rolls_back_on_error(executor):
+    await executor.run_write(lambda conn: conn.execute("CREATE TABLE items (name TEXT)"))
+    await executor.run_write(lambda conn: conn.execute("INSERT INTO items VALUES ('kept')"))
+
+    def failing_write(conn):
+        conn.execute("INSERT INTO items VALUES ('lost')")
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        await executor.run_write(failing_write)
+    rows = await executor.run_read(lambda conn: conn.execute("SELECT name FROM items").fetchall())
+    assert rows == [("kept",)]
+    assert executor.get_stats()["errors"] == 1
+
+@pytest.mark.asyncio
+async def test_event_loop_keeps_running_during_a_slow_query(executor):
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    ticking = asyncio.create_task(ticker())
+    with pytest.raises(DatabaseTimeoutError):
+        await executor.run_read(slow_query, timeout=0.3)
+    ticking.cancel()
+    assert ticks >= 5
+
+@pytest.mark.asyncio
+async def test_timeout_interrupts_the_running_statement(executor):
+    start = time.monotonic()
+    with pytest.raises(DatabaseTimeoutError):
+        await executor.run_read(slow_query, timeout=0.2)
+    assert executor.get_stats()["timeouts"] == 1
+
+    # The interrupted connection goes back to the pool and the next call is not stuck behind it
+    assert await executor.run_read(lambda conn: conn.execute("SELECT 1").fetchone(), timeout=5.0) == (1,)
+    assert time.monotonic() - start < 5.0
+    await asyncio.sleep(0.1)
+    assert executor.pool.get_stats()["in_use"] == 0
+
+@pytest.mark.asyncio
+async def test_cancellation_interrupts_the_running_statement(executor):
+    task = asyncio.create_task(executor.run_write(slow_query))
+    await asyncio.sleep(0.2)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert executor.get_stats()["cancellations"] == 1
+
+    # The writer thread is free again
+    assert await executor.run_write(lambda conn: conn.execute("SELECT 2").fetchone(), timeout=5.0) == (2,)
+
+@pytest.mark.asyncio
+async def test_job_timed_out_while_queued_never_runs(executor):
+    ran = []
+    blocker = asyncio.create_task(executor.run_write(lambda conn: time.sleep(0.3)))
+    await asyncio.sleep(0.05)
+
+    with pytest.raises(DatabaseTimeoutError):
+        await executor.run_write(lambda conn: ran.append(True), timeout=0.05)
+    await blocker
+    await executor.run_write(lambda conn: None)
+    assert ran == []
@@ -0,0 +1,69 @@
+"""
+Tests for the forward-decayed engagement score kept in users.engagement_log.
+"""
+
+import time
+
+import pytest
+
+from modules.engagement import ENGAGEMENT_HALF_LIFE, current_score, event_exponent, logaddexp2
+
+def test_logaddexp2_adds_in_linear_space():
+    assert logaddexp2(None, 3.0) == 3.0
+    assert logaddexp2(3.0, None) == 3.0
+    assert 2 ** logaddexp2(3.0, 1.0) == pytest.approx(8 + 2)
+    # Large exponents stay finite where 2 ** x would overflow
+    assert logaddexp2(5000.0, 5000.0) == pytest.approx(5001.0)
+
+def test_score_halves_every_half_life():
+    now = time.time()
+    total = logaddexp2(event_exponent(now), event_exponent(now))
+    assert current_score(total, now) == pytest.approx(2.0)
+    assert current_score(total, now + ENGAGEMENT_HALF_LIFE) == pytest.approx(1.0)
+    assert current_score(None, now) == 0.0
+
+@pytest.mark.asyncio
+async def test_each_event_adds_about_one(db_manager):
+    await db_manager.initialize_user(1, "alice")
+    assert await db_manager.get_engagement_score(1) == 0.0
+
+    await db_manager.store_analytics_event(1, "action", "open_menu")
+    assert await db_manager.get_engagement_score(1) == pytest.approx(1.0, rel=1e-3)
+    await db_manager.store_analytics_event(1, "feature", "export")
+    assert await db_manager.get_engagement_score(1) == pytest.approx(2.0, rel=1e-3)
+
+@pytest.mark.asyncio
+async def test_ranking_orders_by_current_score(db_manager):
+    for user_id, events in ((1, 1), (2, 3), (3, 0), (4, 2)):
+        await db_manager.initialize_user(user_id, f"user{user_id}")
+        for _ in range(events):
+            await db_manager.store_analytics_event(user_id, "action", "tap")
+
+    top = await db_manager.get_engagement_ranking(limit=3)
+    assert [row["user_id"] for row in top] == [2, 4, 1]
+    assert top[0]["engagement_score"] == pytest.approx(3.0, rel=1e-3)
+
+    bottom = await db_manager.get_engagement_ranking(limit=2, least_engaged=True)
+    assert [row["user_id"] for row in bottom] == [3, 1]
+    assert bottom[0]["engagement_score"] == 0.0
+
+@pytest.mark.asyncio
+async def test_recompute_rebuilds_scores_from_event_history(db_manager):
+    for user_id in (1, 2, 3):
+        await db_manager.initialize_user(user_id, f"user{user_id}")
+
+    def write(conn):
+        days = ENGAGEMENT_HALF_LIFE / 86400
+        rows = [(1, "-0 days"), (1, f"-{days} days"), (2, f"-{2 * days} days")]
+        conn.executemany("INSERT INTO analytics_events (user_id, event_kind, name, ts) "
+                         "VALUES (?, 'action', 'tap', datetime('now', ?))", rows)
+        conn.execute("UPDATE users SET engagement_log = 1000 WHERE user_id = 3")
+    await db_manager.run_write(write)
+
+    assert await db_manager.recompute_engagement_scores(batch_users=2) == 3
+
+    # One event now plus one a half-life ago, and one two half-lives ago
+    assert await db_manager.get_engagement_score(1) == pytest.approx(1.5, rel=1e-3)
+    assert await db_manager.get_engagement_score(2) == pytest.approx(0.25, rel=1e-3)
+    # No events: the stale value is cleared
+    assert await db_manager.get_engagement_score(3) == 0.0
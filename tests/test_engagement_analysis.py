@@ -0,0 +1,83 @@
+"""
+Tests for the single-pass engagement analysis: nearest-rank percentiles and segments.
+"""
+
+import math
+
+import pytest
+
+from modules.analytics import ENGAGEMENT_PERCENTILES, AnalyticsManager
+
+# Messages per user: a long tail of light users and a few heavy ones
+MESSAGE_COUNTS = list(range(1, 21)) + [50, 60, 75, 120]
+
+def nearest_rank(values, p):
+    """Smallest value whose share of values at or below it is at least p%"""
+    ordered = sorted(values)
+    return ordered[max(1, math.ceil(p / 100 * len(ordered))) - 1]
+
+async def populate(db_manager):
+    def write(conn):
+        for user_id, count in enumerate(MESSAGE_COUNTS, start=1):
+            conn.execute("INSERT INTO users (user_id, username) VALUES (?, ?)", (user_id, f"user{user_id}"))
+            conn.executemany("INSERT INTO user_messages (user_id, message_text) VALUES (?, 'hi')",
+                             [(user_id,)] * count)
+            # Active on (user_id % 5) + 1 of the recent days, plus a day outside the window
+            conn.executemany("INSERT INTO daily_active_users (day, user_id) VALUES (date('now', ?), ?)",
+                             [(f"-{day} days", user_id) for day in range(user_id % 5 + 1)])
+            conn.execute("INSERT INTO daily_active_users (day, user_id) VALUES (date('now', '-60 days'), ?)",
+                         (user_id,))
+        # A user with events but no messages is not part of the analysis
+        conn.execute("INSERT INTO users (user_id, username) VALUES (999, 'lurker')")
+    await db_manager.run_write(write)
+    # Tracked events give users 1-4 an engagement score of 1-4
+    for user_id in range(1, 5):
+        for _ in range(user_id):
+            await db_manager.store_analytics_event(user_id, "action", "tap")
+    await db_manager.store_analytics_event(999, "action", "tap")
+    await db_manager.flush_writes()
+
+@pytest.mark.asyncio
+async def test_percentiles_and_segments(db_manager):
+    await populate(db_manager)
+    analysis = await AnalyticsManager(db_manager).get_user_engagement_analysis(active_days_window=30)
+
+    assert analysis["total_active_users"] == len(MESSAGE_COUNTS)
+    messages = analysis["message_metrics"]
+    assert messages["percentiles"] == {f"p{p}": nearest_rank(MESSAGE_COUNTS, p) for p in ENGAGEMENT_PERCENTILES}
+    assert messages["median_messages_per_user"] == nearest_rank(MESSAGE_COUNTS, 50)
+    assert (messages["min_messages_per_user"], messages["max_messages_per_user"]) == (1, 120)
+    assert messages["avg_messages_per_user"] == pytest.approx(sum(MESSAGE_COUNTS) / len(MESSAGE_COUNTS))
+
+    active_days = [user_id % 5 + 1 for user_id in range(1, len(MESSAGE_COUNTS) + 1)]
+    activity = analysis["activity_metrics"]
+    assert activity["percentiles"] == {f"p{p}": nearest_rank(active_days, p) for p in ENGAGEMENT_PERCENTILES}
+    assert activity["max_active_days"] == 5
+
+    # Only users with tracked events count towards the score quantiles
+    scores = analysis["engagement_score_percentiles"]
+    assert scores == pytest.approx({f"p{p}": float(nearest_rank([1, 2, 3, 4], p)) for p in ENGAGEMENT_PERCENTILES},
+                                   abs=0.01)
+
+    assert analysis["engagement_segments"] == {
+        "high_engagement": sum(count >= 50 for count in MESSAGE_COUNTS),
+        "medium_engagement": sum(10 <= count < 50 for count in MESSAGE_COUNTS),
+        "low_engagement": sum(count < 10 for count in MESSAGE_COUNTS),
+    }
+
+@pytest.mark.asyncio
+async def test_analysis_is_cached_per_window(db_manager):
+    await populate(db_manager)
+    analytics = AnalyticsManager(db_manager)
+
+    first = await analytics.get_user_engagement_analysis()
+    await db_manager.run_write(lambda conn: conn.execute(
+        "INSERT INTO user_messages (user_id, message_text) VALUES (1, 'again')"))
+    assert await analytics.get_user_engagement_analysis() is first
+    # A different window is a separate entry
+    assert (await analytics.get_user_engagement_analysis(active_days_window=7))["activity_metrics"]["window_days"] == 7
+
+@pytest.mark.asyncio
+async def test_empty_database_reports_no_data(db_manager):
+    analysis = await AnalyticsManager(db_manager).get_user_engagement_analysis()
+    assert analysis == {"error": "No engagement data available"}
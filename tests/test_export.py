@@ -0,0 +1,148 @@
+"""
+Tests for streaming table exports to gzip-compressed NDJSON and CSV files.
+"""
+
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+
+import pytest
+
+from modules.export import DataExporter
+
+async def add_events(db_manager, days):
+    """One analytics event per entry of ``days`` (e.g. "2024-05-01 10:00:00")"""
+    await db_manager.run_write(lambda conn: conn.executemany(
+        "INSERT INTO analytics_events (user_id, event_kind, name, details, ts) VALUES (?, 'action', ?, ?, ?)",
+        [(n, f"event{n}", json.dumps({"n": n, "text": "naïve"}), day) for n, day in enumerate(days)]))
+
+def read_lines(path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return f.read().splitlines()
+
+@pytest.mark.asyncio
+async def test_ndjson_export_streams_every_row_in_chunks(db_manager, tmp_path, monkeypatch):
+    await add_events(db_manager, ["2024-05-01 10:00:00"] * 7)
+    exporter = DataExporter(db_manager, chunk_rows=3)
+    reads = []
+    run_read = db_manager.run_read
+
+    async def counting_read(fn, *args, **kwargs):
+        reads.append(fn)
+        return await run_read(fn, *args, **kwargs)
+
+    monkeypatch.setattr(db_manager, "run_read", counting_read)
+    result = await exporter.export("analytics_events", directory=str(tmp_path))
+
+    assert (result["rows"], result["truncated"]) == (7, False)
+    assert result["bytes"] == os.path.getsize(result["path"])
+    assert len(reads) == 3
+    rows = [json.loads(line) for line in read_lines(result["path"])]
+    assert [row["name"] for row in rows] == [f"event{n}" for n in range(7)]
+    assert json.loads(rows[0]["details"]) == {"n": 0, "text": "naïve"}
+    assert exporter.get_stats()["rows_exported"] == 7
+
+@pytest.mark.asyncio
+async def test_csv_export_has_header_and_date_filter(db_manager, tmp_path):
+    await add_events(db_manager, ["2024-04-30 23:59:59", "2024-05-01 00:00:00", "2024-05-02 23:59:59",
+                                  "2024-05-03 00:00:00"])
+    exporter = DataExporter(db_manager)
+
+    result = await exporter.export("analytics_events", "csv", since="2024-05-01", until="2024-05-02",
+                                   directory=str(tmp_path))
+
+    rows = list(csv.reader(io.StringIO("\n".join(read_lines(result["path"])))))
+    assert rows[0][:4] == ["id", "user_id", "event_kind", "name"]
+    assert [row[3] for row in rows[1:]] == ["event1", "event2"]
+    assert result["filename"] == "analytics_events_2024-05-01_2024-05-02.csv.gz"
+
+@pytest.mark.asyncio
+async def test_empty_csv_export_still_has_a_header(db_manager, tmp_path):
+    result = await DataExporter(db_manager).export("users", "csv", directory=str(tmp_path))
+    assert result["rows"] == 0
+    assert read_lines(result["path"])[0].startswith("user_id,")
+
+@pytest.mark.asyncio
+async def test_export_stops_at_the_size_limit(db_manager, tmp_path):
+    await add_events(db_manager, ["2024-05-01 10:00:00"] * 10)
+    exporter = DataExporter(db_manager, chunk_rows=2, max_bytes=1)
+
+    result = await exporter.export("analytics_events", directory=str(tmp_path))
+
+    assert result["truncated"]
+    assert result["rows"] == 2
+    assert len(read_lines(result["path"])) == 2
+    assert exporter.get_stats()["truncated"] == 1
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("args", [
+    {"table": "sqlite_master"},
+    {"table": "users", "fmt": "xml"},
+    {"table": "users", "since": "2024-13-01"},
+    {"table": "users", "until": "yesterday"},
+])
+async def test_invalid_arguments_are_rejected_before_writing(db_manager, tmp_path, args):
+    with pytest.raises(ValueError):
+        await DataExporter(db_manager).export(directory=str(tmp_path), **args)
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".gz")]
+
+@pytest.mark.asyncio
+async def test_failed_export_removes_the_partial_file(db_manager, tmp_path, monkeypatch):
+    await add_events(db_manager, ["2024-05-01 10:00:00"] * 5)
+    exporter = DataExporter(db_manager, chunk_rows=2)
+    writes = []
+
+    def failing_write(stream, fmt, columns, rows, header):
+        writes.append(len(rows))
+        if len(writes) == 2:
+            raise OSError("disk full")
+        DataExporter._write_chunk(stream, fmt, columns, rows, header)
+
+    monkeypatch.setattr(exporter, "_write_chunk", failing_write)
+    with pytest.raises(OSError, match="disk full"):
+        await exporter.export("analytics_events", directory=str(tmp_path))
+
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".gz")]
+    assert exporter.get_stats()["errors"] == 1
+
+@pytest.mark.asyncio
+async def test_cancelled_export_removes_the_partial_file(db_manager, tmp_path, monkeypatch):
+    await add_events(db_manager, ["2024-05-01 10:00:00"] * 5)
+    exporter = DataExporter(db_manager, chunk_rows=2)
+    started, blocked = asyncio.Event(), asyncio.Event()
+    run_read = db_manager.run_read
+
+    async def stalling_read(fn, *args, **kwargs):
+        result = await run_read(fn, *args, **kwargs)
+        if args[2] > -(2 ** 63):
+            started.set()
+            await blocked.wait()
+        return result
+
+    monkeypatch.setattr(db_manager, "run_read", stalling_read)
+    task = asyncio.create_task(exporter.export("analytics_events", directory=str(tmp_path)))
+    await started.wait()
+    assert [name for name in os.listdir(tmp_path) if name.endswith(".gz")]
+
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".gz")]
+
+@pytest.mark.asyncio
+async def test_close_failure_does_not_mask_the_original_error(db_manager, tmp_path, monkeypatch):
+    await add_events(db_manager, ["2024-05-01 10:00:00"] * 3)
+    exporter = DataExporter(db_manager, chunk_rows=2)
+
+    def failing_write(stream, fmt, columns, rows, header):
+        # Leave the stream unusable so closing it fails as well
+        stream.buffer.fileobj.close()
+        raise RuntimeError("encoder failed")
+
+    monkeypatch.setattr(exporter, "_write_chunk", failing_write)
+    with pytest.raises(RuntimeError, match="encoder failed"):
+        await exporter.export("analytics_events", directory=str(tmp_path))
+    assert not [name for name in os.listdir(tmp_path) if name.endswith(".gz")]
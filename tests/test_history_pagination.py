@@ -0,0 +1,72 @@
+"""
+Tests for keyset-paginated history readers, including ties across page and UNION ALL boundaries.
+"""
+
+import pytest
+
+STAMPS = ["2026-01-01 10:00:00", "2026-01-01 10:00:01", "2026-01-01 10:00:02"]
+
+async def seed(db_manager):
+    """Interleaved user and bot messages sharing timestamps, so pages split inside ties"""
+    def write(conn):
+        for i in range(12):
+            stamp = STAMPS[i % len(STAMPS)]
+            conn.execute("INSERT INTO user_messages (user_id, message_text, message_type, created_at) "
+                         "VALUES (1, ?, ?, ?)", (f"user{i}", "text" if i % 2 else "voice", stamp))
+            if i % 3:
+                conn.execute("INSERT INTO bot_messages (user_id, message_text, sent_at) VALUES (1, ?, ?)",
+                             (f"bot{i}", stamp))
+        # Another user's rows must never appear
+        conn.execute("INSERT INTO user_messages (user_id, message_text, created_at) VALUES (2, 'other', ?)",
+                     (STAMPS[0],))
+
+        user_rows = conn.execute("SELECT 'user', id, created_at FROM user_messages WHERE user_id = 1").fetchall()
+        bot_rows = conn.execute("SELECT 'bot', id, sent_at FROM bot_messages WHERE user_id = 1").fetchall()
+        return user_rows, bot_rows
+    return await db_manager.run_write(write)
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("page_size", [1, 2, 3, 5, 50])
+@pytest.mark.parametrize("newest_first", [True, False])
+async def test_conversation_history_pages_match_one_sorted_scan(db_manager, page_size, newest_first):
+    user_rows, bot_rows = await seed(db_manager)
+    expected = sorted(((stamp, sender, row_id) for sender, row_id, stamp in user_rows + bot_rows),
+                      reverse=newest_first)
+
+    history = [message async for message in
+               db_manager.iter_conversation_history(1, page_size=page_size, newest_first=newest_first)]
+    assert [(m["timestamp"], m["sender"], m["id"]) for m in history] == expected
+
+@pytest.mark.asyncio
+async def test_conversation_history_limit_stops_mid_page(db_manager):
+    user_rows, bot_rows = await seed(db_manager)
+    expected = sorted(((stamp, sender, row_id) for sender, row_id, stamp in user_rows + bot_rows),
+                      reverse=True)[:7]
+
+    history = [message async for message in db_manager.iter_conversation_history(1, page_size=3, limit=7)]
+    assert [(m["timestamp"], m["sender"], m["id"]) for m in history] == expected
+    assert len(await db_manager.get_conversation_history(1, limit=4)) == 4
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("newest_first", [True, False])
+async def test_user_messages_page_through_equal_timestamps(db_manager, newest_first):
+    user_rows, _ = await seed(db_manager)
+    expected = [row_id for _, row_id in sorted(((stamp, row_id) for _, row_id, stamp in user_rows),
+                                               reverse=newest_first)]
+
+    messages = [message async for message in
+                db_manager.iter_user_messages(1, page_size=2, newest_first=newest_first)]
+    assert [message["id"] for message in messages] == expected
+
+@pytest.mark.asyncio
+async def test_user_messages_filter_by_type(db_manager):
+    await seed(db_manager)
+    messages = [message async for message in
+                db_manager.iter_user_messages(1, page_size=2, message_types=["voice"])]
+    assert len(messages) == 6
+    assert {message["message_type"] for message in messages} == {"voice"}
+
+@pytest.mark.asyncio
+async def test_buffered_messages_are_visible_to_readers(db_manager):
+    await db_manager.store_user_message(3, "queued")
+    assert [m["message_text"] for m in await db_manager.get_user_messages(3)] == ["queued"]
@@ -0,0 +1,50 @@
+"""
+Tests for cached table statistics and chunked exact row counts.
+"""
+
+import pytest
+
+from modules.introspection import DatabaseIntrospector
+
+async def create_tables(db_manager):
+    def write(conn):
+        conn.execute("CREATE TABLE sqlitex_notes (id INTEGER PRIMARY KEY, body TEXT UNIQUE)")
+        conn.executemany("INSERT INTO sqlitex_notes (body) VALUES (?)", [(f"note {i}",) for i in range(25)])
+        conn.execute("CREATE TABLE scores (user_id INTEGER, score REAL)")
+        conn.executemany("INSERT INTO scores VALUES (?, ?)", [(i, i / 2) for i in range(7)])
+        conn.execute("ANALYZE")
+    await db_manager.run_write(write)
+
+@pytest.mark.asyncio
+async def test_internal_tables_are_hidden_but_lookalike_names_are_not(db_manager):
+    await create_tables(db_manager)
+    introspector = DatabaseIntrospector(db_manager)
+
+    tables = {table["name"]: table for table in await introspector.get_table_stats()}
+
+    assert "sqlitex_notes" in tables
+    assert "sqlite_stat1" not in tables
+    assert "sqlite_sequence" not in tables
+    # Automatic indexes belong to their table and are reported with it
+    assert [index["name"] for index in tables["sqlitex_notes"]["indexes"]] == ["sqlite_autoindex_sqlitex_notes_1"]
+    assert tables["scores"]["rows"] == 7
+    assert tables["scores"]["rows_source"] == "sqlite_stat1"
+
+@pytest.mark.asyncio
+async def test_exact_counts_are_built_in_chunks(db_manager):
+    await create_tables(db_manager)
+    introspector = DatabaseIntrospector(db_manager, count_chunk_rows=10, chunks_per_step=2)
+    table_names = [name for name, info in (await introspector.refresh_sizes(force=True)).items()
+                   if info["type"] == "table"]
+
+    steps = 0
+    while introspector.get_stats()["tables_with_exact_counts"] < len(table_names):
+        assert await introspector.refresh_counts_step() <= 2
+        steps += 1
+        assert steps < 100
+
+    assert introspector.row_count("sqlitex_notes") == 25
+    assert introspector.row_count("scores") == 7
+    assert introspector.stats["count_chunks"] > len(table_names)
+    tables = {table["name"]: table for table in await introspector.get_table_stats()}
+    assert tables["sqlitex_notes"]["rows_source"] == "exact"
@@ -0,0 +1,87 @@
+"""
+Tests for the log-linear latency histograms and the rolling tracker.
+"""
+
+import time
+
+import pytest
+
+from modules.latency import LatencyHistogram, LatencyTracker, bucket_bounds, bucket_index
+
+def test_buckets_cover_values_with_bounded_relative_error():
+    for value in [0, 1, 127, 128, 129, 1000, 65_535, 1_000_000, 123_456_789]:
+        low, high = bucket_bounds(bucket_index(value))
+        assert low <= value < high
+        # Exact below 128us, then at most 1/64 of the value wide
+        assert high - low == 1 or (high - low) / value <= 1 / 64
+
+def test_percentiles_match_exact_values_within_bucket_error():
+    histogram = LatencyHistogram()
+    # 1ms .. 1000ms, one value each
+    for ms in range(1, 1001):
+        histogram.record(ms / 1000)
+
+    for quantile, expected in ((50, 0.5), (90, 0.9), (99, 0.99)):
+        assert histogram.percentile(quantile) == pytest.approx(expected, rel=0.02)
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == 1000
+    assert snapshot["min"] == 0.001
+    assert snapshot["max"] == 1.0
+    assert snapshot["mean"] == pytest.approx(0.5005)
+
+def test_percentiles_never_exceed_observed_extremes():
+    histogram = LatencyHistogram()
+    histogram.record(0.300001)
+    assert histogram.percentile(99) == 0.300001
+    assert LatencyHistogram().percentile(50) == 0.0
+
+def test_merge_combines_counts_errors_and_extremes():
+    fast, slow = LatencyHistogram(), LatencyHistogram()
+    for _ in range(90):
+        fast.record(0.001)
+    for _ in range(10):
+        slow.record(2.0, error=True)
+
+    fast.merge(slow)
+    snapshot = fast.snapshot()
+    assert (snapshot["count"], snapshot["errors"]) == (100, 10)
+    assert snapshot["p50"] == pytest.approx(0.001, rel=0.02)
+    assert snapshot["p99"] == pytest.approx(2.0, rel=0.02)
+    assert snapshot["max"] == 2.0
+
+def test_tracker_window_drops_old_slots(monkeypatch):
+    now = [10_000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    tracker = LatencyTracker(window_seconds=120, slot_seconds=60)
+
+    tracker.record("db.read", 0.5)
+    now[0] += 240
+    tracker.record("db.read", 0.01)
+
+    assert tracker.snapshot(window=True)["db.read"]["count"] == 1
+    assert tracker.snapshot()["db.read"]["count"] == 2
+
+    tracker.reset(window=True)
+    assert tracker.snapshot(window=True) == {}
+    assert tracker.snapshot()["db.read"]["count"] == 2
+
+def test_time_context_manager_flags_errors():
+    tracker = LatencyTracker()
+    with tracker.time("handler"):
+        pass
+    with pytest.raises(ValueError):
+        with tracker.time("handler"):
+            raise ValueError("boom")
+
+    summary = tracker.snapshot(reset=True)["handler"]
+    assert (summary["count"], summary["errors"]) == (2, 1)
+    assert tracker.snapshot() == {}
+
+@pytest.mark.asyncio
+async def test_database_calls_are_recorded_per_kind(db_manager):
+    await db_manager.run_read(lambda conn: conn.execute("SELECT 1").fetchone())
+    await db_manager.run_write(lambda conn: conn.execute("CREATE TABLE t (x)"))
+
+    totals = db_manager.latency.snapshot()
+    assert totals["db.read"]["count"] >= 1
+    assert totals["db.write"]["count"] >= 1
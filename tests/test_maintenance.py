@@ -0,0 +1,83 @@
+"""
+Tests for the incremental vacuum and statistics maintenance scheduler.
+"""
+
+import sqlite3
+
+import pytest
+
+from modules.database import DatabaseManager
+from modules.maintenance import MaintenanceScheduler
+
+async def create_free_pages(db_manager, rows=400):
+    """Fill a scratch table with page-sized blobs and delete them again"""
+    def write(conn):
+        conn.execute("CREATE TABLE scratch (data BLOB)")
+        conn.executemany("INSERT INTO scratch VALUES (zeroblob(4000))", [()] * rows)
+    await db_manager.run_write(write)
+    await db_manager.run_write(lambda conn: conn.execute("DROP TABLE scratch"))
+
+async def free_pages(db_manager):
+    return await db_manager.run_read(lambda conn: conn.execute("PRAGMA freelist_count").fetchone()[0])
+
+@pytest.mark.asyncio
+async def test_new_database_reclaims_free_pages_in_slices(db_manager):
+    scheduler = MaintenanceScheduler(db_manager, pages_per_slice=50, max_slices_per_run=3,
+                                     min_free_pages=10, slice_pause=0.0)
+    await create_free_pages(db_manager)
+    before = await free_pages(db_manager)
+    assert before >= 400
+
+    result = await scheduler.run_once(force=True)
+
+    assert scheduler.mode == "incremental"
+    assert result["pages"] == 150
+    assert await free_pages(db_manager) <= before - 150
+    stats = scheduler.get_stats()
+    assert stats["slices"] == 3
+    assert stats["optimize_runs"] == 1
+    # Only bounded slices: the scheduler never rewrites the file with VACUUM
+    assert not [entry for entry in db_manager.profiler.top(limit=500) if entry["sql"] == "VACUUM"]
+
+@pytest.mark.asyncio
+async def test_busy_database_is_skipped(db_manager):
+    scheduler = MaintenanceScheduler(db_manager, quiet_ops=2)
+    for _ in range(5):
+        await db_manager.run_read(lambda conn: conn.execute("SELECT 1").fetchone())
+
+    assert await scheduler.run_once() == {"skipped": True}
+    assert scheduler.stats["busy_skips"] == 1
+    # Quiet again once no calls were made since the last check
+    assert not (await scheduler.run_once())["skipped"]
+
+@pytest.mark.asyncio
+async def test_below_min_free_pages_nothing_is_vacuumed(db_manager):
+    scheduler = MaintenanceScheduler(db_manager, min_free_pages=10_000)
+    await create_free_pages(db_manager, rows=50)
+    result = await scheduler.run_once(force=True)
+    assert result["pages"] == 0
+    assert scheduler.stats["slices"] == 0
+
+@pytest.mark.asyncio
+async def test_legacy_file_is_only_converted_on_request(tmp_path):
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE legacy (x)")
+    conn.close()
+
+    manager = DatabaseManager(path, reader_threads=1, write_flush_interval=60.0)
+    try:
+        scheduler = manager.maintenance
+        await create_free_pages(manager, rows=100)
+        result = await scheduler.run_once(force=True)
+        assert scheduler.mode == "none"
+        assert result["pages"] == 0
+
+        assert await scheduler.convert_to_incremental() == "incremental"
+        assert scheduler.stats["conversions"] == 1
+        assert await scheduler.get_auto_vacuum_mode() == "incremental"
+        # Already incremental: no second rewrite
+        assert await scheduler.convert_to_incremental() == "incremental"
+        assert scheduler.stats["conversions"] == 1
+    finally:
+        manager.close()
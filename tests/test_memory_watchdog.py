@@ -0,0 +1,94 @@
+"""
+Tests for the staged memory watchdog and the consumers registered with it.
+"""
+
+import pytest
+
+from modules.analytics import AnalyticsManager
+from modules.memory import MemoryWatchdog
+from modules.performance import PerformanceManager
+
+LIMIT = 1000 * 1024 * 1024
+
+def set_usage(watchdog, monkeypatch, usage):
+    monkeypatch.setattr(watchdog, "rss", lambda: int(usage * watchdog.limit_bytes))
+
+@pytest.fixture
+def performance(db_manager):
+    performance = PerformanceManager(db_manager)
+    performance.memory_watchdog.limit_bytes = LIMIT
+    return performance
+
+async def fill_analytics(db_manager, users=20, actions=10):
+    analytics = AnalyticsManager(db_manager)
+    for user_id in range(users):
+        for n in range(actions):
+            await analytics.track_user_action(user_id, f"action{n}")
+    return analytics
+
+@pytest.mark.asyncio
+async def test_crossing_trim_threshold_trims_analytics_rings(db_manager, performance, monkeypatch):
+    analytics = await fill_analytics(db_manager)
+    performance.register_analytics(analytics)
+    watchdog = performance.memory_watchdog
+    size_before = analytics.get_memory_usage()
+
+    set_usage(watchdog, monkeypatch, 0.75)
+    watchdog.check(now=0.0)
+    # Only the cache stage runs below 0.80
+    assert [action["consumer"] for action in watchdog.actions] == ["cache"]
+    assert len(analytics.get_recent_actions(0)) == 10
+
+    set_usage(watchdog, monkeypatch, 0.82)
+    sample = watchdog.check(now=1.0)
+
+    assert sample["stage"] == "trim_analytics"
+    assert [action["consumer"] for action in watchdog.actions] == ["cache", "analytics"]
+    assert watchdog.actions[-1]["result"]["actions_dropped"] == 20 * (10 - 5)
+    assert [entry["action"] for entry in analytics.get_recent_actions(0)] == \
+        [f"action{n}" for n in range(5, 10)]
+    assert analytics.get_memory_usage() < size_before
+
+@pytest.mark.asyncio
+async def test_stages_respect_the_cooldown(db_manager, performance, monkeypatch):
+    analytics = await fill_analytics(db_manager, users=2, actions=8)
+    performance.register_analytics(analytics)
+    watchdog = performance.memory_watchdog
+    set_usage(watchdog, monkeypatch, 0.85)
+
+    watchdog.check(now=0.0)
+    watchdog.check(now=watchdog.cooldown / 2)
+    assert len(watchdog.actions) == 2
+
+    watchdog.check(now=watchdog.cooldown + 1)
+    assert len(watchdog.actions) == 4
+
+def test_sample_reports_the_stage_without_shedding(monkeypatch):
+    shed_calls = []
+    watchdog = MemoryWatchdog(limit_bytes=LIMIT)
+    watchdog.register("analytics", "trim_analytics", size=lambda: 1234,
+                      shed=lambda: shed_calls.append(1) or {})
+    set_usage(watchdog, monkeypatch, 0.95)
+
+    sample = watchdog.sample()
+
+    assert sample["stage"] == "gc"
+    assert sample["consumers"] == {"analytics": 1234}
+    assert shed_calls == []
+    assert watchdog.stats["samples"] == 0 and not watchdog.actions
+
+def test_unknown_stage_is_rejected():
+    with pytest.raises(ValueError):
+        MemoryWatchdog(limit_bytes=LIMIT).register("x", "swap_to_disk")
+
+def test_admin_bot_registers_analytics_with_the_watchdog(tmp_path, monkeypatch):
+    from admin_bot_complete import CompleteAdminBot
+
+    monkeypatch.setenv("ADMIN_BOT_TOKEN", "123456:TEST")
+    monkeypatch.setenv("DATABASE_PATH", str(tmp_path / "admin.db"))
+    bot = CompleteAdminBot()
+    try:
+        sizes = bot.performance.memory_watchdog.consumer_sizes()
+    finally:
+        bot.db_manager.close()
+    assert "analytics" in sizes
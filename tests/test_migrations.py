@@ -0,0 +1,143 @@
+"""
+Tests for SchemaMigrator: ordering, idempotence and all-or-nothing upgrades.
+"""
+
+import sqlite3
+
+import pytest
+
+from modules.migrations import SchemaMigrator, SCHEMA_MIGRATIONS
+from modules.database import DatabaseManager
+
+@pytest.fixture
+def conn(tmp_path):
+    connection = sqlite3.connect(str(tmp_path / "migrations.db"))
+    yield connection
+    connection.close()
+
+def schema(conn):
+    return conn.execute("SELECT type, name, sql FROM sqlite_master ORDER BY type, name").fetchall()
+
+def recording_migration(applied, version):
+    def migration(conn):
+        applied.append(version)
+        conn.execute(f"CREATE TABLE t{version} (id INTEGER)")
+    return migration
+
+def test_known_migrations_are_numbered_consecutively():
+    versions = [migration[0] for migration in SCHEMA_MIGRATIONS]
+    assert versions == list(range(1, len(versions) + 1))
+
+def test_migrations_apply_in_version_order(conn):
+    applied = []
+    migrator = SchemaMigrator([
+        (3, "third", recording_migration(applied, 3)),
+        (1, "first", recording_migration(applied, 1)),
+        (2, "second", recording_migration(applied, 2)),
+    ])
+
+    assert migrator.migrate(conn) == [1, 2, 3]
+    assert applied == [1, 2, 3]
+    assert migrator.get_version(conn) == 3
+
+def test_migrate_is_idempotent(conn):
+    applied = []
+    migrator = SchemaMigrator([(1, "first", recording_migration(applied, 1))])
+    migrator.migrate(conn)
+
+    assert migrator.migrate(conn) == []
+    assert migrator.pending(conn) == []
+    assert applied == [1]
+
+def test_only_newer_migrations_run_on_upgrade(conn):
+    applied = []
+    SchemaMigrator([(1, "first", recording_migration(applied, 1))]).migrate(conn)
+
+    upgraded = SchemaMigrator([
+        (1, "first", recording_migration(applied, 1)),
+        (2, "second", recording_migration(applied, 2)),
+    ])
+    assert [migration[0] for migration in upgraded.pending(conn)] == [2]
+    assert upgraded.migrate(conn) == [2]
+    assert applied == [1, 2]
+
+def test_current_schema_needs_no_write_lock(tmp_path):
+    path = str(tmp_path / "locked.db")
+    conn = sqlite3.connect(path)
+    migrator = SchemaMigrator([(1, "first", recording_migration([], 1))])
+    migrator.migrate(conn)
+
+    # Another connection holds the write lock; a no-op startup must not wait for it
+    writer = sqlite3.connect(path, isolation_level=None)
+    writer.execute("BEGIN IMMEDIATE")
+    try:
+        reader = sqlite3.connect(path, timeout=0)
+        try:
+            assert migrator.migrate(reader) == []
+        finally:
+            reader.close()
+    finally:
+        writer.execute("ROLLBACK")
+        writer.close()
+        conn.close()
+
+def test_failed_migration_rolls_back_the_whole_upgrade(conn):
+    def broken(conn):
+        raise sqlite3.OperationalError("broken migration")
+
+    migrator = SchemaMigrator([(1, "first", recording_migration([], 1)), (2, "broken", broken)])
+    with pytest.raises(sqlite3.OperationalError):
+        migrator.migrate(conn)
+
+    assert migrator.get_version(conn) == 0
+    assert schema(conn) == []
+
+def test_duplicate_or_non_positive_versions_are_rejected():
+    noop = lambda conn: None
+    with pytest.raises(ValueError):
+        SchemaMigrator([(1, "a", noop), (1, "b", noop)])
+    with pytest.raises(ValueError):
+        SchemaMigrator([(0, "zero", noop)])
+
+def test_full_schema_migrates_once_and_reopens_unchanged(tmp_path):
+    path = str(tmp_path / "bot.db")
+    manager = DatabaseManager(path)
+    manager.close()
+
+    conn = sqlite3.connect(path)
+    try:
+        assert SchemaMigrator.get_version(conn) == SchemaMigrator().latest_version
+        before = schema(conn)
+    finally:
+        conn.close()
+
+    manager = DatabaseManager(path)
+    manager.close()
+
+    conn = sqlite3.connect(path)
+    try:
+        assert schema(conn) == before
+    finally:
+        conn.close()
+
+def test_full_schema_applies_on_top_of_an_unversioned_database(tmp_path):
+    # Databases created before versioning already have the base tables at user_version 0
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    try:
+        SchemaMigrator(SCHEMA_MIGRATIONS[:1]).migrate(conn)
+        conn.execute("PRAGMA user_version = 0")
+        conn.execute("INSERT INTO users (user_id, username) VALUES (1, 'legacy')")
+        conn.commit()
+    finally:
+        conn.close()
+
+    manager = DatabaseManager(path)
+    manager.close()
+
+    conn = sqlite3.connect(path)
+    try:
+        assert SchemaMigrator.get_version(conn) == SchemaMigrator().latest_version
+        assert conn.execute("SELECT username FROM users WHERE user_id = 1").fetchone() == ("legacy",)
+    finally:
+        conn.close()
@@ -0,0 +1,153 @@
+"""
+Tests for RollupManager: incremental refresh, watermark atomicity and backfill.
+"""
+
+import sqlite3
+
+import pytest
+
+async def insert_rows(db_manager, user_messages=0, bot_messages=0, users=0, subscriptions=0,
+                      day="-1 day"):
+    """Insert rows stamped at a fixed past time so the users watermark (whole seconds) covers them"""
+    def write(conn):
+        stamp = conn.execute("SELECT datetime('now', ?)", (day,)).fetchone()[0]
+        first_user = conn.execute("SELECT COALESCE(MAX(user_id), 0) + 1 FROM users").fetchone()[0]
+        conn.executemany("INSERT INTO users (user_id, username, created_at) VALUES (?, ?, ?)",
+                         [(first_user + i, f"user{i}", stamp) for i in range(users)])
+        conn.executemany("INSERT INTO user_messages (user_id, message_text, message_type, created_at) "
+                         "VALUES (?, 'hi', 'text', ?)", [(1, stamp)] * user_messages)
+        conn.executemany("INSERT INTO bot_messages (user_id, message_text, message_type, sent_at) "
+                         "VALUES (?, 'hello', 'text', ?)", [(1, stamp)] * bot_messages)
+        conn.executemany("INSERT INTO subscriptions (user_id, subscription_type, created_at) "
+                         "VALUES (?, 'extreme', ?)", [(1, stamp)] * subscriptions)
+        return stamp[:10]
+    return await db_manager.run_write(write)
+
+async def daily_totals(db_manager):
+    """{day: (user_messages, bot_messages, new_users, new_subscriptions)}"""
+    def query(conn):
+        return {day: totals for day, *totals in conn.execute('''
+            SELECT day, SUM(user_messages), SUM(bot_messages), SUM(new_users), SUM(new_subscriptions)
+            FROM daily_stats GROUP BY day
+        ''')}
+    return {day: tuple(totals) for day, totals in (await db_manager.run_read(query)).items()}
+
+@pytest.mark.asyncio
+async def test_refresh_counts_each_row_once(db_manager):
+    rollups = db_manager.rollups
+    day = await insert_rows(db_manager, user_messages=3, bot_messages=2, users=4, subscriptions=1)
+
+    assert await rollups.refresh() == 10
+    assert rollups.caught_up
+    assert rollups.lag_note() is None
+    assert await daily_totals(db_manager) == {day: (3, 2, 4, 1)}
+
+    # Nothing new: the watermarks keep a second refresh from counting anything again
+    assert await rollups.refresh() == 0
+    assert await daily_totals(db_manager) == {day: (3, 2, 4, 1)}
+
+    await insert_rows(db_manager, user_messages=2)
+    assert await rollups.refresh() == 2
+    assert await daily_totals(db_manager) == {day: (5, 2, 4, 1)}
+
+@pytest.mark.asyncio
+async def test_refresh_records_daily_active_users(db_manager):
+    day = await insert_rows(db_manager, user_messages=3)
+    await db_manager.rollups.refresh()
+    active = await db_manager.run_read(
+        lambda conn: conn.execute("SELECT day, user_id FROM daily_active_users").fetchall())
+    assert active == [(day, 1)]
+
+@pytest.mark.asyncio
+async def test_watermark_only_moves_with_the_counts(db_manager):
+    rollups = db_manager.rollups
+    day = await insert_rows(db_manager, user_messages=3)
+
+    # Make the watermark write fail after the counts were upserted in the same transaction
+    def block_watermarks(conn):
+        conn.execute('''
+            CREATE TRIGGER block_watermarks BEFORE INSERT ON rollup_watermarks
+            BEGIN SELECT RAISE(ABORT, 'watermark write failed'); END
+        ''')
+    await db_manager.run_write(block_watermarks)
+    with pytest.raises(sqlite3.IntegrityError):
+        await rollups.refresh()
+    assert await daily_totals(db_manager) == {}
+
+    await db_manager.run_write(lambda conn: conn.execute("DROP TRIGGER block_watermarks"))
+    await rollups.refresh()
+    assert await daily_totals(db_manager) == {day: (3, 0, 0, 0)}
+    watermark = await db_manager.run_read(lambda conn: conn.execute(
+        "SELECT high_water FROM rollup_watermarks WHERE source = 'user_messages'").fetchone()[0])
+    assert watermark == 3
+
+@pytest.mark.asyncio
+async def test_time_budget_leaves_refresh_behind_with_a_note(db_manager):
+    rollups = db_manager.rollups
+    rollups.batch_rows = 10
+    day = await insert_rows(db_manager, user_messages=25)
+
+    # A zero budget runs a single step per source
+    assert await rollups.refresh(time_budget=0) == 10
+    assert not rollups.caught_up
+    assert rollups.pending == ["user_messages"]
+    assert "user_messages=10" in rollups.lag_note()
+
+    await rollups.refresh()
+    assert rollups.caught_up
+    assert await daily_totals(db_manager) == {day: (25, 0, 0, 0)}
+
+@pytest.mark.asyncio
+async def test_backfill_rebuilds_one_source(db_manager):
+    rollups = db_manager.rollups
+    day = await insert_rows(db_manager, user_messages=3, bot_messages=2)
+    await rollups.refresh()
+
+    def corrupt(conn):
+        conn.execute("UPDATE daily_stats SET user_messages = user_messages + 100, "
+                     "bot_messages = bot_messages + 100")
+    await db_manager.run_write(corrupt)
+
+    assert await rollups.backfill("user_messages") == 3
+    # Only the rebuilt source is corrected
+    assert await daily_totals(db_manager) == {day: (3, 102, 0, 0)}
+
+    await rollups.backfill()
+    assert await daily_totals(db_manager) == {day: (3, 2, 0, 0)}
+
+@pytest.mark.asyncio
+async def test_backfill_rejects_unknown_source(db_manager):
+    with pytest.raises(ValueError):
+        await db_manager.rollups.backfill("no_such_table")
+
+@pytest.mark.asyncio
+async def test_returning_user_is_not_counted_as_new_again(db_manager):
+    await db_manager.initialize_user(1, "alice", first_name="Alice")
+    await db_manager.update_user_profile(1, city="Berlin")
+    await db_manager.run_write(lambda conn: conn.execute(
+        "UPDATE users SET created_at = datetime('now', '-1 day') WHERE user_id = 1"))
+    await db_manager.rollups.refresh()
+    totals = await daily_totals(db_manager)
+
+    await db_manager.initialize_user(1, "alice2", first_name="Alice")
+
+    profile = await db_manager.get_user_profile(1)
+    # The upsert refreshes the names but keeps created_at and the rest of the row
+    assert profile["username"] == "alice2"
+    assert profile["city"] == "Berlin"
+    created_at = await db_manager.run_read(lambda conn: conn.execute(
+        "SELECT created_at < datetime('now', '-1 hour') FROM users WHERE user_id = 1").fetchone()[0])
+    assert created_at == 1
+    assert await db_manager.rollups.refresh() == 0
+    assert await daily_totals(db_manager) == totals
+
+@pytest.mark.asyncio
+async def test_reports_read_rollups_without_refreshing(db_manager):
+    from modules.analytics import AnalyticsManager
+
+    await insert_rows(db_manager, user_messages=3)
+    analytics = await AnalyticsManager(db_manager).get_system_analytics()
+
+    assert db_manager.rollups.stats["refreshes"] == 0
+    assert analytics["rollups_note"] == db_manager.rollups.lag_note()
+    assert analytics["rollups_note"] is not None
@@ -0,0 +1,87 @@
+"""
+Tests for SQL fingerprinting and the profiled connection/cursor.
+"""
+
+import pytest
+
+from modules.sql_profiler import SQLProfiler, fingerprint
+
+@pytest.fixture
+def profiler():
+    return SQLProfiler(progress_steps=10)
+
+@pytest.fixture
+def conn(profiler):
+    conn = profiler.connect(":memory:")
+    conn.execute("CREATE TABLE t (x INTEGER)")
+    conn.executemany("INSERT INTO t VALUES (?)", [(i,) for i in range(500)])
+    conn.commit()
+    profiler.reset()
+    yield conn
+    conn.close()
+
+def stats_for(profiler, sql):
+    return next(entry for entry in profiler.top(limit=100) if entry["sql"] == sql)
+
+def test_fingerprint_collapses_literals_and_lists():
+    assert fingerprint("SELECT * FROM users WHERE id = 42 AND name = 'bob' -- note") == \
+        "SELECT * FROM users WHERE id = ? AND name = ?"
+    assert fingerprint("SELECT x FROM t WHERE id IN (?, ?, ?)") == \
+        fingerprint("SELECT x FROM t WHERE id IN (?,?)") == "SELECT x FROM t WHERE id IN (?...)"
+    assert fingerprint("INSERT INTO t VALUES (?, ?), (?, ?), (?, ?)") == "INSERT INTO t VALUES (?, ?), ..."
+
+def test_iteration_is_reported_once_when_exhausted(profiler, conn, monkeypatch):
+    calls = []
+    record = profiler.record
+    monkeypatch.setattr(profiler, "record", lambda *args, **kwargs: (calls.append(args), record(*args, **kwargs)))
+
+    cursor = conn.execute("SELECT x FROM t")
+    rows = sum(1 for _ in cursor)
+
+    # One record for the execute and one for all fetched rows, not one per row
+    assert rows == 500
+    assert len(calls) == 2
+    entry = stats_for(profiler, "SELECT x FROM t")
+    assert (entry["calls"], entry["rows"]) == (1, 500)
+    assert entry["vm_steps"] > 0
+
+def test_partial_fetches_are_reported_on_close_or_reuse(profiler, conn):
+    cursor = conn.execute("SELECT x FROM t WHERE x < 10")
+    cursor.fetchone()
+    cursor.fetchone()
+    assert stats_for(profiler, "SELECT x FROM t WHERE x < ?")["rows"] == 0
+
+    cursor.execute("SELECT x FROM t WHERE x < 5")
+    assert stats_for(profiler, "SELECT x FROM t WHERE x < ?")["rows"] == 2
+    assert next(cursor) == (0,)
+    cursor.close()
+    entry = stats_for(profiler, "SELECT x FROM t WHERE x < ?")
+    assert (entry["calls"], entry["rows"]) == (2, 3)
+
+def test_single_row_lookup_is_reported_when_cursor_is_dropped(profiler, conn):
+    assert conn.execute("SELECT count(*) FROM t").fetchone() == (500,)
+    assert stats_for(profiler, "SELECT count(*) FROM t")["rows"] == 1
+
+def test_dml_rows_errors_and_commits(profiler, conn):
+    conn.execute("UPDATE t SET x = x + 1 WHERE x < 100")
+    with pytest.raises(Exception):
+        conn.execute("SELECT missing FROM t")
+    conn.commit()
+
+    assert stats_for(profiler, "UPDATE t SET x = x + ? WHERE x < ?")["rows"] == 100
+    assert stats_for(profiler, "SELECT missing FROM t")["errors"] == 1
+    assert stats_for(profiler, "COMMIT")["calls"] == 1
+    assert profiler.get_stats()["errors"] == 1
+
+def test_slow_statements_count_fetch_time(conn):
+    conn.profiler.slow_threshold = 1e-9
+    list(conn.execute("SELECT x FROM t"))
+    entry = stats_for(conn.profiler, "SELECT x FROM t")
+    # Crossing the threshold is counted once per statement, not per fetch
+    assert entry["slow"] == 1
+    assert entry["max_time"] == pytest.approx(entry["total_time"])
+
+def test_disabled_profiler_records_nothing(profiler, conn):
+    profiler.enabled = False
+    assert len(conn.execute("SELECT x FROM t").fetchall()) == 500
+    assert profiler.top() == []
@@ -0,0 +1,60 @@
+"""
+Tests for atomic user state data patches built on SQLite JSON functions.
+"""
+
+import asyncio
+
+import pytest
+
+@pytest.mark.asyncio
+async def test_shallow_patch_replaces_top_level_keys_only(db_manager):
+    await db_manager.initialize_user(1, "alice")
+    await db_manager.set_user_state(1, "onboarding", {"step": 1, "goal": {"text": "run", "days": 7}})
+
+    document = await db_manager.patch_user_state_data(1, {"step": 2, "goal": {"text": "swim"}})
+    assert document == {"step": 2, "goal": {"text": "swim"}}
+    assert await db_manager.get_user_state_data(1) == document
+
+@pytest.mark.asyncio
+async def test_deep_patch_merges_nested_objects_and_null_deletes(db_manager):
+    await db_manager.set_user_state(1, "onboarding", {"goal": {"text": "run", "days": 7}, "tmp": True})
+
+    document = await db_manager.patch_user_state_data(1, {"goal": {"days": 14}, "tmp": None}, deep=True)
+    assert document == {"goal": {"text": "run", "days": 14}}
+
+@pytest.mark.asyncio
+async def test_patch_creates_missing_state_row(db_manager):
+    assert await db_manager.patch_user_state_data(42, {"city": "Berlin"}) == {"city": "Berlin"}
+    assert await db_manager.get_user_state_data(42) == {"city": "Berlin"}
+
+@pytest.mark.asyncio
+async def test_patch_over_invalid_json_starts_from_an_empty_document(db_manager):
+    await db_manager.run_write(lambda conn: conn.execute(
+        "INSERT INTO user_states (user_id, current_state, state_data) VALUES (1, 'x', 'not json')"))
+    assert await db_manager.patch_user_state_data(1, {"a": 1}) == {"a": 1}
+
+@pytest.mark.asyncio
+async def test_concurrent_patches_do_not_lose_updates(db_manager):
+    await db_manager.set_user_state(1, "active", {})
+    await asyncio.gather(*(db_manager.update_user_state_data(1, {f"key{i}": i}) for i in range(50)))
+    assert await db_manager.get_user_state_data(1) == {f"key{i}": i for i in range(50)}
+
+@pytest.mark.asyncio
+async def test_patch_many_applies_each_users_patch(db_manager):
+    await db_manager.set_user_state(1, "active", {"keep": 1})
+    updated = await db_manager.patch_user_state_data_many({1: {"a": 1}, 2: {"a": 2, "b": [1, 2]}, 3: {}})
+    assert updated == 2
+    assert await db_manager.get_user_state_data_many([1, 2, 3]) == {
+        1: {"keep": 1, "a": 1}, 2: {"a": 2, "b": [1, 2]}, 3: {}}
+
+@pytest.mark.asyncio
+async def test_patch_publishes_a_change_event(db_manager):
+    events = []
+    db_manager.add_change_listener(lambda table, key: events.append((table, key)))
+    await db_manager.patch_user_state_data(7, {"a": 1}, return_document=False)
+    assert ("user_states", 7) in events
+
+@pytest.mark.asyncio
+async def test_keys_with_quotes_are_rejected(db_manager):
+    with pytest.raises(ValueError):
+        await db_manager.patch_user_state_data(1, {'bad"key': 1})
@@ -0,0 +1,75 @@
+"""
+Tests for the trigger-maintained user_counters table and its consistency check.
+"""
+
+import pytest
+
+from modules.database import DatabaseManager
+
+GLOBAL = DatabaseManager.GLOBAL_COUNTERS_ID
+
+async def counters(db_manager):
+    """{user_id: {column: value}} for every user_counters row"""
+    columns = list(DatabaseManager.USER_COUNTER_SOURCES)
+    def query(conn):
+        return conn.execute(f"SELECT user_id, {', '.join(columns)} FROM user_counters").fetchall()
+    return {row[0]: dict(zip(columns, row[1:])) for row in await db_manager.run_read(query)}
+
+async def insert(db_manager, table, user_id, count=1):
+    await db_manager.run_write(lambda conn: conn.executemany(
+        f"INSERT INTO {table} (user_id) VALUES (?)", [(user_id,)] * count))
+
+@pytest.mark.asyncio
+async def test_inserts_count_per_user_and_globally(db_manager):
+    for column, table in DatabaseManager.USER_COUNTER_SOURCES.items():
+        await insert(db_manager, table, 1, 2)
+        await insert(db_manager, table, 2, 1)
+
+    stored = await counters(db_manager)
+    assert set(stored[1].values()) == {2}
+    assert set(stored[2].values()) == {1}
+    assert set(stored[GLOBAL].values()) == {3}
+    assert set((await db_manager.get_global_counters()).values()) == {3}
+
+@pytest.mark.asyncio
+async def test_deletes_and_reassignments_move_the_counts(db_manager):
+    await insert(db_manager, "user_messages", 1, 3)
+    await db_manager.run_write(lambda conn: conn.execute(
+        "DELETE FROM user_messages WHERE id = (SELECT MIN(id) FROM user_messages)"))
+    await db_manager.run_write(lambda conn: conn.execute(
+        "UPDATE user_messages SET user_id = 2 WHERE id = (SELECT MAX(id) FROM user_messages)"))
+
+    stored = await counters(db_manager)
+    assert stored[1]["user_messages_count"] == 1
+    assert stored[2]["user_messages_count"] == 1
+    assert stored[GLOBAL]["user_messages_count"] == 2
+    assert await db_manager.check_user_counters() == []
+
+@pytest.mark.asyncio
+async def test_rows_without_a_user_only_count_globally(db_manager):
+    await insert(db_manager, "user_messages", None, 2)
+    await insert(db_manager, "user_messages", 5)
+    await db_manager.run_write(lambda conn: conn.execute("DELETE FROM user_messages WHERE user_id IS NULL"))
+
+    stored = await counters(db_manager)
+    assert set(stored) == {GLOBAL, 5}
+    assert stored[GLOBAL]["user_messages_count"] == 1
+    assert await db_manager.check_user_counters() == []
+
+@pytest.mark.asyncio
+async def test_check_reports_drift_and_rebuild_repairs_it(db_manager):
+    await insert(db_manager, "bot_messages", 1, 2)
+    await db_manager.run_write(lambda conn: conn.execute(
+        "UPDATE user_counters SET bot_messages_count = 7 WHERE user_id = 1"))
+    await db_manager.run_write(lambda conn: conn.execute(
+        "INSERT INTO user_counters (user_id, feedback_count) VALUES (99, 4)"))
+
+    mismatches = {mismatch["user_id"]: mismatch for mismatch in await db_manager.check_user_counters()}
+    assert set(mismatches) == {1, 99}
+    assert mismatches[1]["actual"]["bot_messages_count"] == 2
+    assert mismatches[1]["stored"]["bot_messages_count"] == 7
+    assert mismatches[99]["stored"]["feedback_count"] == 4
+
+    await db_manager.rebuild_user_counters()
+    assert await db_manager.check_user_counters() == []
+    assert (await counters(db_manager))[1]["bot_messages_count"] == 2
@@ -0,0 +1,60 @@
+"""
+Tests for the single-query per-user statistics.
+"""
+
+import pytest
+
+async def add_subscription(db_manager, user_id, subscription_type, status, end_offset, created_offset="-1 day"):
+    def write(conn):
+        conn.execute('''
+            INSERT INTO subscriptions (user_id, subscription_type, user_goal, status, end_date, created_at)
+            VALUES (?, ?, 'goal', ?, datetime('now', ?), datetime('now', ?))
+        ''', (user_id, subscription_type, status, end_offset, created_offset))
+    await db_manager.run_write(write)
+
+@pytest.mark.asyncio
+async def test_statistics_combine_counters_subscription_and_profile(db_manager):
+    await db_manager.initialize_user(1, "alice", "Alice")
+    for _ in range(3):
+        await db_manager.store_user_message(1, "hi")
+    await db_manager.store_bot_message(1, "hello")
+    await add_subscription(db_manager, 1, "2week", "active", "+7 days")
+
+    # Buffered messages are flushed before counting
+    stats = await db_manager.get_user_statistics(1)
+    assert stats["statistics"]["user_messages_count"] == 3
+    assert stats["statistics"]["bot_messages_count"] == 1
+    assert stats["statistics"]["sessions_count"] == 0
+    assert stats["profile"]["username"] == "alice"
+    assert stats["active_subscription"]["subscription_type"] == "2week"
+
+@pytest.mark.asyncio
+async def test_active_subscription_is_the_newest_unexpired_one(db_manager):
+    await db_manager.initialize_user(1, "alice")
+    await add_subscription(db_manager, 1, "expired", "active", "-1 day", "-3 days")
+    await add_subscription(db_manager, 1, "older", "active", "+7 days", "-2 days")
+    await add_subscription(db_manager, 1, "newer", "active", "+7 days", "-1 day")
+    await add_subscription(db_manager, 1, "pending", "pending_payment", "+7 days", "-1 hour")
+
+    stats = await db_manager.get_user_statistics(1)
+    assert stats["active_subscription"]["subscription_type"] == "newer"
+
+@pytest.mark.asyncio
+async def test_unknown_user_gets_zero_counts_and_no_profile(db_manager):
+    stats = await db_manager.get_user_statistics(999)
+    assert stats["profile"] is None
+    assert stats["active_subscription"] is None
+    assert set(stats["statistics"].values()) == {0}
+
+@pytest.mark.asyncio
+async def test_many_users_in_one_call(db_manager):
+    await db_manager.initialize_user(1, "alice")
+    await db_manager.initialize_user(2, "bob")
+    await db_manager.store_user_message(2, "hi")
+
+    stats = await db_manager.get_users_statistics([1, 2, 2, 3])
+    assert set(stats) == {1, 2, 3}
+    assert stats[1]["statistics"]["user_messages_count"] == 0
+    assert stats[2]["statistics"]["user_messages_count"] == 1
+    assert stats[3]["profile"] is None
+    assert await db_manager.get_users_statistics([]) == {}
@@ -0,0 +1,184 @@
+"""
+Tests for WriteBehindQueue: group commits, merged updates, row-by-row retry and requeueing.
+"""
+
+import sqlite3
+import time
+
+import pytest
+
+from modules.connection_pool import ConnectionPool
+from modules.db_executor import DatabaseExecutor, DatabaseTimeoutError
+from modules.write_behind import WriteBehindQueue
+
+INSERT_SQL = "INSERT INTO wb_items (name, value) VALUES (?, ?)"
+UPDATE_SQL = "UPDATE wb_items SET value = ? WHERE name = ?"
+
+def register_pause(conn):
+    """pause(seconds) lets a trigger make a write slow enough to time out"""
+    conn.create_function("pause", 1, lambda seconds: time.sleep(seconds))
+
+@pytest.fixture
+def executor(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "write_behind.db"), max_connections=3, on_connect=register_pause)
+    database_executor = DatabaseExecutor(pool, reader_threads=2, default_timeout=0.2)
+    with pool.connection() as conn:
+        conn.execute("CREATE TABLE wb_items (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+    yield database_executor
+    database_executor.shutdown()
+    pool.close()
+
+@pytest.fixture
+def queue(executor):
+    """Queue whose long interval leaves flushing to the test"""
+    write_queue = WriteBehindQueue(executor, flush_interval=60.0, max_batch_size=1000)
+    yield write_queue
+    write_queue.close()
+
+async def read_items(executor):
+    return dict(await executor.run_read(
+        lambda conn: conn.execute("SELECT name, value FROM wb_items ORDER BY name").fetchall()))
+
+async def add_slow_trigger(executor, seconds, steps=50):
+    """Inserting a row named 'slow' takes ``seconds``, in steps an interrupt can stop between"""
+    def write(conn):
+        conn.execute("CREATE TABLE pause_steps (step INTEGER)")
+        conn.executemany("INSERT INTO pause_steps VALUES (?)", [(step,) for step in range(steps)])
+        conn.execute(f'''
+            CREATE TRIGGER slow_item AFTER INSERT ON wb_items WHEN NEW.name = 'slow'
+            BEGIN SELECT pause({seconds / steps}) FROM pause_steps; END
+        ''')
+    await executor.run_write(write)
+
+class FailingCommit:
+    """Connection proxy whose commit fails like SQLITE_BUSY or a disk error would"""
+
+    def __init__(self, conn, before_failing=None):
+        self._conn = conn
+        self._before_failing = before_failing
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def commit(self):
+        if self._before_failing:
+            self._before_failing()
+        raise sqlite3.OperationalError("disk I/O error")
+
+@pytest.mark.asyncio
+async def test_flush_writes_buffered_rows_in_one_batch(executor, queue):
+    for i in range(5):
+        queue.append(INSERT_SQL, (f"item{i}", i))
+    assert queue.pending == 5
+    assert await read_items(executor) == {}
+
+    assert await queue.flush() == 5
+    assert queue.pending == 0
+    assert await read_items(executor) == {f"item{i}": i for i in range(5)}
+    stats = queue.get_stats()
+    assert stats["flushes"] == 1
+    assert stats["rows_written"] == 5
+    assert stats["largest_batch"] == 5
+
+@pytest.mark.asyncio
+async def test_merge_keeps_latest_update_per_key_after_inserts(executor, queue):
+    queue.append(INSERT_SQL, ("a", 0))
+    queue.merge(UPDATE_SQL, "a", (1, "a"))
+    queue.merge(UPDATE_SQL, "a", (2, "a"))
+
+    # Two rows reach the database: the insert and the last update for "a"
+    assert queue.pending == 2
+    assert await queue.flush() == 2
+    assert await read_items(executor) == {"a": 2}
+    assert queue.get_stats()["merged"] == 1
+
+@pytest.mark.asyncio
+async def test_rows_with_constraint_errors_are_dropped_one_by_one(executor, queue):
+    queue.append(INSERT_SQL, ("good1", 1))
+    queue.append(INSERT_SQL, ("bad", None))  # violates NOT NULL
+    queue.append(INSERT_SQL, ("good2", 2))
+    queue.append(INSERT_SQL, ("good1", 3))  # duplicate key
+
+    assert await queue.flush() == 4
+    assert await read_items(executor) == {"good1": 1, "good2": 2}
+    stats = queue.get_stats()
+    assert stats["rows_failed"] == 2
+    assert stats["rows_written"] == 2
+
+    # The queue keeps working after a failed batch
+    queue.append(INSERT_SQL, ("after", 4))
+    await queue.flush()
+    assert (await read_items(executor))["after"] == 4
+
+@pytest.mark.asyncio
+async def test_failed_commit_puts_the_batch_back(executor, queue):
+    queue.append(INSERT_SQL, ("a", 1))
+    queue.append(INSERT_SQL, ("b", 2))
+
+    with pytest.raises(sqlite3.OperationalError):
+        await executor.run_write(lambda conn: queue._write_batch(FailingCommit(conn)))
+    assert queue.pending == 2
+    assert await read_items(executor) == {}
+    assert queue.get_stats()["batches_requeued"] == 1
+    assert queue.get_stats()["rows_failed"] == 0
+
+    assert await queue.flush() == 2
+    assert await read_items(executor) == {"a": 1, "b": 2}
+
+@pytest.mark.asyncio
+async def test_requeued_batch_yields_to_newer_updates(executor, queue):
+    queue.append(INSERT_SQL, ("a", 0))
+    queue.merge(UPDATE_SQL, "a", (1, "a"))
+
+    def newer_update():
+        queue.merge(UPDATE_SQL, "a", (5, "a"))
+        queue.append(INSERT_SQL, ("b", 2))
+
+    with pytest.raises(sqlite3.OperationalError):
+        await executor.run_write(lambda conn: queue._write_batch(FailingCommit(conn, newer_update)))
+    # Insert of "a", one update for "a" and the insert of "b"
+    assert queue.pending == 3
+
+    assert await queue.flush() == 3
+    assert await read_items(executor) == {"a": 5, "b": 2}
+
+@pytest.mark.asyncio
+async def test_interrupted_batch_is_requeued_not_dropped(executor, queue):
+    await add_slow_trigger(executor, 0.5)
+    queue.append(INSERT_SQL, ("a", 1))
+    queue.append(INSERT_SQL, ("slow", 2))
+
+    with pytest.raises(DatabaseTimeoutError):
+        await executor.run_write(queue._write_batch, timeout=0.1)
+    # Wait for the interrupted job to finish on the writer thread
+    await executor.run_write(lambda conn: None, timeout=5.0)
+
+    assert queue.pending == 2
+    stats = queue.get_stats()
+    assert stats["rows_failed"] == 0
+    assert stats["batches_requeued"] == 1
+    assert await read_items(executor) == {}
+
+    await executor.run_write(lambda conn: conn.execute("DROP TRIGGER slow_item"))
+    assert await queue.flush() == 2
+    assert await read_items(executor) == {"a": 1, "slow": 2}
+
+@pytest.mark.asyncio
+async def test_flush_is_not_bound_by_the_default_timeout(executor, queue):
+    # The executor's default timeout is 0.2s
+    await add_slow_trigger(executor, 0.4)
+    queue.append(INSERT_SQL, ("slow", 1))
+
+    assert await queue.flush() == 1
+    assert await read_items(executor) == {"slow": 1}
+
+@pytest.mark.asyncio
+async def test_flush_with_nothing_buffered_is_a_no_op(queue):
+    assert await queue.flush() == 0
+    assert queue.get_stats()["flushes"] == 0
+
+@pytest.mark.asyncio
+async def test_close_writes_remaining_rows(executor, queue):
+    queue.append(INSERT_SQL, ("late", 7))
+    queue.close()
+    assert await read_items(executor) == {"late": 7}